@@ -0,0 +1,263 @@
+"""Offline benchmark for starrocks-doctor.py against the local fake FE
+
+Starts fake_fe.py with synthetic metadata at the requested scale, runs each
+doctor module in its own process and reports per module:
+    runtime      wall time of the doctor process (best and median of --repeat runs)
+    round_trips  statements the fake FE answered (plus connections and rows sent)
+    peak_rss     maximum resident set size of the doctor process
+
+Results can be saved with --save and compared against an earlier run with
+--baseline; a module that got slower or issued more round trips than the
+allowed tolerance makes the benchmark exit with status 1.
+
+Usage:
+    python bench/benchmark.py --scale medium
+    python bench/benchmark.py --tables 100000 --partitions 5 --buckets 10 --modules tablet,schema
+    python bench/benchmark.py --scale small --save base.json
+    python bench/benchmark.py --scale small --baseline base.json
+"""
+import argparse
+import json
+import os
+import shlex
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import mysql.connector
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DOCTOR = os.path.join(os.path.dirname(BENCH_DIR), 'starrocks-doctor.py')
+FAKE_FE = os.path.join(BENCH_DIR, 'fake_fe.py')
+
+# fake_fe.py arguments for the preset scales
+SCALES = {
+    'small': {'tables': 20, 'partitions': 4, 'buckets': 4},
+    # 500k tablets, 1.5M replicas
+    'medium': {'tables': 10000, 'partitions': 5, 'buckets': 10},
+    # 5M tablets, 15M replicas
+    'large': {'tables': 100000, 'partitions': 5, 'buckets': 10},
+}
+
+# Modules that need SSH access to real nodes are left out
+DEFAULT_MODULES = ['schema', 'mv', 'tablet', 'check_replica', 'session_vars', 'be_config', 'fe_config',
+                   'all_configs', 'backend_mapping', 'cluster_state', 'performance_diagnostics', 'query_dump',
+                   'be_stack', 'yesterdays_tables', 'log_paths']
+
+def free_port():
+    with socket.socket() as sock:
+        # The fake FEs are 127.0.0.1, 127.0.0.2, ..., so the port must be free on all of them
+        sock.bind(('0.0.0.0', 0))
+        return sock.getsockname()[1]
+
+class FakeFE:
+    """fake_fe.py running in a child process"""
+    def __init__(self, port, fake_args):
+        self.port = port
+        self.process = subprocess.Popen(
+            [sys.executable, FAKE_FE, '--bind', '0.0.0.0', '--port', str(port)] + fake_args,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        banner = self.process.stdout.readline()
+        if 'listening' not in banner:
+            self.process.kill()
+            raise RuntimeError(f"fake FE did not start: {banner}{self.process.stdout.read()}")
+        print(banner.strip())
+
+    def _statement(self, sql):
+        conn = mysql.connector.connect(host='127.0.0.1', port=self.port, user='bench', password='bench')
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(sql)
+            return cursor.fetchall() if cursor.with_rows else None
+        finally:
+            conn.close()
+
+    def reset_stats(self):
+        self._statement('RESET FAKE STATS')
+
+    def stats(self):
+        """Connections, queries and rows served since the last reset, minus this call"""
+        stats = self._statement('SHOW FAKE STATS')[0]
+        stats['connections'] -= 1
+        stats['queries'] -= 1
+        return stats
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+def run_doctor(port, module, output_dir, extra_args, timeout):
+    """Run one module in a child process
+    Returns:
+        dict: elapsed_s, peak_rss_mb and returncode
+    """
+    sql_file = os.path.join(output_dir, 'query.sql')
+    if not os.path.exists(sql_file):
+        with open(sql_file, 'w') as f:
+            f.write('SELECT * FROM db0.tbl0')
+    module_args = {
+        'check_replica': ['--name', '10000000'],
+        'query_dump': ['--sql_file', sql_file],
+        'be_stack': ['--be_ip', '192.168.0.1'],
+    }.get(module, [])
+    cmd = [sys.executable, DOCTOR, '--host', '127.0.0.1', '--port', str(port), '--user', 'bench',
+           '--password', 'bench', '--module', module, '--output', os.path.join(output_dir, module)]
+    timed_out = False
+    with open(os.path.join(output_dir, f"{module}.log"), 'a') as log:
+        start = time.monotonic()
+        process = subprocess.Popen(cmd + module_args + extra_args, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 instead of wait() to get the resource usage of this child alone
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                break
+            if time.monotonic() - start > timeout:
+                timed_out = True
+                process.kill()
+                pid, status, usage = os.wait4(process.pid, 0)
+                break
+            time.sleep(0.01)
+        elapsed = time.monotonic() - start
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    rss_bytes = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'peak_rss_mb': round(rss_bytes / 1024 / 1024, 1),
+        'returncode': process.returncode,
+        'timed_out': timed_out
+    }
+
+def benchmark(fake, modules, repeat, extra_args, timeout):
+    """Run every module repeat times
+    Returns:
+        dict: Module -> result summary
+    """
+    results = {}
+    output_dir = tempfile.mkdtemp(prefix='srdoc-bench-')
+    for module in modules:
+        runs = []
+        for _ in range(repeat):
+            fake.reset_stats()
+            run = run_doctor(fake.port, module, output_dir, extra_args, timeout)
+            run.update(fake.stats())
+            runs.append(run)
+        elapsed = [run['elapsed_s'] for run in runs]
+        last = runs[-1]
+        results[module] = {
+            'best_s': min(elapsed),
+            'median_s': round(statistics.median(elapsed), 3),
+            'round_trips': last['queries'],
+            'connections': last['connections'],
+            'rows': last['rows'],
+            'peak_fe_in_flight': max(run.get('peak_in_flight', 0) for run in runs),
+            'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+            'returncode': last['returncode'],
+            'timed_out': any(run['timed_out'] for run in runs)
+        }
+        result = results[module]
+        status = 'TIMEOUT' if result['timed_out'] else ('ok' if result['returncode'] == 0 else f"exit {result['returncode']}")
+        print(f"{module:<26} {result['best_s']:>9.3f}s {result['median_s']:>9.3f}s {result['round_trips']:>8} "
+              f"{result['connections']:>6} {result['rows']:>10} {result['peak_rss_mb']:>9.1f}  {status}")
+    print(f"Doctor output and logs kept in {output_dir}")
+    return results
+
+def compare(results, baseline, time_tolerance, round_trip_tolerance):
+    """Compare results with a saved baseline
+    Returns:
+        list: Regression messages
+    """
+    regressions = []
+    for module, result in results.items():
+        base = baseline.get('modules', {}).get(module)
+        if not base:
+            continue
+        # Ignore noise on modules that finish in a blink
+        if result['best_s'] > max(base['best_s'] * (1 + time_tolerance), base['best_s'] + 0.2):
+            regressions.append(f"{module}: {base['best_s']}s -> {result['best_s']}s")
+        if result['round_trips'] > base['round_trips'] * (1 + round_trip_tolerance):
+            regressions.append(f"{module}: {base['round_trips']} -> {result['round_trips']} round trips")
+        if result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + time_tolerance) + 20:
+            regressions.append(f"{module}: peak RSS {base['peak_rss_mb']} MB -> {result['peak_rss_mb']} MB")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark starrocks-doctor.py modules against the local fake FE')
+    parser.add_argument('--scale', choices=list(SCALES), default='small',
+                        help='Preset cluster size: small (1k tablets), medium (500k), large (5M) (default: small)')
+    parser.add_argument('--tables', type=int, help='Override the number of tables')
+    parser.add_argument('--partitions', type=int, help='Override partitions per table')
+    parser.add_argument('--buckets', type=int, help='Override buckets per partition')
+    parser.add_argument('--frontends', type=int, default=3, help='Number of FEs (default: 3)')
+    parser.add_argument('--backends', type=int, default=3, help='Number of BEs (default: 3)')
+    parser.add_argument('--latency_ms', type=float, default=0.0, help='Latency injected into every statement')
+    parser.add_argument('--slow', action='append', default=[], metavar='REGEX=MS',
+                        help='Extra latency for statements matching REGEX (repeatable)')
+    parser.add_argument('--load_latency_ms', type=float, default=0.0,
+                        help='Extra latency per statement already running on the same FE (default: 0)')
+    parser.add_argument('--fake_args', default='', help='Further fake_fe.py arguments, e.g. --fake_args=--no_be_tablets')
+    parser.add_argument('--modules', default=','.join(DEFAULT_MODULES),
+                        help='Comma-separated modules to run (default: all modules that need no SSH)')
+    parser.add_argument('--doctor_args', default='', help='Extra starrocks-doctor.py arguments, e.g. --doctor_args="--format jsonl"')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per module (default: 1)')
+    parser.add_argument('--timeout', type=float, default=1800, help='Seconds before a module run is killed (default: 1800)')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Compare with results saved by an earlier --save')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown / peak RSS growth against the baseline as a fraction (default: 0.25)')
+    parser.add_argument('--round_trip_tolerance', type=float, default=0.0,
+                        help='Allowed round trip growth against the baseline as a fraction (default: 0)')
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    for key in ('tables', 'partitions', 'buckets'):
+        if getattr(args, key):
+            scale[key] = getattr(args, key)
+    fake_args = [f"--{key}={value}" for key, value in scale.items()]
+    fake_args += [f"--frontends={args.frontends}", f"--backends={args.backends}", f"--latency_ms={args.latency_ms}",
+                  f"--load_latency_ms={args.load_latency_ms}"]
+    fake_args += [f"--slow={slow}" for slow in args.slow] + shlex.split(args.fake_args)
+    modules = [module.strip() for module in args.modules.split(',') if module.strip()]
+
+    fake = FakeFE(free_port(), fake_args)
+    try:
+        print(f"{'module':<26} {'best':>10} {'median':>10} {'trips':>8} {'conns':>6} {'rows':>10} {'rss_mb':>9}")
+        results = benchmark(fake, modules, max(1, args.repeat), shlex.split(args.doctor_args), args.timeout)
+    finally:
+        fake.stop()
+
+    report = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'fake_args': fake_args,
+        'doctor_args': args.doctor_args,
+        'modules': results
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results saved to {args.save}")
+
+    failed = [module for module, result in results.items() if result['returncode'] != 0 or result['timed_out']]
+    if failed:
+        print(f"Failed modules: {', '.join(failed)}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance, args.round_trip_tolerance)
+        if regressions:
+            print('Regressions against baseline:')
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print('No regressions against baseline')
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1182 @@
+"""Local MySQL-protocol stand-in for a StarRocks FE
+
+Serves synthetic cluster metadata in the shapes starrocks-doctor.py reads
+(SHOW PROC, information_schema.*, SHOW TABLET(S), SHOW PARTITIONS,
+ADMIN SHOW FRONTEND CONFIG, the audit table, ...) so the doctor can be run
+and benchmarked without a real cluster.
+
+Every FE of the synthetic cluster is a loopback address (127.0.0.1,
+127.0.0.2, ...) served by the same listener, so leader/follower switching
+works unchanged. Result sets are generated lazily, which keeps the fake
+itself small even at millions of tablets.
+
+Usage:
+    python bench/fake_fe.py --port 19030 --tables 100000 --partitions 5 --buckets 10
+"""
+import argparse
+import fnmatch
+import re
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+# Column types used in column definitions
+TYPE_DOUBLE = 0x05
+TYPE_LONGLONG = 0x08
+TYPE_DATETIME = 0x0c
+TYPE_VAR_STRING = 0xfd
+
+CHARSET_UTF8 = 33
+CHARSET_BINARY = 63
+
+# Capability flags announced in the handshake (no SSL, classic EOF packets)
+SERVER_CAPABILITIES = (
+    0x00000001 |  # CLIENT_LONG_PASSWORD
+    0x00000004 |  # CLIENT_LONG_FLAG
+    0x00000008 |  # CLIENT_CONNECT_WITH_DB
+    0x00000200 |  # CLIENT_PROTOCOL_41
+    0x00002000 |  # CLIENT_TRANSACTIONS
+    0x00008000 |  # CLIENT_SECURE_CONNECTION
+    0x00010000 |  # CLIENT_MULTI_STATEMENTS
+    0x00020000 |  # CLIENT_MULTI_RESULTS
+    0x00080000    # CLIENT_PLUGIN_AUTH
+)
+
+GB = 1024 * 1024 * 1024
+MB = 1024 * 1024
+
+BASE_TIME = datetime(2024, 3, 15, 12, 0, 0)
+
+
+def format_size(size):
+    """Format bytes the way SHOW TABLETS/partitions_meta do (e.g. '1.234GB')"""
+    for unit, factor in (('TB', 1024 * GB), ('GB', GB), ('MB', MB), ('KB', 1024)):
+        if size >= factor:
+            return f"{size / factor:.3f}{unit}"
+    return f"{size}B"
+
+
+def _mix(value):
+    """Cheap deterministic hash used to derive synthetic metrics from ids"""
+    value = (value ^ 0x5bd1e995) * 2654435761 & 0xffffffff
+    value ^= value >> 15
+    return value * 2246822519 & 0xffffffff
+
+
+class SyntheticCluster:
+    """Deterministic synthetic StarRocks metadata at a configurable scale"""
+
+    def __init__(self, dbs=2, tables=20, partitions=4, buckets=4, replicas=3,
+                 backends=3, frontends=1, mvs=4, audit_rows=1000):
+        self.dbs = max(1, dbs)
+        self.tables = max(1, tables)
+        self.partitions = max(1, partitions)
+        self.buckets = max(1, buckets)
+        self.replicas = max(1, min(replicas, backends))
+        self.backends = max(1, backends)
+        self.frontends = max(1, frontends)
+        self.mvs = mvs
+        self.audit_rows = audit_rows
+        self.be_tablets = True
+
+    # -- identities ---------------------------------------------------------
+
+    def fe_ips(self):
+        return [f"127.0.0.{i + 1}" for i in range(self.frontends)]
+
+    def be_id(self, index):
+        return 10001 + index
+
+    def be_ip(self, index):
+        return f"192.168.0.{index + 1}"
+
+    def table_key(self, index):
+        return f"db{index % self.dbs}", f"tbl{index}"
+
+    def table_id(self, index):
+        return 100000 + index
+
+    def partition_id(self, table_index, partition):
+        return self.table_id(table_index) * 1000 + partition
+
+    def tablet_index(self, table_index, partition, bucket):
+        return (table_index * self.partitions + partition) * self.buckets + bucket
+
+    def tablet_id(self, tablet_index):
+        return 10000000 + tablet_index
+
+    def tablet_location(self, tablet_id):
+        """Return (table_index, partition, bucket) for a tablet id"""
+        index = tablet_id - 10000000
+        if index < 0 or index >= self.tables * self.partitions * self.buckets:
+            return None
+        bucket = index % self.buckets
+        partition = (index // self.buckets) % self.partitions
+        return index // (self.buckets * self.partitions), partition, bucket
+
+    def tablet_size(self, tablet_index):
+        h = _mix(tablet_index)
+        if h % 100 == 0:
+            return 5 * GB + h % (5 * GB)
+        return h % (800 * MB)
+
+    def tablet_rowsets(self, tablet_index):
+        h = _mix(tablet_index + 7)
+        return 900 + h % 200 if h % 250 == 0 else h % 120
+
+    def replica_backends(self, tablet_index):
+        return [(tablet_index + r) % self.backends for r in range(self.replicas)]
+
+    def table_index(self, db_name, table_name):
+        match = re.match(r'^tbl(\d+)$', table_name or '')
+        if not match:
+            return None
+        index = int(match.group(1))
+        if index >= self.tables or self.table_key(index)[0] != db_name:
+            return None
+        return index
+
+    # -- row sources --------------------------------------------------------
+
+    def frontend_rows(self):
+        for i, ip in enumerate(self.fe_ips()):
+            yield {
+                'Name': f"{ip}_9010_{1700000000000 + i}", 'IP': ip, 'EditLogPort': 9010,
+                'HttpPort': 8030, 'QueryPort': 9030, 'RpcPort': 9020,
+                'Role': 'LEADER' if i == 0 else 'FOLLOWER', 'ClusterId': 1024,
+                'Join': 'true', 'Alive': 'true', 'ReplayedJournalId': 123456,
+                'LastHeartbeat': BASE_TIME, 'IsHelper': 'true', 'ErrMsg': '',
+                'StartTime': BASE_TIME, 'Version': '3.3.14-ee',
+            }
+
+    def backend_rows(self):
+        tablets = self.tables * self.partitions * self.buckets * self.replicas // self.backends
+        for i in range(self.backends):
+            yield {
+                'BackendId': str(self.be_id(i)), 'IP': self.be_ip(i), 'HeartbeatPort': 9050,
+                'BePort': 9060, 'HttpPort': 8040, 'BrpcPort': 8060,
+                'LastStartTime': BASE_TIME, 'LastHeartbeat': BASE_TIME, 'Alive': 'true',
+                'SystemDecommissioned': 'false', 'TabletNum': tablets,
+                'DataUsedCapacity': '1.000 TB', 'CpuCores': 64, 'ErrMsg': '',
+            }
+
+    def statistic_rows(self):
+        per_db = self.tables // self.dbs
+        for db in range(self.dbs):
+            tablets = per_db * self.partitions * self.buckets
+            yield {
+                'DbId': 10 + db, 'DbName': f"db{db}", 'TableNum': per_db,
+                'PartitionNum': per_db * self.partitions, 'IndexNum': per_db,
+                'TabletNum': tablets, 'ReplicaNum': tablets * self.replicas,
+                'UnhealthyTabletNum': db % 2, 'InconsistentTabletNum': 0,
+                'CloningTabletNum': 0, 'ErrorStateTabletNum': 0,
+            }
+
+    def table_rows(self):
+        for t in range(self.tables):
+            db, name = self.table_key(t)
+            yield {
+                'TABLE_CATALOG': 'def', 'TABLE_SCHEMA': db, 'TABLE_NAME': name,
+                'TABLE_TYPE': 'BASE TABLE', 'ENGINE': 'StarRocks',
+                'TABLE_ROWS': self.partitions * 1000, 'DATA_LENGTH': self.partitions * GB,
+                'CREATE_TIME': BASE_TIME - timedelta(hours=t % 48), 'TABLE_ID': self.table_id(t),
+            }
+
+    def tables_config_rows(self):
+        for t in range(self.tables):
+            db, name = self.table_key(t)
+            model = 'PRIMARY_KEYS' if t % 3 == 0 else 'DUPLICATE_KEYS'
+            persistent = 'false' if t % 6 == 0 else 'true'
+            yield {
+                'TABLE_SCHEMA': db, 'TABLE_NAME': name, 'TABLE_ENGINE': 'OLAP',
+                'TABLE_MODEL': model, 'PRIMARY_KEY': '`id`', 'DISTRIBUTE_KEY': '`id`',
+                'PARTITION_KEY': '' if t % 5 == 0 else '`dt`', 'DISTRIBUTE_TYPE': 'HASH',
+                'DISTRIBUTE_BUCKET': self.buckets, 'SORT_KEY': '`id`',
+                'PROPERTIES': '{"replication_num":"%d","enable_persistent_index":"%s"}' % (self.replicas, persistent),
+                'TABLE_ID': self.table_id(t), 'DB_NAME': db,
+            }
+
+    def partition_rows(self, table_indexes=None):
+        for t in (range(self.tables) if table_indexes is None else table_indexes):
+            db, name = self.table_key(t)
+            for p in range(self.partitions):
+                size = sum(self.tablet_size(self.tablet_index(t, p, b)) for b in range(self.buckets))
+                rows = 0 if (t + p) % 7 == 0 else size // 100
+                yield {
+                    'DB_NAME': db, 'TABLE_NAME': name, 'PARTITION_NAME': f"p{p}",
+                    'PARTITION_ID': self.partition_id(t, p), 'COMPACT_VERSION': 1,
+                    'VISIBLE_VERSION': 2 + p, 'VISIBLE_VERSION_TIME': BASE_TIME,
+                    'NEXT_VERSION': 3 + p, 'PARTITION_KEY': '`dt`', 'PARTITION_VALUE': f"'2024-03-{p + 1:02d}'",
+                    'DISTRIBUTION_KEY': '`id`', 'BUCKETS': self.buckets if t % 11 else 1,
+                    'REPLICATION_NUM': self.replicas if t % 13 else 1, 'STORAGE_MEDIUM': 'HDD',
+                    'COOLDOWN_TIME': None, 'LAST_CONSISTENCY_CHECK_TIME': None,
+                    'IS_IN_MEMORY': 0, 'IS_TEMP': 0, 'DATA_SIZE': format_size(size),
+                    'ROW_COUNT': rows, 'ENABLE_DATACACHE': 0, 'AVG_CS': 0.0, 'P50_CS': 0.0,
+                    'MAX_CS': 0.0, 'STORAGE_PATH': '',
+                    # SHOW PARTITIONS column names
+                    'PartitionId': self.partition_id(t, p), 'PartitionName': f"p{p}",
+                    'VisibleVersion': 2 + p, 'State': 'NORMAL', 'Buckets': self.buckets,
+                    'ReplicationNum': self.replicas, 'DataSize': format_size(size), 'RowCount': rows,
+                }
+
+    def be_tablet_rows(self, table_indexes=None):
+        """One row per replica, pre-joined with tables_config columns"""
+        if not self.be_tablets:
+            return
+        for t in (range(self.tables) if table_indexes is None else table_indexes):
+            db, name = self.table_key(t)
+            table_id = self.table_id(t)
+            for p in range(self.partitions):
+                partition_id = self.partition_id(t, p)
+                for b in range(self.buckets):
+                    index = self.tablet_index(t, p, b)
+                    tablet_id = self.tablet_id(index)
+                    size = self.tablet_size(index)
+                    rowsets = self.tablet_rowsets(index)
+                    for be in self.replica_backends(index):
+                        yield {
+                            'BE_ID': self.be_id(be), 'TABLE_ID': table_id, 'PARTITION_ID': partition_id,
+                            'TABLET_ID': tablet_id, 'NUM_VERSION': rowsets, 'MAX_VERSION': 2 + p,
+                            'MIN_VERSION': 1, 'NUM_ROWSET': rowsets, 'NUM_ROW': size // 100,
+                            'DATA_SIZE': size, 'INDEX_MEM': 0, 'CREATE_TIME': BASE_TIME,
+                            'STATE': 'RUNNING', 'TYPE': 'PRIMARY', 'DB_NAME': db, 'TABLE_NAME': name,
+                            'TABLE_SCHEMA': db,
+                        }
+
+    def tablet_rows(self, table_index):
+        """SHOW TABLETS FROM db.tbl rows"""
+        for p in range(self.partitions):
+            for b in range(self.buckets):
+                index = self.tablet_index(table_index, p, b)
+                size = self.tablet_size(index)
+                for replica, be in enumerate(self.replica_backends(index)):
+                    yield {
+                        'TabletId': self.tablet_id(index), 'ReplicaId': self.tablet_id(index) * 10 + replica,
+                        'BackendId': self.be_id(be), 'SchemaHash': 12345, 'Version': 2 + p,
+                        'VersionHash': 0, 'LstSuccessVersion': 2 + p, 'LstFailedVersion': -1,
+                        'LstFailedTime': None, 'DataSize': format_size(size), 'RowCount': size // 100,
+                        'State': 'NORMAL', 'LstConsistencyCheckTime': None, 'CheckVersion': -1,
+                        'VersionCount': self.tablet_rowsets(index), 'PathHash': 0,
+                    }
+
+    def proc_tablet_rows(self):
+        for t in range(self.tables):
+            for p in range(self.partitions):
+                for b in range(self.buckets):
+                    index = self.tablet_index(t, p, b)
+                    yield {
+                        'TabletId': self.tablet_id(index), 'SchemaHash': 12345, 'State': 'NORMAL',
+                        'DataSize': self.tablet_size(index), 'RowCount': self.tablet_size(index) // 100,
+                    }
+
+    def replica_rows(self, tablet_id):
+        location = self.tablet_location(tablet_id)
+        if location is None:
+            return
+        index = self.tablet_index(*location)
+        bad = index % 97 == 0
+        for replica, be in enumerate(self.replica_backends(index)):
+            failed = bad and replica == self.replicas - 1
+            yield {
+                'ReplicaId': tablet_id * 10 + replica, 'BackendId': str(self.be_id(be)),
+                'Version': 2 + location[1], 'LstSuccessVersion': 2 + location[1],
+                'LstFailedVersion': str(3 + location[1]) if failed else '-1',
+                'LstFailedTime': None, 'SchemaHash': 12345, 'DataSize': self.tablet_size(index),
+                'RowCount': self.tablet_size(index) // 100, 'State': 'NORMAL', 'IsBad': 'false',
+                'IsErrorState': 'false', 'VersionCount': self.tablet_rowsets(index),
+            }
+
+    def show_tablet_rows(self, tablet_id):
+        location = self.tablet_location(tablet_id)
+        if location is None:
+            return
+        t, p, _ = location
+        db, name = self.table_key(t)
+        yield {
+            'DbName': db, 'TableName': name, 'PartitionName': f"p{p}", 'IndexName': name,
+            'DbId': 10 + t % self.dbs, 'TableId': self.table_id(t), 'PartitionId': self.partition_id(t, p),
+            'IndexId': self.table_id(t) + 1, 'IsSync': 'true',
+            'DetailCmd': f"SHOW PROC '/dbs/{10 + t % self.dbs}/{self.table_id(t)}/partitions/"
+                         f"{self.partition_id(t, p)}/{self.table_id(t) + 1}/{tablet_id}';",
+        }
+
+    def mv_rows(self):
+        for m in range(self.mvs):
+            db = f"db{m % self.dbs}"
+            yield {
+                'TABLE_SCHEMA': db, 'TABLE_NAME': f"mv{m}", 'MATERIALIZED_VIEW_DEFINITION':
+                f"SELECT * FROM {db}.tbl{m % self.tables}", 'TASK_NAME': f"mv-{m}",
+                'TABLE_ID': 900000 + m, 'REFRESH_TYPE': 'ASYNC', 'IS_ACTIVE': 'true',
+            }
+
+    def dependency_rows(self):
+        # Each MV reads one base table; every third MV is stacked on the previous MV
+        for m in range(self.mvs):
+            db = f"db{m % self.dbs}"
+            base_db, base_name = self.table_key(m % self.tables)
+            yield {
+                'object_database': db, 'object_name': f"mv{m}", 'object_type': 'MATERIALIZED_VIEW',
+                'ref_object_database': base_db, 'ref_object_name': base_name, 'ref_object_type': 'OLAP',
+            }
+            if m and m % 3 == 0:
+                yield {
+                    'object_database': db, 'object_name': f"mv{m}", 'object_type': 'MATERIALIZED_VIEW',
+                    'ref_object_database': f"db{(m - 1) % self.dbs}", 'ref_object_name': f"mv{m - 1}",
+                    'ref_object_type': 'MATERIALIZED_VIEW',
+                }
+
+    def task_run_rows(self):
+        for m in range(self.mvs):
+            for run in range(5):
+                created = BASE_TIME - timedelta(hours=run)
+                duration = 30 + (m % 7) * 10 + (5 - run) * (m % 3)
+                yield {
+                    'QUERY_ID': f"q-{m}-{run}", 'TASK_NAME': f"mv-{m}", 'CREATE_TIME': created,
+                    'FINISH_TIME': created + timedelta(seconds=duration), 'STATE': 'SUCCESS' if (m + run) % 9 else 'FAILED',
+                    'State': 'SUCCESS' if (m + run) % 9 else 'FAILED', 'DATABASE': f"db{m % self.dbs}",
+                    'DEFINITION': '', 'EXPIRE_TIME': None, 'ERROR_CODE': 0,
+                    'ERROR_MESSAGE': None if (m + run) % 9 else 'refresh failed', 'PROGRESS': '100%',
+                    'EXTRA_MESSAGE': '', 'PROPERTIES': '',
+                }
+
+    def be_config_rows(self):
+        for i in range(self.backends):
+            yield {'BE_ID': self.be_id(i), 'NAME': 'sys_log_dir', 'VALUE': '/opt/starrocks/be/log',
+                   'TYPE': 'string', 'DEFAULT': '${STARROCKS_HOME}/log', 'MUTABLE': 'false'}
+            for k in range(40):
+                modified = k % 4 == 0
+                yield {
+                    'BE_ID': self.be_id(i), 'NAME': f"config_{k}", 'VALUE': str(k * 2 if modified else k),
+                    'TYPE': 'int', 'DEFAULT': str(k), 'MUTABLE': 'true',
+                }
+
+    def fe_config_rows(self):
+        yield {'Key': 'sys_log_dir', 'AliasNames': '[]', 'Value': '/opt/starrocks/fe/log',
+               'Type': 'String', 'IsMutable': 'false', 'Comment': ''}
+        for k in range(50):
+            yield {'Key': f"fe_config_{k}", 'AliasNames': '[]', 'Value': str(k),
+                   'Type': 'int', 'IsMutable': 'true', 'Comment': ''}
+
+    def session_variable_rows(self):
+        for k in range(60):
+            yield {'VARIABLE_NAME': f"var_{k}", 'VARIABLE_VALUE': str(k),
+                   'DEFAULT_VALUE': str(0 if k % 10 == 0 else k),
+                   'IS_CHANGED': 'TRUE' if k % 10 == 0 and k else 'FALSE'}
+
+    def audit_rows_for(self, fe_ip):
+        for i in range(self.audit_rows):
+            h = _mix(i)
+            yield {
+                'queryId': f"{fe_ip}-{i}", 'timestamp': BASE_TIME - timedelta(seconds=i * 7),
+                'queryType': 'query', 'clientIp': '10.0.0.1', 'user': f"user{h % 5}",
+                'authorizedUser': f"user{h % 5}", 'resourceGroup': f"rg{h % 3}", 'catalog': 'default_catalog',
+                'db': f"db{h % self.dbs}", 'state': 'EOF' if h % 50 else 'ERR', 'errorCode': '',
+                'queryTime': h % 5000, 'scanBytes': h % (10 * GB), 'scanRows': h % 1000000,
+                'returnRows': h % 1000, 'cpuCostNs': h * 17 % 10 ** 10, 'memCostBytes': h % GB,
+                'stmtId': i, 'isQuery': 1, 'feIp': fe_ip, 'stmt': f"SELECT * FROM tbl{h % 20}",
+                'digest': f"digest{h % 25:02d}", 'planCpuCosts': 0.0, 'planMemCosts': 0.0,
+            }
+
+
+# -- minimal SQL evaluation ---------------------------------------------------
+
+CLAUSE_RE = re.compile(r'\b(from|where|group by|having|order by|limit)\b', re.I)
+AGGREGATE_RE = re.compile(r'^(count|sum|avg|max|min|group_concat|percentile_approx|any_value)\s*\((.*)\)$', re.I | re.S)
+
+
+def _split_top_level(text, sep=','):
+    parts, depth, quote, current = [], 0, None, []
+    for ch in text:
+        if quote:
+            current.append(ch)
+            if ch == quote:
+                quote = None
+            continue
+        if ch in ("'", '"', '`'):
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(ch)
+    if ''.join(current).strip():
+        parts.append(''.join(current).strip())
+    return parts
+
+
+def _clauses(sql):
+    """Split the outermost SELECT into its clauses (ignores nesting)"""
+    body = sql.strip().rstrip(';')
+    positions, depth, quote = [], 0, None
+    for i, ch in enumerate(body):
+        if quote:
+            if ch == quote:
+                quote = None
+            continue
+        if ch in ("'", '"'):
+            quote = ch
+        elif ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        elif depth == 0:
+            match = CLAUSE_RE.match(body, i)
+            if match and (i == 0 or not (body[i - 1].isalnum() or body[i - 1] == '_')):
+                positions.append((i, match.group(1).lower().replace('  ', ' ')))
+    clauses = {}
+    select_end = positions[0][0] if positions else len(body)
+    clauses['select'] = re.sub(r'^\s*select\s+', '', body[:select_end], flags=re.I)
+    for n, (start, name) in enumerate(positions):
+        end = positions[n + 1][0] if n + 1 < len(positions) else len(body)
+        clauses.setdefault(name, body[start + len(name):end].strip())
+    return clauses
+
+
+def _unquote(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ("'", '"'):
+        return value[1:-1]
+    return value
+
+
+def _column(row, name):
+    name = name.strip().strip('`')
+    if '.' in name:
+        name = name.split('.')[-1].strip('`')
+    if name in row:
+        return row[name]
+    lowered = name.lower()
+    for key, value in row.items():
+        if key.lower() == lowered:
+            return value
+    return None
+
+
+def _literal(text):
+    text = text.strip()
+    if text.upper() == 'NULL':
+        return None
+    if text[:1] in ("'", '"'):
+        return _unquote(text)
+    if re.fullmatch(r'[\d.\s*+()/-]+', text):
+        try:
+            return eval(text, {'__builtins__': {}})  # arithmetic on numeric literals only
+        except Exception:
+            return None
+    return None
+
+
+def _to_number(value):
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _compare(left, op, right):
+    if left is None or right is None:
+        return False
+    if isinstance(right, (int, float)) or isinstance(left, (int, float)):
+        left, right = _to_number(left), _to_number(right)
+        if left is None or right is None:
+            return False
+    elif isinstance(left, datetime):
+        right = str(right)
+        left = left.strftime('%Y-%m-%d %H:%M:%S')
+    else:
+        left, right = str(left), str(right)
+    return {'=': left == right, '!=': left != right, '<>': left != right, '>': left > right,
+            '<': left < right, '>=': left >= right, '<=': left <= right}[op]
+
+
+def _build_filter(where):
+    """Translate simple AND-ed predicates; anything unrecognised is ignored"""
+    if not where:
+        return lambda row: True
+    predicates = []
+    for part in re.split(r'\s+and\s+', where, flags=re.I):
+        part = part.strip().strip('()').strip()
+        match = re.fullmatch(r'([\w.`]+)\s*(=|!=|<>|>=|<=|>|<)\s*(.+)', part, re.S)
+        if match and _literal(match.group(3)) is not None:
+            column, op, value = match.group(1), match.group(2), _literal(match.group(3))
+            predicates.append(lambda row, c=column, o=op, v=value: _compare(_column(row, c), o, v))
+            continue
+        match = re.fullmatch(r'([\w.`]+)\s+in\s*\((.*)\)', part, re.S | re.I)
+        if match:
+            values = {str(_literal(v)) for v in _split_top_level(match.group(2))}
+            predicates.append(lambda row, c=match.group(1), vs=values: str(_column(row, c)) in vs)
+            continue
+        match = re.fullmatch(r'([\w.`]+)\s+like\s+(.+)', part, re.S | re.I)
+        if match and _literal(match.group(2)) is not None:
+            pattern = str(_literal(match.group(2))).replace('%', '*').replace('_', '?')
+            predicates.append(lambda row, c=match.group(1), p=pattern: fnmatch.fnmatchcase(str(_column(row, c)), p))
+    return lambda row: all(p(row) for p in predicates)
+
+
+def _select_items(select):
+    items = []
+    for item in _split_top_level(select):
+        match = re.fullmatch(r'(.*?)\s+(?:as\s+)?[`"]?(\w+)[`"]?', item, re.S | re.I)
+        if match and not re.fullmatch(r'.*\b(?:distinct)$', match.group(1).strip(), re.I) \
+                and match.group(1).strip() and not match.group(1).strip().endswith('.'):
+            expr, alias = match.group(1).strip(), match.group(2)
+        else:
+            expr = item.strip()
+            alias = expr.split('.')[-1].strip('`') if re.fullmatch(r'[\w.`]+', expr) else expr
+        items.append((expr, alias))
+    return items
+
+
+def _scalar(expr, row):
+    expr = expr.strip()
+    if expr == '*':
+        return None
+    if re.fullmatch(r'[\w.`]+', expr) and not re.fullmatch(r'[\d.]+', expr):
+        return _column(row, expr)
+    match = re.fullmatch(r'date_format\s*\(\s*([\w.`]+)\s*,.*\)', expr, re.I | re.S)
+    if match:
+        value = _column(row, match.group(1))
+        return value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else value
+    match = re.fullmatch(r'timestampdiff\s*\(\s*second\s*,\s*([\w.`]+)\s*,\s*([\w.`]+)\s*\)', expr, re.I)
+    if match:
+        start, end = _column(row, match.group(1)), _column(row, match.group(2))
+        if isinstance(start, datetime) and isinstance(end, datetime):
+            return int((end - start).total_seconds())
+        return None
+    match = re.fullmatch(r'cast\s*\(\s*([\w.`]+)\s+as\s+\w+\s*\)', expr, re.I)
+    if match:
+        return _column(row, match.group(1))
+    return _literal(expr)
+
+
+def _aggregate(func, arg, rows):
+    func = func.lower()
+    if func == 'count':
+        if arg.strip() == '*':
+            return len(rows)
+        distinct = re.match(r'distinct\s+(.*)', arg, re.I | re.S)
+        if distinct:
+            return len({_scalar(distinct.group(1), r) for r in rows})
+        return sum(1 for r in rows if _scalar(arg, r) is not None)
+    if func == 'group_concat':
+        return ','.join(str(_scalar(arg, r)) for r in rows)
+    if func == 'percentile_approx':
+        column, fraction = _split_top_level(arg)
+        values = sorted(v for v in (_to_number(_scalar(column, r)) for r in rows) if v is not None)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(float(fraction) * len(values)))]
+    if func == 'any_value':
+        return _scalar(arg, rows[0]) if rows else None
+    values = [v for v in (_to_number(_scalar(arg, r)) for r in rows) if v is not None]
+    if not values:
+        return None
+    if func == 'sum':
+        return sum(values)
+    if func == 'avg':
+        return sum(values) / len(values)
+    return max(values) if func == 'max' else min(values)
+
+
+def _order_key(value):
+    if value is None:
+        return (0, 0)
+    number = _to_number(value)
+    if number is not None and not isinstance(value, str):
+        return (1, number)
+    if isinstance(value, datetime):
+        return (1, value.timestamp())
+    return (2, str(value))
+
+
+WINDOW_RE = re.compile(r'^row_number\s*\(\s*\)\s*over\s*\(\s*partition\s+by\s+([\w.`]+)\s+order\s+by\s+([\w.`]+)(\s+desc|\s+asc)?\s*\)$', re.I)
+
+
+def _inner_select(from_clause):
+    """Return the SQL of a derived table in FROM (...) alias, or None"""
+    if not from_clause.startswith('('):
+        return None
+    depth = 0
+    for i, ch in enumerate(from_clause):
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+            if depth == 0:
+                return from_clause[1:i]
+    return None
+
+
+def _with_row_numbers(items, rows):
+    """Materialize rows and add ROW_NUMBER() OVER (PARTITION BY .. ORDER BY ..) columns"""
+    rows = [dict(r) for r in rows]
+    for expr, alias in items:
+        match = WINDOW_RE.match(expr)
+        if not match:
+            continue
+        partition, order, direction = match.group(1), match.group(2), (match.group(3) or '').strip().lower()
+        rows.sort(key=lambda r: _order_key(_column(r, order)), reverse=direction == 'desc')
+        counters = defaultdict(int)
+        for row in rows:
+            key = _column(row, partition)
+            counters[key] += 1
+            row[alias] = counters[key]
+    return rows
+
+
+def evaluate_select(sql, rows):
+    """Apply projection, simple WHERE, GROUP BY, ORDER BY and LIMIT to rows"""
+    clauses = _clauses(sql)
+    inner = _inner_select(clauses.get('from', ''))
+    if inner is not None:
+        columns, inner_rows = evaluate_select(inner, rows)
+        rows = inner_rows
+    distinct = re.match(r'^\s*distinct\s+', clauses['select'], re.I)
+    if distinct:
+        clauses['select'] = clauses['select'][distinct.end():]
+    items = _select_items(clauses['select'])
+    rows = filter(_build_filter(clauses.get('where')), rows)
+    if any(WINDOW_RE.match(expr) for expr, _ in items):
+        rows = _with_row_numbers(items, rows)
+        items = [(alias if WINDOW_RE.match(expr) else expr, alias) for expr, alias in items]
+    star = any(expr == '*' for expr, _ in items)
+
+    if clauses.get('group by') or any(AGGREGATE_RE.match(expr) for expr, _ in items):
+        keys = [k.strip() for k in _split_top_level(clauses.get('group by', ''))]
+        groups = defaultdict(list)
+        for row in rows:
+            groups[tuple(_scalar(k, row) for k in keys)].append(row)
+        if not keys and not groups:
+            groups[()] = []
+        output = []
+        for group_rows in groups.values():
+            out = {}
+            for expr, alias in items:
+                match = AGGREGATE_RE.match(expr)
+                out[alias] = _aggregate(match.group(1), match.group(2), group_rows) if match \
+                    else (_scalar(expr, group_rows[0]) if group_rows else None)
+            output.append(out)
+        having = clauses.get('having')
+        if having:
+            output = [r for r in output if _build_filter(having)(r)]
+        rows = iter(output)
+    elif star:
+        rows = (dict(r) for r in rows)
+    else:
+        rows = ({alias: _scalar(expr, r) for expr, alias in items} for r in rows)
+
+    if distinct:
+        rows = _distinct(rows)
+
+    order = clauses.get('order by')
+    if order:
+        rows = list(rows)
+        for term in reversed(_split_top_level(order)):
+            parts = term.split()
+            descending = len(parts) > 1 and parts[-1].lower() == 'desc'
+            column = parts[0]
+            rows.sort(key=lambda r, c=column: _order_key(_column(r, c)), reverse=descending)
+        rows = iter(rows)
+
+    limit = clauses.get('limit')
+    if limit:
+        match = re.match(r'(\d+)(?:\s*,\s*(\d+)|\s+offset\s+(\d+))?', limit, re.I)
+        if match:
+            if match.group(2):
+                offset, count = int(match.group(1)), int(match.group(2))
+            else:
+                offset, count = int(match.group(3) or 0), int(match.group(1))
+            rows = _islice(rows, offset, offset + count)
+    return [alias for _, alias in items] if not star else None, rows
+
+
+def _distinct(rows):
+    seen = set()
+    for row in rows:
+        key = tuple(row.values())
+        if key not in seen:
+            seen.add(key)
+            yield row
+
+
+def _islice(rows, start, stop):
+    for i, row in enumerate(rows):
+        if i >= stop:
+            break
+        if i >= start:
+            yield row
+
+
+# -- query routing --------------------------------------------------------------
+
+class QueryRouter:
+    """Maps doctor statements onto synthetic row sources"""
+
+    def __init__(self, cluster):
+        self.cluster = cluster
+
+    def _table_filter(self, sql):
+        """Narrow generators when the WHERE clause names a single table"""
+        db = re.search(r"(?:DB_NAME|TABLE_SCHEMA)\s*=\s*'([^']*)'", sql, re.I)
+        table = re.search(r"TABLE_NAME\s*=\s*'([^']*)'", sql, re.I)
+        if db and table:
+            index = self.cluster.table_index(db.group(1), table.group(1))
+            return [] if index is None else [index]
+        if table:
+            match = re.match(r'^tbl(\d+)$', table.group(1))
+            index = int(match.group(1)) if match else None
+            return [index] if index is not None and index < self.cluster.tables else []
+        return None
+
+    def route(self, sql, fe_ip):
+        """Return (columns, rows) for a result set or None for an OK packet"""
+        c = self.cluster
+        text = re.sub(r'--[^\n]*', '', sql).strip().rstrip(';').strip()
+        lowered = re.sub(r'\s+', ' ', text.lower())
+
+        if re.match(r'^(set|use|commit|rollback|begin|kill|admin set|admin repair|admin cancel)\b', lowered):
+            return None
+        if lowered in ('show frontends', "show proc '/frontends'"):
+            return self._rows(c.frontend_rows())
+        if lowered == "show proc '/backends'":
+            return self._rows(c.backend_rows())
+        if lowered == "show proc '/statistic'":
+            return self._rows(c.statistic_rows())
+        if lowered == "show proc '/current_queries'":
+            return self._rows({'QueryId': f"{fe_ip}-cur-{i}", 'ConnectionId': i, 'Database': 'db0',
+                               'User': 'root', 'ScanBytes': '1.000 MB', 'ProcessRows': i * 100,
+                               'CPUCostSeconds': '0.01', 'MemoryUsageBytes': '1.000 MB',
+                               'ExecTime': str(i * 10)} for i in range(3))
+        if lowered == 'show processlist':
+            return self._rows({'Id': i, 'User': 'root', 'Host': '10.0.0.1:1234', 'Db': 'db0',
+                               'Command': 'Query', 'ConnectionStartTime': BASE_TIME, 'Time': i,
+                               'State': 'OK', 'Info': 'select 1', 'IsPending': 'false'} for i in range(3))
+        if lowered == 'show resource groups':
+            return self._rows({'name': f"rg{i}", 'id': i, 'cpu_weight': 8, 'mem_limit': '50%'} for i in range(3))
+        match = re.match(r'^select (@@[\w.]+)$', lowered)
+        if match:
+            return self._rows([{match.group(1): ''}])
+        if 'current_version()' in lowered:
+            return self._rows([{'current_version()': '3.3.14-ee 5b29ea9'}])
+        match = re.match(r"^show proc '/tablets/(\d+)'$", lowered) or \
+            re.match(r"^show proc '/dbs/\d+/\d+/partitions/\d+/\d+/(\d+)'$", lowered)
+        if match:
+            return self._rows(c.replica_rows(int(match.group(1))))
+        if lowered.startswith("show proc '/tablets'"):
+            match = re.search(r'tabletid\s*=\s*(\d+)', lowered)
+            if match:
+                tablet_id = int(match.group(1))
+                return self._rows(r for r in c.proc_tablet_rows() if r['TabletId'] == tablet_id) \
+                    if c.tablet_location(tablet_id) is None else self._rows(self._proc_tablet(tablet_id))
+            return self._rows(c.proc_tablet_rows())
+        match = re.match(r'^show tablet (\d+)$', lowered)
+        if match:
+            return self._rows(c.show_tablet_rows(int(match.group(1))))
+        match = re.match(r'^show (tablets|partitions|create table) from `?(\w+)`?\.`?(\w+)`?$', lowered) or \
+            re.match(r'^show (create table) `?(\w+)`?\.`?(\w+)`?$', lowered)
+        if match:
+            return self._table_statement(match.group(1), match.group(2), match.group(3))
+        if lowered.startswith('admin show frontend config'):
+            match = re.search(r"like '([^']*)'", lowered)
+            rows = c.fe_config_rows()
+            if match:
+                pattern = match.group(1).replace('%', '*')
+                rows = (r for r in rows if fnmatch.fnmatchcase(r['Key'], pattern))
+            return self._rows(rows)
+        match = re.match(r'^admin execute on (\d+) ', lowered)
+        if match:
+            return self._rows([{'result': self._stack_trace(int(match.group(1)))}])
+        if 'get_query_dump(' in lowered:
+            return self._rows([{'get_query_dump': '{"statement": "dump"}'}])
+        if lowered.startswith('select count(*) as count from'):
+            return self._rows([{'count': c.partitions * 1000}])
+
+        source = self._source(lowered, text, fe_ip)
+        if source is not None:
+            columns, rows = evaluate_select(self._outer_select(text), source)
+            return self._rows(rows, columns)
+        raise LookupError(f"fake FE does not understand: {text[:200]}")
+
+    def _proc_tablet(self, tablet_id):
+        for row in self.cluster.proc_tablet_rows():
+            if row['TabletId'] == tablet_id:
+                yield row
+                return
+
+    def _outer_select(self, text):
+        # CTEs: evaluate the final SELECT only
+        if re.match(r'^\s*with\b', text, re.I):
+            depth = 0
+            for i, ch in enumerate(text):
+                if ch == '(':
+                    depth += 1
+                elif ch == ')':
+                    depth -= 1
+                elif depth == 0 and re.match(r'select\b', text[i:i + 7], re.I) and i > 0:
+                    return text[i:]
+        return text
+
+    def _source(self, lowered, text, fe_ip):
+        """Pick the row source for a SELECT from the first table it names"""
+        c = self.cluster
+        outer = self._outer_select(text).lower()
+        match = re.search(r'\bfrom\s+([\w.`]+)', outer)
+        if not match:
+            return None
+        name = match.group(1).replace('`', '')
+        if 'from (' in outer:
+            name = re.search(r'\bfrom\s+([\w.`]+)', lowered[lowered.index('from (') + 6:]).group(1)
+        tables = self._table_filter(text)
+        if name.endswith('be_tablets'):
+            return c.be_tablet_rows(tables)
+        if name.endswith('partitions_meta'):
+            return c.partition_rows(tables)
+        if name.endswith('tables_config'):
+            if 'be_tablets' in lowered:
+                return c.be_tablet_rows(tables)
+            return c.tables_config_rows()
+        if name.endswith('information_schema.tables'):
+            return c.table_rows()
+        if name.endswith('materialized_views'):
+            return c.mv_rows()
+        if name.endswith('task_runs'):
+            return c.task_run_rows()
+        if name.endswith('object_dependencies'):
+            return c.dependency_rows()
+        if name.endswith('be_configs'):
+            return c.be_config_rows()
+        if name.endswith('verbose_session_variables'):
+            return c.session_variable_rows()
+        if name.endswith('starrocks_audit_tbl__'):
+            return c.audit_rows_for(fe_ip)
+        return None
+
+    def _table_statement(self, statement, db, table):
+        c = self.cluster
+        index = c.table_index(db, table)
+        if index is None:
+            raise LookupError(f"Unknown table '{db}.{table}'")
+        if statement == 'tablets':
+            return self._rows(c.tablet_rows(index))
+        if statement == 'partitions':
+            keys = ('PartitionId', 'PartitionName', 'VisibleVersion', 'State', 'Buckets',
+                    'ReplicationNum', 'DataSize', 'RowCount')
+            return self._rows({k: r[k] for k in keys} for r in c.partition_rows([index]))
+        ddl = (f"CREATE TABLE `{table}` (\n  `id` bigint(20) NOT NULL,\n  `dt` date NOT NULL\n) ENGINE=OLAP\n"
+               f"DUPLICATE KEY(`id`)\nPARTITION BY RANGE(`dt`)()\nDISTRIBUTED BY HASH(`id`) BUCKETS {c.buckets}\n"
+               f"PROPERTIES (\"replication_num\" = \"{c.replicas}\");")
+        return self._rows([{'Table': table, 'Create Table': ddl}])
+
+    def _stack_trace(self, be_id):
+        lines = []
+        hot = ['starrocks::pipeline::PipelineDriverPoller::run_internal()',
+               'starrocks::ThreadPool::dispatch_thread()', 'starrocks::Thread::supervise_thread(void*)',
+               'start_thread', 'clone']
+        idle = ['pthread_cond_wait', 'starrocks::ThreadPool::dispatch_thread()',
+                'starrocks::Thread::supervise_thread(void*)', 'start_thread', 'clone']
+        for tid in range(64):
+            frames = hot if tid % 16 == 0 else idle
+            name = 'pip_poller' if tid % 16 == 0 else 'pip_exec'
+            lines.append(f"tid: {be_id * 1000 + tid}, name: {name}")
+            lines.extend(f"  {n}# 0x{0x400000 + n * 16:x} {frame}" for n, frame in enumerate(frames))
+            lines.append('')
+        return '\n'.join(lines)
+
+    @staticmethod
+    def _rows(rows, columns=None):
+        rows = iter(rows)
+        if columns is not None:
+            return columns, rows
+        first = next(rows, None)
+        if first is None:
+            return [], iter(())
+        return list(first.keys()), _chain_first(first, rows)
+
+
+def _chain_first(first, rows):
+    yield first
+    yield from rows
+
+
+# -- MySQL wire protocol --------------------------------------------------------
+
+def lenenc_int(value):
+    if value < 251:
+        return bytes([value])
+    if value < 1 << 16:
+        return b'\xfc' + struct.pack('<H', value)
+    if value < 1 << 24:
+        return b'\xfd' + struct.pack('<I', value)[:3]
+    return b'\xfe' + struct.pack('<Q', value)
+
+
+def lenenc_str(data):
+    return lenenc_int(len(data)) + data
+
+
+def _encode_value(value):
+    if value is None:
+        return b'\xfb'
+    if isinstance(value, datetime):
+        value = value.strftime('%Y-%m-%d %H:%M:%S')
+    elif isinstance(value, float):
+        value = repr(value)
+    return lenenc_str(str(value).encode('utf-8'))
+
+
+def _column_type(values):
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            return TYPE_VAR_STRING
+        if isinstance(value, int):
+            return TYPE_LONGLONG
+        if isinstance(value, float):
+            return TYPE_DOUBLE
+        if isinstance(value, datetime):
+            return TYPE_DATETIME
+        return TYPE_VAR_STRING
+    return TYPE_VAR_STRING
+
+
+class FakeFEServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, cluster, latency_ms=0.0, slow=None, hang_ips=(), load_latency_ms=0.0):
+        super().__init__(address, FakeFEHandler)
+        self.cluster = cluster
+        self.router = QueryRouter(cluster)
+        self.latency_ms = latency_ms
+        self.load_latency_ms = load_latency_ms
+        self.in_flight = {}
+        self.slow = [(re.compile(p, re.I), ms) for p, ms in (slow or [])]
+        self.hang_ips = set(hang_ips)
+        self.stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.stats = {'connections': 0, 'queries': 0, 'rows': 0, 'peak_in_flight': 0}
+
+    def count(self, key, amount=1):
+        with self.stats_lock:
+            self.stats[key] += amount
+
+    def delay_for(self, sql, in_flight=1):
+        # An FE under load: every other statement running on it adds load_latency_ms
+        delay = self.latency_ms + self.load_latency_ms * (in_flight - 1)
+        for pattern, ms in self.slow:
+            if pattern.search(sql):
+                delay += ms
+        return delay / 1000.0
+
+    def enter(self, fe_ip):
+        with self.stats_lock:
+            self.in_flight[fe_ip] = self.in_flight.get(fe_ip, 0) + 1
+            self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.in_flight[fe_ip])
+            return self.in_flight[fe_ip]
+
+    def leave(self, fe_ip):
+        with self.stats_lock:
+            self.in_flight[fe_ip] -= 1
+
+
+class FakeFEHandler(socketserver.StreamRequestHandler):
+    wbufsize = 1 << 16
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.fe_ip = self.request.getsockname()[0]
+        self.seq = 0
+
+    def handle(self):
+        server = self.server
+        if self.fe_ip in server.hang_ips:
+            # Simulate a hung FE: accept the TCP connection and never answer
+            while self.rfile.read(1):
+                pass
+            return
+        server.count('connections')
+        self._send_handshake()
+        if self._read_packet() is None:
+            return
+        self._send_ok()
+        self.wfile.flush()
+        while True:
+            packet = self._read_packet()
+            if not packet:
+                return
+            command, payload = packet[0], packet[1:]
+            if command == 0x01:  # COM_QUIT
+                return
+            if command in (0x0e, 0x02):  # COM_PING, COM_INIT_DB
+                self._send_ok()
+            elif command == 0x03:  # COM_QUERY
+                self._handle_query(payload.decode('utf-8', 'replace'))
+            else:
+                self._send_error(1047, f"Unknown command {command}")
+            self.wfile.flush()
+
+    def _handle_query(self, sql):
+        server = self.server
+        server.count('queries')
+        stripped = sql.strip().rstrip(';').strip().lower()
+        if stripped == 'show fake stats':
+            with server.stats_lock:
+                stats = dict(server.stats)
+            self._send_result(list(stats), iter([stats]))
+            return
+        if stripped == 'reset fake stats':
+            server.reset_stats()
+            self._send_ok()
+            return
+        delay = server.delay_for(sql, server.enter(self.fe_ip))
+        try:
+            if delay:
+                time.sleep(delay)
+            result = server.router.route(sql, self.fe_ip)
+        except LookupError as e:
+            self._send_error(1064, str(e))
+            return
+        except Exception as e:  # keep the connection usable on router bugs
+            self._send_error(1105, f"fake FE error: {e}")
+            return
+        finally:
+            server.leave(self.fe_ip)
+        if result is None:
+            self._send_ok()
+        else:
+            self._send_result(*result)
+
+    # -- packets ----------------------------------------------------------
+
+    def _read_packet(self):
+        header = self.rfile.read(4)
+        if len(header) < 4:
+            return None
+        length = header[0] | header[1] << 8 | header[2] << 16
+        self.seq = (header[3] + 1) & 0xff
+        return self.rfile.read(length)
+
+    def _write_packet(self, payload):
+        self.wfile.write(struct.pack('<I', len(payload))[:3] + bytes([self.seq]) + payload)
+        self.seq = (self.seq + 1) & 0xff
+
+    def _send_handshake(self):
+        self.seq = 0
+        salt = b'abcdefgh' + b'ijklmnopqrst'
+        payload = (b'\x0a' + b'5.1.0-fake-starrocks\x00' + struct.pack('<I', threading.get_ident() & 0xffffffff)
+                   + salt[:8] + b'\x00' + struct.pack('<H', SERVER_CAPABILITIES & 0xffff)
+                   + bytes([CHARSET_UTF8]) + struct.pack('<H', 0x0002)
+                   + struct.pack('<H', SERVER_CAPABILITIES >> 16) + bytes([21]) + b'\x00' * 10
+                   + salt[8:] + b'\x00' + b'mysql_native_password\x00')
+        self._write_packet(payload)
+        self.wfile.flush()
+
+    def _send_ok(self):
+        self._write_packet(b'\x00\x00\x00' + struct.pack('<HH', 0x0002, 0))
+
+    def _send_eof(self):
+        self._write_packet(b'\xfe' + struct.pack('<HH', 0, 0x0002))
+
+    def _send_error(self, code, message):
+        self._write_packet(b'\xff' + struct.pack('<H', code) + b'#HY000' + message.encode('utf-8'))
+
+    def _send_result(self, columns, rows):
+        head = []
+        for row in rows:
+            head.append(row)
+            if len(head) >= 64:
+                break
+        if not columns and head:
+            columns = list(head[0].keys())
+        if not columns:
+            columns = ['result']
+        types = [_column_type(r.get(col) for r in head) for col in columns]
+        self._write_packet(lenenc_int(len(columns)))
+        for name, column_type in zip(columns, types):
+            name_bytes = str(name).encode('utf-8')
+            charset = CHARSET_UTF8 if column_type == TYPE_VAR_STRING else CHARSET_BINARY
+            self._write_packet(
+                lenenc_str(b'def') + lenenc_str(b'') + lenenc_str(b'') + lenenc_str(b'')
+                + lenenc_str(name_bytes) + lenenc_str(name_bytes) + b'\x0c'
+                + struct.pack('<HIBHB', charset, 1 << 20, column_type, 0, 0) + b'\x00\x00')
+        self._send_eof()
+        count = 0
+        for row in _chain_list(head, rows):
+            self._write_packet(b''.join(_encode_value(row.get(col)) for col in columns))
+            count += 1
+        self._send_eof()
+        self.server.count('rows', count)
+
+
+def _chain_list(head, rows):
+    yield from head
+    yield from rows
+
+
+def parse_slow(values):
+    slow = []
+    for value in values or []:
+        pattern, _, ms = value.rpartition('=')
+        slow.append((pattern, float(ms)))
+    return slow
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local MySQL-protocol StarRocks FE stand-in')
+    parser.add_argument('--bind', default='0.0.0.0', help='Listen address (default: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=19030, help='Listen port (default: 19030)')
+    parser.add_argument('--dbs', type=int, default=2, help='Number of databases')
+    parser.add_argument('--tables', type=int, default=20, help='Total number of tables')
+    parser.add_argument('--partitions', type=int, default=4, help='Partitions per table')
+    parser.add_argument('--buckets', type=int, default=4, help='Buckets (tablets) per partition')
+    parser.add_argument('--replicas', type=int, default=3, help='Replicas per tablet')
+    parser.add_argument('--backends', type=int, default=3, help='Number of BEs')
+    parser.add_argument('--frontends', type=int, default=1, help='Number of FEs (127.0.0.1..N)')
+    parser.add_argument('--mvs', type=int, default=4, help='Number of materialized views')
+    parser.add_argument('--audit_rows', type=int, default=1000, help='Audit rows per FE')
+    parser.add_argument('--latency_ms', type=float, default=0.0, help='Latency injected into every query')
+    parser.add_argument('--slow', action='append', metavar='REGEX=MS',
+                        help='Extra latency for statements matching REGEX (repeatable)')
+    parser.add_argument('--load_latency_ms', type=float, default=0.0,
+                        help='Extra latency per statement already running on the same FE, to mimic an overloaded FE')
+    parser.add_argument('--no_be_tablets', action='store_true',
+                        help='Serve an empty information_schema.be_tablets (older versions)')
+    parser.add_argument('--hang_fe', action='append', default=[], metavar='IP',
+                        help='FE address that accepts connections but never answers (repeatable)')
+    args = parser.parse_args()
+
+    cluster = SyntheticCluster(
+        dbs=args.dbs, tables=args.tables, partitions=args.partitions, buckets=args.buckets,
+        replicas=args.replicas, backends=args.backends, frontends=args.frontends,
+        mvs=args.mvs, audit_rows=args.audit_rows)
+    cluster.be_tablets = not args.no_be_tablets
+    server = FakeFEServer((args.bind, args.port), cluster, args.latency_ms,
+                          parse_slow(args.slow), args.hang_fe, args.load_latency_ms)
+    print(f"Fake StarRocks FE listening on {args.bind}:{args.port} "
+          f"({cluster.tables} tables, {cluster.tables * cluster.partitions * cluster.buckets} tablets)",
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -263,7 +263,9 @@ class BaseCheck:
                     "replica_partitions": replica_partitions,
                     "bucket_partitions": table_info["bucket_partitions"],
                     "null_partitions": table_info["null_partitions"],
-                    "is_schema": schema
+                    "is_schema": schema,
+                    "data_size_bytes": int(table_info["data_size"]),
+                    "sqrt_bytes": float(sqrt)
                 })
 
         return tables_info
@@ -316,14 +318,46 @@ def save_to_file(data, output_file, format_type):
     except Exception as e:
         print(f"Error saving to file: {e}")
 
+def save_columnar(rows, output_file, format_type):
+    """Save rows to a Parquet or Arrow IPC file, keeping column types"""
+    try:
+        import pyarrow as pa
+        table = pa.Table.from_pylist(rows)
+        if format_type == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, output_file)
+        else:
+            with pa.ipc.new_file(output_file, table.schema) as writer:
+                writer.write_table(table)
+        print(f"Data has been saved to {output_file}")
+    except ImportError:
+        print("Error: pyarrow is required for parquet/arrow output")
+    except Exception as e:
+        print(f"Error saving to file: {e}")
+
 def get_output_filename(base_dir, module_name, format_type):
     """Generate output filename with timestamp and module name"""
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     os.makedirs(base_dir, exist_ok=True)
     return os.path.join(base_dir, f'health_report_{module_name}_{timestamp}.{format_type}')
 
+def columnar_tablet_rows(tables):
+    """Tablet report rows for columnar output, with sizes in bytes instead of rounded MB"""
+    rows = []
+    for table in tables:
+        row = {key: value for key, value in table.items() if key not in ('data_size_bytes', 'sqrt_bytes')}
+        row['data_size'] = table['data_size_bytes']
+        row['mean'] = table['data_size_bytes'] // table['replica_counts'] if table['replica_counts'] > 0 else 0
+        row['sqrt'] = table['sqrt_bytes']
+        rows.append(row)
+    return rows
+
 def print_health_report(tables, output_format='table', output_dir='./reports'):
     """Save health report in specified format"""
+    if output_format in ('parquet', 'arrow'):
+        save_columnar(columnar_tablet_rows(tables), get_output_filename(output_dir, 'tablets', output_format), output_format)
+        return
+
     if output_format == 'json':
         data = format_tables_to_json(tables)
     elif output_format == 'yaml':
@@ -348,6 +382,10 @@ def print_replica_info(tables, replica, output_format='table', output_dir='./rep
                 'partitions': table["replica_partitions"]
             })
 
+    if output_format in ('parquet', 'arrow'):
+        save_columnar(replica_data, get_output_filename(output_dir, 'replicas', output_format), output_format)
+        return
+
     if output_format == 'json':
         data = json.dumps(replica_data, indent=2, ensure_ascii=False)
     elif output_format == 'yaml':
@@ -381,6 +419,10 @@ def print_bucket_info(tables, bucket, output_format='table', output_dir='./repor
                 'partitions': table["bucket_partitions"]
             })
 
+    if output_format in ('parquet', 'arrow'):
+        save_columnar(bucket_data, get_output_filename(output_dir, 'buckets', output_format), output_format)
+        return
+
     if output_format == 'json':
         data = json.dumps(bucket_data, indent=2, ensure_ascii=False)
     elif output_format == 'yaml':
@@ -414,6 +456,10 @@ def print_partitions_info(tables, partition_size, output_format='table', output_
                 'null_partitions': table['null_partitions']
             })
 
+    if output_format in ('parquet', 'arrow'):
+        save_columnar(partition_data, get_output_filename(output_dir, 'partitions', output_format), output_format)
+        return
+
     if output_format == 'json':
         data = json.dumps(partition_data, indent=2, ensure_ascii=False)
     elif output_format == 'yaml':
@@ -452,7 +498,7 @@ def main():
                       help='Module to run')
     parser.add_argument('--debug', action='store_true', help='Enable debug mode')
     parser.add_argument('--format', type=str, default='table',
-                      choices=['table', 'json', 'yaml'],
+                      choices=['table', 'json', 'yaml', 'parquet', 'arrow'],
                       help='Output format')
     parser.add_argument('--output-dir', type=str, default='./reports',
                       help='Output directory for reports')
@@ -1,4 +1,5 @@
 import os
+import sys
 import argparse
 import json
 import csv
@@ -6,8 +7,19 @@ import time
 from datetime import datetime, timedelta
 import re
 import subprocess
+import tempfile
+import pickle
+import shutil
+import shlex
+import gzip
+import threading
+import itertools
+import heapq
+import operator
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, errors
 
 class DateTimeEncoder(json.JSONEncoder):
     """Custom JSON encoder for datetime objects"""
@@ -16,64 +28,2220 @@ class DateTimeEncoder(json.JSONEncoder):
             return obj.strftime('%Y-%m-%d %H:%M:%S')
         return super().default(obj)
 
+def parse_time_arg(value, now=None):
+    """Parse a --since/--until value
+    Args:
+        value: Absolute time ('2024-03-15 12:00:00', '2024-03-15') or a
+               duration before now ('30m', '2h', '1d')
+        now: Reference time for durations, defaults to datetime.now()
+    Returns:
+        datetime: Parsed time
+    """
+    value = value.strip()
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([smhd])', value)
+    if match:
+        seconds = float(match.group(1)) * {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
+        return (now or datetime.now()) - timedelta(seconds=seconds)
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid time '{value}', expected 'YYYY-MM-DD[ HH:MM[:SS]]' or a duration like 30m, 2h, 1d")
+
+class JsonLinesSink:
+    """Write rows to a JSON Lines file as they are produced"""
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.count = 0
+        self._file = open(filepath, 'w')
+
+    def write(self, row):
+        self._file.write(json.dumps(row, cls=DateTimeEncoder))
+        self._file.write('\n')
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CsvSink(JsonLinesSink):
+    """Write rows to a CSV file as they are produced
+    Without fieldnames the header is the union of the keys of all rows, so rows
+    are spooled to a temporary file and written out on close. With fieldnames
+    rows are written right away and keys not in the header are dropped with a
+    warning. Nested values are written as JSON.
+    """
+    def __init__(self, filepath, fieldnames=None):
+        super().__init__(filepath)
+        self.fieldnames = fieldnames
+        self.dropped = []
+        self._columns = {}
+        self._spool = None
+        if fieldnames:
+            self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, restval='', extrasaction='ignore')
+            self._writer.writeheader()
+        else:
+            self._spool = tempfile.TemporaryFile()
+
+    @staticmethod
+    def _cells(row):
+        return {k: json.dumps(v, cls=DateTimeEncoder) if isinstance(v, (dict, list)) else v
+                for k, v in row.items()}
+
+    def write(self, row):
+        if self._spool is not None:
+            self._columns.update(dict.fromkeys(row))
+            pickle.dump(row, self._spool)
+        else:
+            self.dropped.extend(k for k in row if k not in self.fieldnames and k not in self.dropped)
+            self._writer.writerow(self._cells(row))
+        self.count += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._spool is not None:
+            writer = csv.DictWriter(self._file, fieldnames=list(self._columns), restval='')
+            writer.writeheader()
+            self._spool.seek(0)
+            for _ in range(self.count):
+                writer.writerow(self._cells(pickle.load(self._spool)))
+            self._spool.close()
+        if self.dropped:
+            print(f"Warning: {self.filepath}: columns not in the CSV header were dropped: {', '.join(map(str, self.dropped))}")
+        super().close()
+
+class JsonArraySink(JsonLinesSink):
+    """Write rows to a JSON array file as they are produced
+    The layout matches json.dump(rows, f, indent=2).
+    """
+    def write(self, row):
+        body = json.dumps(row, indent=2, cls=DateTimeEncoder).replace('\n', '\n  ')
+        self._file.write(f"{',' if self.count else '['}\n  {body}")
+        self.count += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.write('\n]' if self.count else '[]')
+        super().close()
+
+def size_to_bytes(size_str):
+    """Convert a size string such as '14.2GB', '12 KB' or '977B' to bytes
+    Returns:
+        int: Size in bytes, or None if the string cannot be parsed
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGTP]?B?)\s*', str(size_str), re.I)
+    if not match:
+        return None
+    unit = match.group(2).upper().rstrip('B')
+    return int(float(match.group(1)) * 1024 ** ' KMGTP'.index(unit or ' '))
+
+class ColumnarSink:
+    """Write rows to a Parquet or Arrow IPC file in record batches
+
+    Rows are spooled to a temporary file and the schema is inferred from all
+    of them on close, so every column that occurs in any row is kept. Integers
+    become int64, integers mixed with floats or decimals float64, datetimes
+    timestamps, and size columns such as partitions_meta.DATA_SIZE ('1.2GB')
+    int64 bytes. Columns with mixed or other values, including sizes that do
+    not parse, are written as strings (nested values as JSON).
+    """
+    SIZE_COLUMNS = ('DATA_SIZE', 'DataSize', 'DATA_LENGTH', 'scanBytes', 'memCostBytes')
+
+    def __init__(self, filepath, format='parquet', batch_size=50000):
+        import pyarrow
+        self.pa = pyarrow
+        self.filepath = filepath
+        self.format = format
+        self.batch_size = batch_size
+        self.count = 0
+        # Column name -> Python types seen, in order of first appearance
+        self._kinds = {}
+        self._unparsed_sizes = set()
+        self._spool = tempfile.TemporaryFile()
+
+    def write(self, row):
+        for name, value in row.items():
+            kinds = self._kinds.setdefault(name, set())
+            if value is None:
+                continue
+            if name in self.SIZE_COLUMNS and isinstance(value, str) and size_to_bytes(value) is None:
+                self._unparsed_sizes.add(name)
+            kinds.add(type(value))
+        pickle.dump(row, self._spool)
+        self.count += 1
+
+    def _infer_type(self, name, kinds):
+        pa = self.pa
+        numeric = all(k in (int, float) or k.__name__ == 'Decimal' for k in kinds)
+        if name in self.SIZE_COLUMNS and name not in self._unparsed_sizes and (numeric or str in kinds):
+            return pa.int64()
+        if not kinds:
+            return pa.string()
+        if kinds <= {bool}:
+            return pa.bool_()
+        if kinds <= {int}:
+            return pa.int64()
+        if numeric:
+            return pa.float64()
+        if kinds <= {datetime}:
+            return pa.timestamp('us')
+        return pa.string()
+
+    def _convert(self, value, arrow_type, name):
+        if value is None:
+            return None
+        pa = self.pa
+        if pa.types.is_int64(arrow_type):
+            return size_to_bytes(value) if isinstance(value, str) else int(value)
+        if pa.types.is_float64(arrow_type):
+            return float(value)
+        if pa.types.is_timestamp(arrow_type) or pa.types.is_boolean(arrow_type):
+            return value
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, cls=DateTimeEncoder)
+        if isinstance(value, datetime):
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        return value if isinstance(value, str) else str(value)
+
+    def _write_batches(self, writer, schema):
+        pa = self.pa
+        self._spool.seek(0)
+        remaining = self.count
+        while remaining:
+            rows = [pickle.load(self._spool) for _ in range(min(self.batch_size, remaining))]
+            remaining -= len(rows)
+            arrays = [pa.array([self._convert(row.get(field.name), field.type, field.name) for row in rows],
+                               type=field.type)
+                      for field in schema]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+    def close(self):
+        if self._spool.closed:
+            return
+        if self.count:
+            pa = self.pa
+            schema = pa.schema([(name, self._infer_type(name, kinds)) for name, kinds in self._kinds.items()])
+            if self.format == 'parquet':
+                import pyarrow.parquet
+                writer = pyarrow.parquet.ParquetWriter(self.filepath, schema)
+            else:
+                writer = pa.ipc.new_file(self.filepath, schema)
+            try:
+                self._write_batches(writer, schema)
+            finally:
+                writer.close()
+        self._spool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class FEConnectionPool:
+    """Pool of connections keyed by FE host
+
+    Connections are checked out with acquire()/release() (or the connection()
+    context manager) so modules can query the leader and followers without
+    closing and re-opening a connection on every host switch. A connection
+    that sat idle for more than ping_after_s is pinged on checkout and
+    replaced if the FE dropped it (e.g. after an FE restart).
+    """
+    def __init__(self, port, user, password, max_idle_per_host=4, ping_after_s=1.0):
+        self.port = port
+        self.user = user
+        self.password = password
+        self.max_idle_per_host = max_idle_per_host
+        self.ping_after_s = ping_after_s
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.tracer = None
+        self.governor = None
+
+    def acquire(self, host):
+        """Check out a connection to host, opening a new one if none is idle or alive"""
+        while True:
+            with self._lock:
+                idle = self._idle.get(host)
+                if not idle:
+                    break
+                conn, released_at = idle.pop()
+            if time.monotonic() - released_at < self.ping_after_s or conn.is_connected():
+                return conn
+            self._close(conn)
+        with trace_span(self.tracer, f"connect {host}", 'connect', host=host):
+            if self.governor is None:
+                return self._connect(host)
+            # Logins count against the FE's statement slots like any other statement
+            with self.governor.slot(host, 'CONNECT'):
+                return self._connect(host)
+
+    def _connect(self, host):
+        return mysql.connector.connect(
+            host=host,
+            port=self.port,
+            user=self.user,
+            password=self.password
+        )
+
+    def release(self, host, conn, discard=False):
+        """Return a connection to the pool, closing it if discarded or the pool is full"""
+        if not discard:
+            with self._lock:
+                idle = self._idle.setdefault(host, [])
+                if len(idle) < self.max_idle_per_host:
+                    idle.append((conn, time.monotonic()))
+                    return
+        self._close(conn)
+
+    @contextmanager
+    def connection(self, host):
+        """Context manager checking out a connection to host
+
+        Connections that are no longer alive after an error are discarded
+        instead of being returned to the pool.
+        """
+        conn = self.acquire(host)
+        discard = False
+        try:
+            yield conn
+        except Error:
+            discard = not conn.is_connected()
+            raise
+        finally:
+            self.release(host, conn, discard)
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Error:
+            pass
+
+class FELoadGovernor:
+    """Per-FE statement concurrency that adapts to how each FE is coping
+
+    Every statement takes a slot on its FE before it is sent. The number of
+    slots grows while statements come back at their usual latency, quickly at
+    first and then by one per round, and is halved when an FE answers more
+    than latency_factor times slower than the fastest recent run of the same
+    kind of statement (within baseline_window seconds) or fails with connection errors (AIMD, as in TCP
+    congestion control). It never goes above ceiling, and with max_qps no FE
+    is sent more than that many statements per second. One governor is shared
+    by all modules of a run.
+    """
+    # Errors that point at an overloaded or unreachable FE rather than at the statement
+    OVERLOAD_ERRORS = (errors.OperationalError, errors.InterfaceError, TimeoutError)
+
+    def __init__(self, ceiling=8, max_qps=0, initial=2, latency_factor=3.0, min_latency_s=0.05, baseline_window=30):
+        self.ceiling = max(1, ceiling)
+        self.max_qps = max(0, max_qps or 0)
+        self.initial = min(max(1, initial), self.ceiling)
+        self.latency_factor = latency_factor
+        self.min_latency_s = min_latency_s
+        self.baseline_window = baseline_window
+        self._cond = threading.Condition()
+        self._hosts = {}
+        self._baselines = {}
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = {
+                'limit': float(self.initial),
+                'in_flight': 0,
+                'slow_start': True,
+                'last_cut': 0.0,
+                # Token bucket holding at most one second of --max_fe_qps
+                'tokens': max(1.0, self.max_qps),
+                'refilled': time.monotonic(),
+                'statements': 0,
+                'errors': 0,
+                'cuts': 0,
+                'waited_s': 0.0,
+                'peak_limit': float(self.initial),
+                'min_limit': float(self.initial)
+            }
+        return state
+
+    @staticmethod
+    def statement_kind(query):
+        """Statement text with numeric ids masked, so latencies compare like for like
+        SHOW PROC paths and table names are kept: SHOW PROC '/statistic' or a
+        COUNT(*) over one table is naturally slower than SHOW PROC '/frontends'
+        or another table, and must not look like congestion. Only runs of the same
+        statement over different ids, such as SHOW PROC '/tablets/N', share a key.
+        """
+        return re.sub(r'\b\d+\b', '?', ' '.join(query.split()))
+
+    def _wait_time(self, state):
+        """Seconds to wait before host may take another statement, or None if it may now"""
+        if state['in_flight'] >= int(state['limit']):
+            # Woken up by the next statement that completes
+            return 1.0
+        if self.max_qps:
+            now = time.monotonic()
+            state['tokens'] = min(max(1.0, self.max_qps),
+                                  state['tokens'] + (now - state['refilled']) * self.max_qps)
+            state['refilled'] = now
+            if state['tokens'] < 1:
+                return (1 - state['tokens']) / self.max_qps
+        return None
+
+    @contextmanager
+    def slot(self, host, query):
+        """Hold one of host's statement slots while the statement runs
+        Args:
+            host: FE the statement goes to
+            query: SQL statement, used to compare its latency with earlier runs of the same kind
+        Yields:
+            dict: Set 'latency_s' to report a latency other than the time the slot was held
+        """
+        waiting_since = time.monotonic()
+        with self._cond:
+            state = self._state(host)
+            while True:
+                wait_s = self._wait_time(state)
+                if wait_s is None:
+                    break
+                self._cond.wait(wait_s)
+            if self.max_qps:
+                state['tokens'] -= 1
+            state['in_flight'] += 1
+            started = time.monotonic()
+            state['waited_s'] += started - waiting_since
+        slot = {}
+        overloaded = False
+        try:
+            yield slot
+        except self.OVERLOAD_ERRORS:
+            overloaded = True
+            raise
+        finally:
+            latency = slot.get('latency_s', time.monotonic() - started)
+            self._complete(host, state, self.statement_kind(query), started, latency, overloaded)
+
+    def _complete(self, host, state, kind, started, latency, overloaded):
+        with self._cond:
+            state['in_flight'] -= 1
+            state['statements'] += 1
+            now = time.monotonic()
+            baseline, baseline_at = self._baselines.get((host, kind), (None, None))
+            if overloaded:
+                state['errors'] += 1
+                congested = True
+            else:
+                congested = baseline is not None and \
+                    latency > max(baseline * self.latency_factor, baseline + self.min_latency_s)
+                # The fastest run expires, so a lasting change in the FE's speed is not punished forever
+                if baseline is None or latency <= baseline or now - baseline_at > self.baseline_window:
+                    self._baselines[(host, kind)] = (latency, now)
+            if congested:
+                # One cut per round: statements sent before the last cut still saw the old load
+                if started >= state['last_cut']:
+                    state['limit'] = max(1.0, state['limit'] / 2)
+                    state['slow_start'] = False
+                    state['last_cut'] = now
+                    state['cuts'] += 1
+            elif state['slow_start']:
+                state['limit'] = min(float(self.ceiling), state['limit'] + 1)
+            else:
+                state['limit'] = min(float(self.ceiling), state['limit'] + 1 / state['limit'])
+            state['peak_limit'] = max(state['peak_limit'], state['limit'])
+            state['min_limit'] = min(state['min_limit'], state['limit'])
+            self._cond.notify_all()
+
+    def least_loaded(self, hosts):
+        """The host with the most free slots relative to its limit, the first one on ties"""
+        with self._cond:
+            return min(hosts, key=lambda host: self._state(host)['in_flight'] / self._state(host)['limit'])
+
+    def report(self):
+        """Per-FE limits and counters
+        Returns:
+            dict: FE host -> current, peak and lowest limit, cuts, statements, errors and time spent waiting
+        """
+        with self._cond:
+            return {host: {
+                'limit': round(state['limit'], 2),
+                'peak_limit': round(state['peak_limit'], 2),
+                'min_limit': round(state['min_limit'], 2),
+                'cuts': state['cuts'],
+                'statements': state['statements'],
+                'errors': state['errors'],
+                'waited_s': round(state['waited_s'], 3)
+            } for host, state in self._hosts.items()}
+
+class QueryStream:
+    """Result of one statement read off an unbuffered cursor in fetchmany batches
+
+    Rows are plain tuples sharing one column index, so a scan over millions of
+    rows holds one batch at a time instead of the whole result as dicts. Open
+    it with StarRocksDoctor.stream_query() and read it inside the with block.
+    """
+    def __init__(self, cursor, batch_size=10000, call=None, measure_bytes=False):
+        self._cursor = cursor
+        self.batch_size = max(1, batch_size)
+        self.columns = tuple(column[0] for column in cursor.description or ())
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self.rows = 0
+        # Statements without a result set have nothing left to read
+        self.exhausted = cursor.description is None
+        self._call = {} if call is None else call
+        self._measure_bytes = measure_bytes
+
+    def batches(self):
+        """Yield lists of row tuples until the result is exhausted"""
+        while not self.exhausted:
+            batch = self._cursor.fetchmany(self.batch_size)
+            if not batch:
+                self.exhausted = True
+                break
+            self.rows += len(batch)
+            self._call['rows'] = self.rows
+            if self._measure_bytes:
+                self._call['bytes'] = self._call.get('bytes', 0) + QueryProfiler.approx_bytes(batch)
+            yield batch
+
+    def __iter__(self):
+        for batch in self.batches():
+            for row in batch:
+                yield row
+
+    def getter(self, *names):
+        """operator.itemgetter for the named columns: one value, or a tuple for several names"""
+        return operator.itemgetter(*(self.index[name] for name in names))
+
+    def get(self, row, name, default=None):
+        """Value of column name in row, like dict.get"""
+        i = self.index.get(name)
+        return default if i is None else row[i]
+
+    def dicts(self):
+        """Rows as dicts, built one at a time"""
+        for row in self:
+            yield dict(zip(self.columns, row))
+
+class ClusterTopology:
+    """Cached cluster layout: leader FE, frontends and backends
+
+    The layout is loaded from SHOW PROC '/frontends' and SHOW PROC '/backends'
+    and reused until it is older than ttl seconds or invalidate() is called
+    (the doctor does so on connection failures, e.g. after a leader change).
+    """
+    def __init__(self, doctor, ttl=60):
+        self.doctor = doctor
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._frontends = []
+        self._backends = []
+        self._leader = None
+        self._be_host_to_id = {}
+        self._be_id_to_host = {}
+
+    def invalidate(self):
+        """Force a refresh on next access"""
+        with self._lock:
+            self._loaded_at = None
+
+    def refresh(self):
+        """Reload the layout from the cluster
+        Returns:
+            bool: True if the layout was loaded, False if the previous one is kept
+        """
+        with self._lock, trace_span(self.doctor.tracer, 'topology.refresh', 'topology'):
+            frontends = self.doctor.execute_query("SHOW PROC '/frontends'")
+            if not frontends:
+                print("Error: Could not get FE nodes information")
+                return False
+            leader = None
+            for fe in frontends:
+                if fe.get('Role') == 'LEADER':
+                    leader = fe['IP']
+                    break
+
+            backends = self.doctor.execute_query("SHOW PROC '/backends'", host=leader)
+            if backends is None:
+                print("Error: Could not get backend information")
+                return False
+
+            be_host_to_id = {}
+            be_id_to_host = {}
+            for backend in backends:
+                host = backend.get('IP')
+                backend_id = backend.get('BackendId')
+                if host and backend_id:
+                    be_host_to_id[host] = str(backend_id)
+                    be_id_to_host[str(backend_id)] = host
+
+            self._frontends = frontends
+            self._backends = backends
+            self._leader = leader
+            self._be_host_to_id = be_host_to_id
+            self._be_id_to_host = be_id_to_host
+            self._loaded_at = time.monotonic()
+            return True
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                self.refresh()
+
+    def leader(self):
+        """Leader FE host, or None if unknown"""
+        self._ensure_fresh()
+        return self._leader
+
+    def frontends(self):
+        """SHOW PROC '/frontends' rows"""
+        self._ensure_fresh()
+        return list(self._frontends)
+
+    def backends(self):
+        """SHOW PROC '/backends' rows"""
+        self._ensure_fresh()
+        return list(self._backends)
+
+    def frontend_hosts(self):
+        return [fe['IP'] for fe in self.frontends()]
+
+    def backend_host_id_mapping(self):
+        """Mapping of BE host to BE id"""
+        self._ensure_fresh()
+        return dict(self._be_host_to_id)
+
+    def backend_host(self, backend_id):
+        """BE host for a BE id (int or str), or None if unknown"""
+        self._ensure_fresh()
+        return self._be_id_to_host.get(str(backend_id))
+
+    def backend_id(self, host):
+        """BE id for a BE host, or None if unknown"""
+        self._ensure_fresh()
+        return self._be_host_to_id.get(host)
+
+    def is_frontend_alive(self, host):
+        return any(fe['IP'] == host and str(fe.get('Alive')).lower() == 'true' for fe in self.frontends())
+
+    def is_backend_alive(self, backend_id):
+        return any(str(be.get('BackendId')) == str(backend_id) and str(be.get('Alive')).lower() == 'true'
+                   for be in self.backends())
+
+class MVDependencyGraph:
+    """Materialized view dependency graph loaded from sys.object_dependencies
+
+    All edges are loaded with one query into an adjacency index. Transitive
+    closures are memoized, so a sub-MV shared by many parents is resolved once
+    and an MV's base-table set is a dict lookup after the first access. MVs on
+    a dependency cycle are resolved again on every call, since the walk has to
+    stop somewhere on the cycle and where depends on the MV it started from.
+    """
+    def __init__(self, rows):
+        self._refs = {}
+        self._dependents = {}
+        self._types = {}
+        for row in rows:
+            node = (row['object_database'], row['object_name'])
+            ref = (row['ref_object_database'], row['ref_object_name'])
+            self._types[node] = row['object_type']
+            self._types.setdefault(ref, row['ref_object_type'])
+            refs = self._refs.setdefault(node, [])
+            if ref not in refs:
+                refs.append(ref)
+            self._dependents.setdefault(ref, set()).add(node)
+        self._base_tables = {}
+        self._dependencies = {}
+
+    @classmethod
+    def load(cls, doctor, host=None):
+        """Load the whole graph with a single query
+        Returns:
+            MVDependencyGraph: The graph, or None if sys.object_dependencies is unavailable
+        """
+        rows = doctor.execute_query("""
+            SELECT 
+                object_database,
+                object_name,
+                object_type,
+                ref_object_database,
+                ref_object_name,
+                ref_object_type
+            FROM sys.object_dependencies
+            WHERE object_type = 'MATERIALIZED_VIEW'
+        """, host=host)
+        if rows is None:
+            return None
+        return cls(rows)
+
+    def _is_mv(self, node):
+        return self._types.get(node) == 'MATERIALIZED_VIEW'
+
+    def base_tables(self, db_name, name):
+        """Transitive set of (database, name, type) base tables an MV reads"""
+        return self._resolve_base_tables((db_name, name), set())[0]
+
+    def _resolve_base_tables(self, node, in_progress):
+        """Base tables of node and the MVs still in progress at which the walk stopped
+        A result that stopped at an MV other than node itself misses that MV's
+        tables, so it is only memoized once nothing below depends on an ancestor.
+        """
+        if node in self._base_tables:
+            return self._base_tables[node], frozenset()
+        if node in in_progress:
+            return frozenset(), frozenset([node])  # Cycle
+        in_progress.add(node)
+        tables = set()
+        cuts = set()
+        for ref in self._refs.get(node, []):
+            if self._is_mv(ref):
+                ref_tables, ref_cuts = self._resolve_base_tables(ref, in_progress)
+                tables |= ref_tables
+                cuts |= ref_cuts
+            else:
+                tables.add((ref[0], ref[1], self._types.get(ref)))
+        in_progress.discard(node)
+        cuts.discard(node)
+        tables = frozenset(tables)
+        if not cuts:
+            self._base_tables[node] = tables
+        return tables, frozenset(cuts)
+
+    def dependencies(self, db_name, name):
+        """Nested dependencies of an MV, in the shape of _get_all_dependencies
+        Returns:
+            dict: 'base_tables' (transitive) and 'materialized_views' with their own dependencies
+        """
+        return self._resolve_dependencies((db_name, name), set())[0]
+
+    def _resolve_dependencies(self, node, in_progress):
+        """Nested dependencies of node and whether the walk stopped at a cycle
+        The nesting below an MV on a cycle depends on where the walk started,
+        so such results are not memoized.
+        """
+        if node in self._dependencies:
+            return self._dependencies[node], False
+        if node in in_progress:
+            return {}, True  # Prevent cycles
+        in_progress.add(node)
+        nested_mvs = []
+        cycle = False
+        for ref in self._refs.get(node, []):
+            if self._is_mv(ref):
+                ref_dependencies, ref_cycle = self._resolve_dependencies(ref, in_progress)
+                cycle = cycle or ref_cycle
+                nested_mvs.append({
+                    'database': ref[0],
+                    'name': ref[1],
+                    'type': self._types.get(ref),
+                    'dependencies': ref_dependencies
+                })
+        in_progress.discard(node)
+        dependencies = {
+            'base_tables': [{'database': db, 'name': name, 'type': ref_type}
+                            for db, name, ref_type in sorted(self.base_tables(*node), key=lambda t: (t[0], t[1]))],
+            'materialized_views': nested_mvs
+        }
+        if not cycle:
+            self._dependencies[node] = dependencies
+        return dependencies, cycle
+
+    def fan_in(self, db_name, name):
+        """Number of objects an MV reads directly"""
+        return len(self._refs.get((db_name, name), []))
+
+    def fan_out(self, db_name, name):
+        """Number of MVs reading an object directly"""
+        return len(self._dependents.get((db_name, name), ()))
+
+    def refresh_order(self):
+        """MVs in topological order, every MV after the MVs it reads
+        MVs on a dependency cycle cannot be ordered and are appended last.
+        Returns:
+            list: (database, name) tuples
+        """
+        mvs = {node for node in self._types if self._is_mv(node)}
+        pending = {mv: sum(1 for ref in self._refs.get(mv, []) if ref in mvs) for mv in mvs}
+        ready = [mv for mv, count in pending.items() if count == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            mv = heapq.heappop(ready)
+            order.append(mv)
+            for dependent in self._dependents.get(mv, ()):
+                if dependent in pending:
+                    pending[dependent] -= 1
+                    if pending[dependent] == 0:
+                        heapq.heappush(ready, dependent)
+        ordered = set(order)
+        order.extend(sorted(mv for mv in mvs if mv not in ordered))
+        return order
+
+class TabletSnapshot:
+    """Column-oriented snapshot of information_schema.be_tablets
+
+    The replicas are read with one streamed scan into NumPy int64 columns, so
+    the FE fans out to the BEs once and every tablet-level check is a
+    vectorized filter over the same arrays instead of another be_tablets join.
+    """
+    COLUMNS = ('TABLET_ID', 'TABLE_ID', 'PARTITION_ID', 'DATA_SIZE', 'NUM_ROWSET', 'BE_ID')
+
+    def __init__(self, columns, tables):
+        import numpy as np
+        self.columns = columns
+        self.tables = tables
+        # Only tablets whose table is in tables_config, like the inner joins did
+        self._known = np.isin(columns['TABLE_ID'], np.fromiter(tables, dtype=np.int64, count=len(tables)))
+
+    @classmethod
+    def load(cls, doctor, host=None, batch_size=10000):
+        """Scan be_tablets and tables_config once
+        Args:
+            doctor: StarRocksDoctor used for connections
+            host: Optional FE host to run on
+            batch_size: Rows fetched per round trip while streaming
+        Returns:
+            TabletSnapshot: The snapshot, or None if NumPy is missing or the scan failed
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            print("Warning: numpy is not installed, tablet checks fall back to per-check SQL")
+            return None
+
+        tables = doctor.execute_query(
+            "SELECT TABLE_ID, TABLE_SCHEMA, TABLE_NAME FROM information_schema.tables_config", host=host)
+        if tables is None:
+            return None
+
+        chunks = []
+        query = f"SELECT {', '.join(cls.COLUMNS)} FROM information_schema.be_tablets"
+        try:
+            with doctor.stream_query(query, host=host, batch_size=batch_size) as stream:
+                for rows in stream.batches():
+                    # float64 turns NULLs into NaN; ids stay exact below 2^53
+                    chunks.append(np.array(rows, dtype=np.float64))
+        except Error as e:
+            print(f"Error scanning information_schema.be_tablets: {e}")
+            return None
+
+        data = np.concatenate(chunks) if chunks else np.empty((0, len(cls.COLUMNS)))
+        data = np.nan_to_num(data).astype(np.int64)
+        columns = {name: np.ascontiguousarray(data[:, i]) for i, name in enumerate(cls.COLUMNS)}
+        return cls(columns, {int(t['TABLE_ID']): (t['TABLE_SCHEMA'], t['TABLE_NAME']) for t in tables})
+
+    def __len__(self):
+        return len(self.columns['TABLET_ID'])
+
+    def _iter_rows(self, mask, value_column, chunk_size=10000):
+        tablet_ids = self.columns['TABLET_ID'][mask]
+        table_ids = self.columns['TABLE_ID'][mask]
+        be_ids = self.columns['BE_ID'][mask]
+        values = self.columns[value_column][mask]
+        for start in range(0, len(tablet_ids), chunk_size):
+            end = start + chunk_size
+            for tablet_id, table_id, be_id, value in zip(tablet_ids[start:end].tolist(), table_ids[start:end].tolist(),
+                                                         be_ids[start:end].tolist(), values[start:end].tolist()):
+                db_name, table_name = self.tables[table_id]
+                # One row per replica, told apart by BE_ID
+                yield {'DB_NAME': db_name, 'TABLE_NAME': table_name,
+                       'TABLET_ID': tablet_id, 'BE_ID': be_id, value_column: value}
+
+    def iter_large_tablets(self, size_gb=5):
+        """Replicas larger than size_gb, same rows as check_large_tablets"""
+        return self._iter_rows(self._known & (self.columns['DATA_SIZE'] > size_gb * 1024 ** 3), 'DATA_SIZE')
+
+    def iter_tablets_with_many_versions(self, version_threshold=900):
+        """Replicas with more than version_threshold rowsets"""
+        return self._iter_rows(self._known & (self.columns['NUM_ROWSET'] > version_threshold), 'NUM_ROWSET')
+
+    def large_tablets(self, size_gb=5):
+        return list(self.iter_large_tablets(size_gb))
+
+    def tablets_with_many_versions(self, version_threshold=900):
+        return list(self.iter_tablets_with_many_versions(version_threshold))
+
+    def small_tablets(self, size_mb=500, limit=100):
+        """Tables ordered by their number of replicas smaller than size_mb"""
+        import numpy as np
+        mask = self._known & (self.columns['DATA_SIZE'] < size_mb * 1024 ** 2)
+        table_ids = self.columns['TABLE_ID'][mask]
+        tablet_ids = self.columns['TABLET_ID'][mask]
+        order = np.argsort(table_ids, kind='stable')
+        table_ids, tablet_ids = table_ids[order], tablet_ids[order]
+        unique_ids, starts, counts = np.unique(table_ids, return_index=True, return_counts=True)
+        top = np.argsort(-counts, kind='stable')[:limit]
+        result = []
+        for i in top.tolist():
+            db_name, table_name = self.tables[int(unique_ids[i])]
+            ids = tablet_ids[starts[i]:starts[i] + counts[i]]
+            result.append({'DB_NAME': db_name, 'TABLE_NAME': table_name,
+                           'small_tablet_count': int(counts[i]),
+                           'tablet_ids': ','.join(map(str, ids.tolist()))})
+        return result
+
+    def data_size_by_table(self):
+        """Total replica data size in bytes per (database, table)"""
+        import numpy as np
+        table_ids = self.columns['TABLE_ID'][self._known]
+        sizes = self.columns['DATA_SIZE'][self._known]
+        unique_ids, inverse = np.unique(table_ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=sizes, minlength=len(unique_ids))
+        return {self.tables[table_id]: int(total) for table_id, total in zip(unique_ids.tolist(), totals.tolist())}
+
+# Runs on the node via `bash -s`: print the lines of a log (and, with a start
+# time or a checkpoint, its rotated and gzipped siblings) that fall in a time
+# window and match a pattern, gzip-compressed on stdout.
+# Args: base_path style(fe|be) pattern ignore_case(i|-) since_key until_key since_epoch
+#       [prev_inode prev_offset prev_time record_checkpoint(1|-) prev_head]
+# With record_checkpoint, "CHECKPOINT <inode> <offset> <now> <head>" for the
+# current file is written to stderr, head being the cksum of its first 4 KB (or
+# of everything read, if less). The next run passes it back as prev_* and only
+# reads what was appended: it follows the old inode if the log was rotated, and
+# recognises the old file by its head once it was compressed or copied.
+REMOTE_LOG_WINDOW_SCRIPT = r"""
+base=$1; style=$2; pattern=$3; since_key=$5; until_key=$6; since_epoch=$7
+prev_inode=${8:-0}; prev_offset=${9:-0}; prev_time=${10:-0}; record=${11:--}; prev_head=${12:--}
+head_len=$prev_offset; [ "$head_len" -gt 4096 ] && head_len=4096
+grep_opts=-E; [ "$4" = i ] && grep_opts=-iE
+keyfn='
+function key(line,   d) {
+    if (style == "fe") {
+        if (line !~ /^[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]/) return ""
+        d = substr(line, 1, 19)
+    } else if (line ~ /^[IWEF][0-9][0-9][0-9][0-9][0-9][0-9][0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]/) {
+        d = substr(line, 2, 8) substr(line, 11, 8)
+    } else if (line ~ /^[IWEF][0-9][0-9][0-9][0-9] [0-9][0-9]:[0-9][0-9]:[0-9][0-9]/) {
+        d = substr(since, 1, 4) substr(line, 2, 4) substr(line, 7, 8)
+    } else {
+        return ""
+    }
+    gsub(/[^0-9]/, "", d)
+    return d
+}'
+
+# Binary search for a byte offset before the first line at or after since_key
+seek_offset() {
+    local f=$1 lo=0 hi mid k
+    [ "$since_key" = "0" ] && { echo 0; return; }
+    hi=$(stat -L -c %s "$f")
+    while [ $((hi - lo)) -gt 1048576 ]; do
+        mid=$(((lo + hi) / 2))
+        k=$(tail -c +$((mid + 1)) "$f" | head -c 1048576 |
+            awk -v style="$style" -v since="$since_key" "$keyfn"'
+                NR > 1 { k = key($0); if (k != "") { print k; exit } }')
+        if [ -z "$k" ] || [ "$k" \> "$since_key" ] || [ "$k" = "$since_key" ]; then
+            hi=$mid
+        else
+            lo=$mid
+        fi
+    done
+    echo $lo
+}
+
+# cksum of the first n bytes of stdin
+head_sum() {
+    head -c "$1" | cksum | cut -d' ' -f1
+}
+
+# Whether stdin starts like the file the checkpoint was taken on
+is_previous() {
+    [ "$prev_head" != "-" ] && [ "$head_len" -gt 0 ] && [ "$(head_sum "$head_len")" = "$prev_head" ]
+}
+
+# Offset just past the last complete line in [start, end), so a line still
+# being written is left for the next run
+complete_end() {
+    local f=$1 start=$2 end=$3 from partial
+    [ "$end" -le "$start" ] && { echo "$start"; return; }
+    [ "$(tail -c +$end "$f" | head -c 1 | od -An -tu1 | tr -d ' ')" = 10 ] && { echo "$end"; return; }
+    from=$((end - 1048576)); [ $from -lt $start ] && from=$start
+    partial=$(tail -c +$((from + 1)) "$f" | head -c $((end - from)) | tail -n 1 | wc -c)
+    echo $((end - partial))
+}
+
+# Lines of a file that fall in the window. Lines without a timestamp (stack
+# traces, continued messages) belong to the line before them; at the start of
+# a read they are kept when there is no window start or the read resumes
+# where the previous run stopped, since then they were not read before.
+read_file() {
+    local f=$1 inode size start end n inwin=0
+    [ "$since_key" = "0" ] && inwin=1
+    case "$f" in *.gz)
+        # A compressed copy of the file the checkpoint was taken on was read up to prev_offset
+        if zcat "$f" 2>/dev/null | is_previous; then
+            zcat "$f" | tail -c +$((prev_offset + 1)) | window 1
+        else
+            zcat "$f" | window $inwin
+        fi
+        return ;;
+    esac
+    read -r inode size <<< "$(stat -c '%i %s' "$f")" || return
+    if [ "$size" -ge "$prev_offset" ] && { [ "$inode" = "$prev_inode" ] || is_previous < "$f"; }; then
+        start=$prev_offset
+        inwin=1
+    else
+        start=$(seek_offset "$f")
+    fi
+    end=$size
+    if [ "$f" = "$current" ] && [ "$record" = 1 ]; then
+        end=$(complete_end "$f" "$start" "$size")
+        n=$end; [ "$n" -gt 4096 ] && n=4096
+        echo "CHECKPOINT $inode $end $(date +%s) $(head_sum $n < "$f")" >&2
+    fi
+    tail -c +$((start + 1)) "$f" | head -c $((end - start)) | window $inwin
+}
+
+window() {
+    awk -v style="$style" -v since="$since_key" -v until="$until_key" -v inwin="$1" "$keyfn"'
+        { k = key($0); if (k != "") { if (k > until) exit; inwin = (k >= since) } }
+        inwin { print }'
+}
+
+current=$(readlink -f "$base" 2>/dev/null || echo "$base")
+if [ "$prev_time" != "0" ]; then
+    min_mtime=$prev_time
+elif [ "$since_key" != "0" ]; then
+    min_mtime=$since_epoch
+else
+    min_mtime=
+fi
+
+if [ -z "$min_mtime" ]; then
+    files=$current
+    label=
+else
+    # Oldest first and the current file last; skip the glog symlink and files
+    # not written since the window start or the previous run
+    files="$(ls -tr "$base" "$base".* 2>/dev/null | while read -r f; do
+        [ -L "$f" ] && continue
+        [ "$f" = "$current" ] && continue
+        [ "$(stat -c %Y "$f")" -lt "$min_mtime" ] && continue
+        echo "$f"
+    done) $current"
+    label=1
+fi
+
+for f in $files; do
+    if [ ! -e "$f" ]; then
+        echo "$f: No such file or directory" >&2
+        continue
+    fi
+    read_file "$f" | grep $grep_opts -- "$pattern" | if [ -n "$label" ]; then sed "1i ==> $f <=="; else cat; fi
+done | gzip -1 -c
+"""
+
+class ThreadStackProfile:
+    """Thread stacks from BE stack dumps, collapsed into distinct stacks with counts
+
+    A BE dump lists every thread, and on a large BE most of them are idle
+    workers with the same stack. Threads are parsed into frame tuples and
+    counted per (BE, thread name, stack), so many samples of many BEs keep
+    only the distinct stacks in memory.
+    """
+    # 'tid: 123, name: pip_exec' from get_stack_trace_for_all_threads, or gdb/pstack 'Thread 5 (...):'
+    THREAD_HEADER = re.compile(r'^\s*(?:tid:\s*\d+(?:,\s*name:\s*(?P<name>.*?))?|Thread\s+\d+\s*\(.*\)):?\s*$', re.I)
+    FRAME = re.compile(r'^\s*#?\d+#?\s+(?P<frame>\S.*?)\s*$')
+    # Frames near the top of a thread that is waiting for work rather than running
+    IDLE_FRAME = re.compile(r'pthread_cond_(?:timed)?wait|epoll_wait|nanosleep|usleep|\bsleep\b|\bpoll\b|'
+                            r'\bselect\b|sem_wait|sigwait|\baccept\b|futex_wait|bthread::TaskGroup::wait_task')
+
+    def __init__(self):
+        self.counts = {}
+
+    @classmethod
+    def _normalize_frame(cls, frame):
+        # Addresses and gdb argument values differ between threads running the same code
+        frame = re.sub(r'0x[0-9a-fA-F]+', '', frame)
+        frame = re.sub(r'^\s*in\s+', '', frame)
+        frame = re.sub(r' \(.*?\)(?= at | from |$)', '', frame)
+        frame = re.sub(r'\s+from\s+\S+$', '', frame)
+        frame = ' '.join(frame.split()).replace(';', ':')
+        return frame or '??'
+
+    @classmethod
+    def parse(cls, text):
+        """Split a stack dump into threads
+        Args:
+            text: Output of get_stack_trace_for_all_threads, or of gdb/pstack
+        Returns:
+            list: (thread name, frames) tuples, innermost frame first
+        """
+        threads = []
+        name, frames = None, None
+        for line in text.splitlines():
+            header = cls.THREAD_HEADER.match(line)
+            if header:
+                if frames:
+                    threads.append((name, tuple(frames)))
+                quoted = re.search(r'"([^"]+)"', line)
+                name = header.group('name') or (quoted.group(1) if quoted else 'thread')
+                # Pools number their threads (brpc_worker_12); one name per pool
+                name = re.sub(r'[-_]?\d+$', '', name.strip()) or name.strip()
+                frames = []
+                continue
+            frame = cls.FRAME.match(line)
+            if frame and frames is not None:
+                frames.append(cls._normalize_frame(frame.group('frame')))
+        if frames:
+            threads.append((name, tuple(frames)))
+        return threads
+
+    def add(self, be_ip, threads):
+        """Count the threads of one dump of be_ip"""
+        for name, frames in threads:
+            key = (be_ip, name, frames)
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    @classmethod
+    def is_idle(cls, frames):
+        return any(cls.IDLE_FRAME.search(frame) for frame in frames[:3])
+
+    def report(self):
+        """Distinct stacks, most frequent first
+        Returns:
+            dict: Thread and distinct stack totals, and per stack its count, whether it
+            is idle, the thread names and BEs it was seen on and its frames (innermost first)
+        """
+        stacks = {}
+        for (be_ip, name, frames), count in self.counts.items():
+            stack = stacks.setdefault(frames, {'count': 0, 'idle': self.is_idle(frames),
+                                               'thread_names': {}, 'backends': {}})
+            stack['count'] += count
+            stack['thread_names'][name] = stack['thread_names'].get(name, 0) + count
+            stack['backends'][be_ip] = stack['backends'].get(be_ip, 0) + count
+        ordered = []
+        for frames, stack in sorted(stacks.items(), key=lambda item: -item[1]['count']):
+            stack['frames'] = list(frames)
+            ordered.append(stack)
+        return {
+            'threads': sum(self.counts.values()),
+            'idle_threads': sum(stack['count'] for stack in ordered if stack['idle']),
+            'distinct_stacks': len(ordered),
+            'stacks': ordered
+        }
+
+    def folded(self):
+        """Lines in folded-stack format (BE;thread;outermost;...;innermost count) for flame graph tools"""
+        for (be_ip, name, frames), count in sorted(self.counts.items(), key=lambda item: -item[1]):
+            yield f"{be_ip};{name};{';'.join(reversed(frames))} {count}"
+
+class RemoteSession:
+    """SSH session to one node, multiplexed over a single connection
+
+    The first command opens an OpenSSH ControlMaster; every later command and
+    file transfer reuses it, so a node costs one handshake instead of one per
+    step. close() shuts the master down.
+    """
+    def __init__(self, host, ssh_port=22, control_dir=None, timeout=60, tracer=None):
+        self.host = host
+        self.ssh_port = ssh_port
+        self.timeout = timeout
+        self.control_dir = control_dir or tempfile.gettempdir()
+        self.tracer = tracer
+
+    def _ssh_command(self, *args):
+        return [
+            'ssh', '-p', str(self.ssh_port),
+            '-o', 'StrictHostKeyChecking=no',
+            '-o', 'UserKnownHostsFile=/dev/null',
+            '-o', 'LogLevel=ERROR',
+            '-o', 'ControlMaster=auto',
+            '-o', f"ControlPath={os.path.join(self.control_dir, '%C')}",
+            '-o', 'ControlPersist=60',
+        ] + list(args)
+
+    def run(self, cmd, timeout=None):
+        """Run a command on the node
+        Returns:
+            subprocess.CompletedProcess: Result with text stdout and stderr
+        """
+        with trace_span(self.tracer, 'ssh', 'ssh', host=self.host, command=cmd[:200]):
+            return subprocess.run(self._ssh_command(self.host, cmd), check=False, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE, universal_newlines=True, timeout=timeout or self.timeout)
+
+    def run_to_file(self, cmd, local_path, timeout=None):
+        """Run a command on the node and stream its stdout into local_path
+        Returns:
+            subprocess.CompletedProcess: Result with stderr as text
+        """
+        with trace_span(self.tracer, 'ssh', 'ssh', host=self.host, command=cmd[:200]), open(local_path, 'wb') as f:
+            result = subprocess.run(self._ssh_command(self.host, cmd), check=False, stdout=f,
+                                    stderr=subprocess.PIPE, timeout=timeout or self.timeout)
+        result.stderr = result.stderr.decode('utf-8', 'replace')
+        return result
+
+    def run_script_to_gzip_file(self, script, args, local_path, timeout=None):
+        """Feed script to `bash -s` on the node and save its gzip stdout decompressed
+        The output crosses the network compressed and is inflated while it is
+        copied into local_path.
+        Returns:
+            subprocess.CompletedProcess: Result with stderr as text
+        """
+        cmd = 'bash -s -- ' + ' '.join(shlex.quote(str(arg)) for arg in args)
+        compressed_path = local_path + '.gz'
+        with trace_span(self.tracer, 'ssh', 'ssh', host=self.host, command=cmd[:200]), \
+                open(compressed_path, 'wb') as f:
+            result = subprocess.run(self._ssh_command(self.host, cmd), input=script.encode(), check=False,
+                                    stdout=f, stderr=subprocess.PIPE, timeout=timeout or self.timeout)
+        result.stderr = result.stderr.decode('utf-8', 'replace')
+        try:
+            with gzip.open(compressed_path, 'rb') as src, open(local_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        except (OSError, EOFError) as e:
+            result.stderr += f"\nCould not decompress output: {e}"
+        finally:
+            os.remove(compressed_path)
+        return result
+
+    def close(self):
+        """Stop the master connection if one was opened"""
+        try:
+            subprocess.run(self._ssh_command('-O', 'exit', self.host), stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, timeout=10)
+        except (OSError, subprocess.SubprocessError):
+            pass
+
+class LogCheckpointStore:
+    """Per-node log read positions kept between remote_diagnostics runs
+
+    Stored as JSON keyed by 'host|log path' with the file inode, the byte
+    offset read up to, the node's clock at that time and a checksum of the
+    start of the file, which identifies it after it is rotated and compressed.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._checkpoints = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._checkpoints = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read checkpoints from {path}, starting over: {e}")
+
+    def get(self, host, log_file):
+        with self._lock:
+            return self._checkpoints.get(f"{host}|{log_file}")
+
+    def update(self, host, log_file, inode, offset, node_time, head=None):
+        with self._lock:
+            self._checkpoints[f"{host}|{log_file}"] = {'inode': inode, 'offset': offset, 'time': node_time,
+                                                      'head': head}
+
+    def save(self):
+        """Write the checkpoints atomically"""
+        with self._lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self._checkpoints, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+class QueryProfiler:
+    """Per-statement cost of the SQL sent by the doctor
+
+    Every statement is recorded with its wall time, rows returned, approximate
+    result bytes (length of the values as text), target FE and the module that
+    issued it. The module is tracked per thread; worker threads started by the
+    doctor inherit the module of the thread that started them through bind().
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.calls = []
+
+    def current_module(self):
+        return getattr(self._local, 'module', None)
+
+    @contextmanager
+    def module(self, name):
+        """Attribute the statements run by this thread to module name"""
+        previous = self.current_module()
+        self._local.module = name
+        try:
+            yield
+        finally:
+            self._local.module = previous
+
+    def bind(self, func):
+        """Wrap func so it runs under the caller's module in another thread"""
+        name = self.current_module()
+
+        def bound(*args, **kwargs):
+            with self.module(name):
+                return func(*args, **kwargs)
+        return bound
+
+    @staticmethod
+    def approx_bytes(rows):
+        return sum(len(str(value)) for row in rows
+                   for value in (row.values() if isinstance(row, dict) else row) if value is not None)
+
+    @contextmanager
+    def measure(self, statement, host):
+        """Time a statement; the caller adds 'rows' and 'bytes' to the yielded dict"""
+        call = {'rows': 0, 'bytes': 0}
+        error = None
+        start = time.monotonic()
+        try:
+            yield call
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            call.update(
+                statement=' '.join(statement.split()),
+                host=host,
+                module=self.current_module(),
+                elapsed_s=time.monotonic() - start,
+                error=error
+            )
+            with self._lock:
+                self.calls.append(call)
+
+    def report(self, top_n=20):
+        """Summarize the recorded statements
+        Returns:
+            dict: Totals, per-module and per-FE round trips and time, the most
+            expensive statement texts and the slowest single calls
+        """
+        with self._lock:
+            calls = list(self.calls)
+
+        def summarize(key):
+            groups = {}
+            for call in calls:
+                group = groups.setdefault(key(call), {'round_trips': 0, 'total_s': 0.0, 'rows': 0, 'bytes': 0, 'errors': 0})
+                group['round_trips'] += 1
+                group['total_s'] += call['elapsed_s']
+                group['rows'] += call['rows']
+                group['bytes'] += call['bytes']
+                group['errors'] += 1 if call['error'] else 0
+            for group in groups.values():
+                group['total_s'] = round(group['total_s'], 3)
+            return dict(sorted(groups.items(), key=lambda item: item[1]['total_s'], reverse=True))
+
+        slowest = sorted(calls, key=lambda call: call['elapsed_s'], reverse=True)[:top_n]
+        statements = summarize(lambda call: call['statement'][:200])
+        return {
+            'round_trips': len(calls),
+            'total_s': round(sum(call['elapsed_s'] for call in calls), 3),
+            'by_module': summarize(lambda call: call['module'] or '(none)'),
+            'by_fe': summarize(lambda call: call['host'] or '(unknown)'),
+            'top_statements': [dict(statement=statement, **group)
+                               for statement, group in list(statements.items())[:top_n]],
+            'slowest_calls': [dict(call, elapsed_s=round(call['elapsed_s'], 3)) for call in slowest]
+        }
+
+class Tracer:
+    """Nested timing spans for one doctor run, exported as a Chrome trace or OTLP JSON
+
+    Spans nest per thread (run -> module -> fan-out -> query or SSH command).
+    Worker threads continue the span of the thread that started them through
+    bind(), so their work shows up under the right parent.
+    """
+    def __init__(self, service_name='starrocks-doctor'):
+        self.service_name = service_name
+        self.trace_id = os.urandom(16).hex()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._threads = {}
+        self.spans = []
+        # Wall clock at start plus a monotonic offset, so spans are ordered even if the clock jumps
+        self._wall_start = time.time()
+        self._perf_start = time.perf_counter()
+
+    def _now(self):
+        return self._wall_start + (time.perf_counter() - self._perf_start)
+
+    def current_span(self):
+        return getattr(self._local, 'span', None)
+
+    @contextmanager
+    def span(self, name, category, **attrs):
+        """Time a block as a child of the current span
+        Yields:
+            dict: The span; attributes can be added to its 'attrs'
+        """
+        parent = self.current_span()
+        thread = threading.current_thread()
+        span = {
+            'name': name,
+            'category': category,
+            'span_id': os.urandom(8).hex(),
+            'parent_id': parent['span_id'] if parent else None,
+            'thread_id': thread.ident,
+            'attrs': attrs,
+            'start': self._now(),
+            'error': None
+        }
+        self._local.span = span
+        try:
+            yield span
+        except Exception as e:
+            span['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span['end'] = self._now()
+            self._local.span = parent
+            with self._lock:
+                self._threads.setdefault(thread.ident, thread.name)
+                self.spans.append(span)
+
+    def bind(self, func):
+        """Wrap func so it runs as a child of the caller's current span in another thread"""
+        parent = self.current_span()
+
+        def bound(*args, **kwargs):
+            previous = self.current_span()
+            self._local.span = parent
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.span = previous
+        return bound
+
+    def chrome_trace(self):
+        """Trace Event Format, loadable in chrome://tracing and Perfetto"""
+        with self._lock:
+            spans = list(self.spans)
+            threads = dict(self._threads)
+        tids = {ident: i + 1 for i, ident in enumerate(threads)}
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tids[ident], 'args': {'name': name}}
+                  for ident, name in threads.items()]
+        for span in sorted(spans, key=lambda span: span['start']):
+            args = dict(span['attrs'])
+            if span['error']:
+                args['error'] = span['error']
+            events.append({
+                'name': span['name'],
+                'cat': span['category'],
+                'ph': 'X',
+                'ts': round((span['start'] - self._wall_start) * 1e6, 1),
+                'dur': round((span['end'] - span['start']) * 1e6, 1),
+                'pid': 1,
+                'tid': tids[span['thread_id']],
+                'args': args
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms',
+                'otherData': {'service': self.service_name, 'start': datetime.fromtimestamp(self._wall_start).isoformat()}}
+
+    def otlp(self):
+        """OTLP/JSON ExportTraceServiceRequest, as accepted by an OpenTelemetry collector"""
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {'key': key, 'value': {'boolValue': value}}
+            if isinstance(value, int):
+                return {'key': key, 'value': {'intValue': str(value)}}
+            if isinstance(value, float):
+                return {'key': key, 'value': {'doubleValue': value}}
+            return {'key': key, 'value': {'stringValue': str(value)}}
+
+        with self._lock:
+            spans = list(self.spans)
+        otlp_spans = []
+        for span in sorted(spans, key=lambda span: span['start']):
+            otlp_span = {
+                'traceId': self.trace_id,
+                'spanId': span['span_id'],
+                'name': span['name'],
+                'kind': 1,
+                'startTimeUnixNano': str(int(span['start'] * 1e9)),
+                'endTimeUnixNano': str(int(span['end'] * 1e9)),
+                'attributes': [attribute('category', span['category'])] +
+                              [attribute(key, value) for key, value in span['attrs'].items() if value is not None],
+                'status': {'code': 2, 'message': span['error']} if span['error'] else {'code': 1}
+            }
+            if span['parent_id']:
+                otlp_span['parentSpanId'] = span['parent_id']
+            otlp_spans.append(otlp_span)
+        return {'resourceSpans': [{
+            'resource': {'attributes': [attribute('service.name', self.service_name)]},
+            'scopeSpans': [{'scope': {'name': self.service_name}, 'spans': otlp_spans}]
+        }]}
+
+    def write(self, path, format='chrome'):
+        """Write the trace to path
+        Args:
+            format: 'chrome' (Trace Event Format) or 'otlp' (OTLP/JSON)
+        """
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace() if format == 'chrome' else self.otlp(), f, cls=DateTimeEncoder)
+
+@contextmanager
+def trace_span(tracer, name, category, **attrs):
+    """tracer.span() when tracing is on, otherwise a no-op yielding None"""
+    if tracer is None:
+        yield None
+    else:
+        with tracer.span(name, category, **attrs) as span:
+            yield span
+
+class WatchSampler:
+    """Re-run cheap checks on a schedule and append what changed to a JSONL timeline
+
+    Each check returns rows keyed by a natural key (database, query id, tablet
+    replica, backend id). The first sample of a run is written in full as a
+    'snapshot' event, later samples only as 'delta' events listing the rows
+    that were added or removed and the fields that changed. Samples where
+    nothing changed write nothing.
+    """
+    # name -> (sampler method, key of a row, fields that change on every sample)
+    CHECKS = {
+        'statistic': ('_sample_statistic', lambda row: row['DbName'], ()),
+        'current_queries': ('_sample_current_queries', lambda row: f"{row.get('fe_host')}|{row.get('QueryId')}",
+                            ('ExecTime',)),
+        # One row per replica
+        'tablet_versions': ('_sample_tablet_versions', lambda row: f"{row['TABLET_ID']}|{row.get('BE_ID')}", ()),
+        'backends': ('_sample_backends', lambda row: row['BackendId'], ('LastHeartbeat', 'LastUpdateMs')),
+    }
+
+    def __init__(self, doctor, checks, timeline_path, version_threshold=900):
+        self.doctor = doctor
+        self.checks = checks
+        self.timeline_path = timeline_path
+        self.version_threshold = version_threshold
+        self._previous = {}
+        self.samples = 0
+
+    def _sample_statistic(self):
+        return [dict(stats, DbName=db_name) for db_name, stats in self.doctor.get_proc_statistic().items()]
+
+    def _sample_current_queries(self):
+        return self.doctor.get_current_queries()
+
+    def _sample_tablet_versions(self):
+        # Re-scan be_tablets instead of serving the snapshot from the previous sample
+        self.doctor.get_tablet_snapshot(refresh=True)
+        return self.doctor.check_tablets_with_many_versions(self.version_threshold)
+
+    def _sample_backends(self):
+        self.doctor.topology.invalidate()
+        return self.doctor.topology.backends()
+
+    @staticmethod
+    def diff(previous, current, ignore=()):
+        """Compare two {key: row} samples
+        Returns:
+            dict: 'added' and 'removed' rows, 'changed' as {key, fields: {field: [old, new]}}
+        """
+        delta = {
+            'added': [row for key, row in current.items() if key not in previous],
+            'removed': [row for key, row in previous.items() if key not in current],
+            'changed': []
+        }
+        for key, row in current.items():
+            old = previous.get(key)
+            if old is None:
+                continue
+            fields = {field: [old.get(field), value] for field, value in row.items()
+                      if field not in ignore and old.get(field) != value}
+            fields.update({field: [value, None] for field, value in old.items()
+                           if field not in ignore and field not in row})
+            if fields:
+                delta['changed'].append({'key': key, 'fields': fields})
+        return delta
+
+    def sample(self):
+        """Run every check once and append its snapshot or delta to the timeline
+        Returns:
+            int: Number of events written
+        """
+        sampled_at = datetime.now()
+        events = []
+        for name in self.checks:
+            method, key_of, ignore = self.CHECKS[name]
+            start = time.monotonic()
+            try:
+                with trace_span(self.doctor.tracer, f"watch.{name}", 'module'):
+                    if self.doctor.profiler is None:
+                        rows = getattr(self, method)()
+                    else:
+                        with self.doctor.profiler.module(f"watch.{name}"):
+                            rows = getattr(self, method)()
+                if rows is None:
+                    raise RuntimeError('query failed')
+                current = {str(key_of(row)): row for row in rows}
+            except Exception as e:
+                # Keep the previous sample so the next delta is against the last good one
+                events.append({'time': sampled_at, 'check': name, 'type': 'error', 'error': str(e)})
+                continue
+            event = {'time': sampled_at, 'check': name, 'elapsed_s': round(time.monotonic() - start, 3)}
+            if name not in self._previous:
+                event.update(type='snapshot', rows=list(current.values()))
+                events.append(event)
+            else:
+                delta = self.diff(self._previous[name], current, ignore)
+                if any(delta.values()):
+                    event.update(type='delta', **delta)
+                    events.append(event)
+            self._previous[name] = current
+
+        with open(self.timeline_path, 'a') as f:
+            for event in events:
+                f.write(json.dumps(event, cls=DateTimeEncoder) + '\n')
+        self.samples += 1
+        return len(events)
+
+    def run(self, interval, count=0):
+        """Sample every interval seconds until count samples are taken (0 = until interrupted)"""
+        next_run = time.monotonic()
+        try:
+            while not count or self.samples < count:
+                written = self.sample()
+                print(f"{datetime.now():%Y-%m-%d %H:%M:%S} sample {self.samples}: {written} event(s) -> {self.timeline_path}")
+                if count and self.samples >= count:
+                    break
+                # Keep a fixed schedule; a sample that overruns starts the next one right away
+                next_run += interval
+                time.sleep(max(0, next_run - time.monotonic()))
+                next_run = max(next_run, time.monotonic())
+        except KeyboardInterrupt:
+            print(f"Stopped after {self.samples} sample(s)")
+
+class RunHistoryStore:
+    """SQLite store of doctor results across runs
+
+    Every saved result is flattened into rows tagged with the run and indexed
+    by its natural key (dataset, section, db, table, partition, tablet, BE,
+    name), so two runs are compared with keyed joins and trend questions are
+    indexed range scans instead of re-reading old output files. Version
+    counts, sizes in bytes and config values are kept in their own columns.
+    """
+    # seq numbers rows of one result that share all other key columns. Such keys are
+    # ambiguous: the rows are stored but left out of diff instead of being matched by position
+    KEY_COLUMNS = ('dataset', 'section', 'db', 'tbl', 'partition_name', 'tablet', 'be', 'name', 'seq')
+    # Row fields that fill a key column when the result layout does not
+    ROW_KEYS = {
+        'section': ('check',),
+        'db': ('DB_NAME', 'TABLE_SCHEMA', 'DbName', 'database_name', 'db'),
+        'tbl': ('TABLE_NAME', 'TableName', 'table_name'),
+        'partition_name': ('PARTITION_NAME', 'PartitionName'),
+        'tablet': ('TABLET_ID', 'TabletId'),
+        'be': ('BE_ID', 'BackendId', 'be_id'),
+        'name': ('VARIABLE_NAME', 'Key', 'NAME', 'queryId', 'QueryId', 'name', 'IP', 'Id'),
+    }
+    VERSION_FIELDS = ('NUM_ROWSET', 'VersionCount', 'NUM_VERSION')
+    SIZE_FIELDS = ('DATA_SIZE', 'DataSize')
+    VALUE_FIELDS = ('current_value', 'value', 'VALUE', 'VARIABLE_VALUE')
+    CONFIG_DATASETS = ('modified_be_configs', 'fe_configs', 'modified_session_variables', 'all_configurations')
+    # Results whose innermost dicts map a key (host) to a value rather than describe one record
+    MAPPING_DATASETS = ('log_paths', 'backend_host_id_mapping')
+    # Run bookkeeping rather than cluster data
+    SKIP_DATASETS = ('manifest', 'query_profile')
+
+    def __init__(self, path):
+        import sqlite3
+        self.path = path
+        self._lock = threading.Lock()
+        self.run_id = None
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(f"""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cluster_id TEXT NOT NULL,
+                host TEXT,
+                started TEXT NOT NULL,
+                finished TEXT,
+                modules TEXT
+            );
+            CREATE INDEX IF NOT EXISTS runs_cluster ON runs (cluster_id, started);
+            CREATE TABLE IF NOT EXISTS rows (
+                run_id INTEGER NOT NULL,
+                {' '.join(f"{column} TEXT NOT NULL DEFAULT ''," for column in self.KEY_COLUMNS)}
+                versions INTEGER,
+                size_bytes INTEGER,
+                value TEXT,
+                data TEXT
+            );
+            CREATE INDEX IF NOT EXISTS rows_key ON rows ({', '.join(self.KEY_COLUMNS)}, run_id);
+            CREATE INDEX IF NOT EXISTS rows_run ON rows (run_id, dataset);
+            CREATE INDEX IF NOT EXISTS rows_tablet ON rows (tablet, run_id) WHERE tablet != '';
+            CREATE INDEX IF NOT EXISTS rows_versions ON rows (versions, run_id) WHERE versions IS NOT NULL;
+            CREATE INDEX IF NOT EXISTS rows_table ON rows (db, tbl, run_id) WHERE tbl != '';
+            CREATE INDEX IF NOT EXISTS rows_be ON rows (be, run_id) WHERE be != '';
+        """)
+
+    def close(self):
+        self._db.close()
+
+    def start_run(self, cluster_id, host, modules):
+        """Register a new run; later ingests are tagged with it"""
+        with self._lock, self._db:
+            cursor = self._db.execute('INSERT INTO runs (cluster_id, host, started, modules) VALUES (?, ?, ?, ?)',
+                                      (str(cluster_id), host, datetime.now().isoformat(sep=' ', timespec='seconds'),
+                                       ','.join(modules)))
+            self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def finish_run(self):
+        with self._lock, self._db:
+            self._db.execute('UPDATE runs SET finished = ? WHERE run_id = ?',
+                             (datetime.now().isoformat(sep=' ', timespec='seconds'), self.run_id))
+
+    @staticmethod
+    def _path_columns(dataset, path):
+        """Key columns that the nesting levels of a result stand for"""
+        if dataset in ('table_info', 'materialized_view_info'):
+            return ('db', 'tbl', 'section')
+        if dataset == 'modified_be_configs':
+            return ('be', 'name')
+        if dataset in ('fe_configs', 'modified_session_variables'):
+            return ('name',)
+        if dataset == 'backend_host_id_mapping':
+            return ('be',)
+        if dataset == 'all_configurations':
+            return ('section', 'be', 'name') if path[:1] == ('be_configs',) else ('section', 'name')
+        if dataset == 'log_paths':
+            return ('section', 'be')
+        if dataset == 'tablet_metadata' and path[:1] and path[0].isdigit():
+            # --name output, keyed by tablet id
+            return ('tablet', 'section')
+        return ('section',)
+
+    def _record(self, dataset, path, row, seen):
+        key = dict.fromkeys(self.KEY_COLUMNS, '')
+        key['dataset'] = dataset
+        columns = self._path_columns(dataset, path)
+        extra = []
+        for i, part in enumerate(path):
+            if i < len(columns) and not key[columns[i]]:
+                key[columns[i]] = part
+            else:
+                extra.append(part)
+        if extra:
+            key['section'] = '/'.join(filter(None, [key['section']] + extra))
+        for column, fields in self.ROW_KEYS.items():
+            if not key[column]:
+                key[column] = next((str(row[field]) for field in fields if row.get(field) is not None), '')
+        natural_key = tuple(key.values())
+        seen[natural_key] = seen.get(natural_key, -1) + 1
+        key['seq'] = str(seen[natural_key]) if seen[natural_key] else ''
+
+        versions = next((row[field] for field in self.VERSION_FIELDS if row.get(field) is not None), None)
+        size = next((row[field] for field in self.SIZE_FIELDS if row.get(field) is not None), None)
+        if isinstance(size, str):
+            size = size_to_bytes(size)
+        value = next((row[field] for field in self.VALUE_FIELDS if field in row), None)
+        try:
+            versions = int(versions) if versions is not None else None
+        except (TypeError, ValueError):
+            versions = None
+        return (self.run_id,) + tuple(key[column] for column in self.KEY_COLUMNS) + (
+            versions, size, None if value is None else str(value), json.dumps(row, cls=DateTimeEncoder, sort_keys=True))
+
+    def _flatten(self, data, path=(), expand=False):
+        """Yield (path, row) for every record in a nested result
+        Args:
+            expand: Store every scalar of a dict as its own row keyed by its key
+        """
+        def nested(value):
+            return isinstance(value, dict) or (isinstance(value, list) and any(isinstance(v, dict) for v in value))
+
+        if isinstance(data, list):
+            for row in data:
+                if isinstance(row, dict):
+                    yield from self._flatten(row, path, expand)
+                else:
+                    yield path, {'value': row}
+        elif isinstance(data, dict):
+            scalars = {key: value for key, value in data.items() if not nested(value)}
+            if scalars and path and not expand:
+                yield path, scalars
+            elif scalars:
+                for key, value in scalars.items():
+                    yield path + (str(key),), {'value': value}
+            for key, value in data.items():
+                if nested(value):
+                    yield from self._flatten(value, path + (str(key),), expand)
+        elif data is not None:
+            yield path, {'value': data}
+
+    def _insert(self, records, batch_size=5000):
+        insert = f"INSERT INTO rows (run_id, {', '.join(self.KEY_COLUMNS)}, versions, size_bytes, value, data) " \
+                 f"VALUES ({', '.join('?' * (len(self.KEY_COLUMNS) + 5))})"
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                with self._lock, self._db:
+                    self._db.executemany(insert, batch)
+                batch = []
+        if batch:
+            with self._lock, self._db:
+                self._db.executemany(insert, batch)
+
+    @staticmethod
+    def _warn_duplicates(dataset, seen):
+        duplicates = sum(1 for count in seen.values() if count)
+        if duplicates:
+            print(f"Warning: {duplicates} keys of {dataset} occur more than once in this run; "
+                  f"their rows are stored but left out of diff")
+
+    def ingest(self, dataset, data):
+        """Store a whole result (dict or list) of the current run"""
+        if self.run_id is not None and dataset not in self.SKIP_DATASETS:
+            seen = {}
+            self._insert(self._record(dataset, path, row, seen)
+                         for path, row in self._flatten(data, expand=dataset in self.MAPPING_DATASETS))
+            self._warn_duplicates(dataset, seen)
+
+    def record_rows(self, dataset, rows, section=''):
+        """Pass rows through while storing them in batches"""
+        return self.record_pairs(dataset, ((section, row) for row in rows))
+
+    def record_pairs(self, dataset, pairs, batch_size=5000):
+        """Pass (key, row) pairs through while storing them in batches; key is the first path level"""
+        if self.run_id is None:
+            yield from pairs
+            return
+        batch = []
+        seen = {}
+        for key, row in pairs:
+            batch.append((key, row))
+            if len(batch) >= batch_size:
+                self._insert([self._record(dataset, (str(key),) if key else (), r, seen) for key, r in batch])
+                batch = []
+            yield key, row
+        if batch:
+            self._insert([self._record(dataset, (str(key),) if key else (), r, seen) for key, r in batch])
+        self._warn_duplicates(dataset, seen)
+
+    def runs(self, cluster_id=None, limit=20):
+        query = 'SELECT run_id, cluster_id, host, started, finished, modules FROM runs'
+        params = ()
+        if cluster_id:
+            query += ' WHERE cluster_id = ?'
+            params = (cluster_id,)
+        rows = self._db.execute(query + ' ORDER BY run_id DESC LIMIT ?', params + (limit,)).fetchall()
+        return [dict(zip(('run_id', 'cluster_id', 'host', 'started', 'finished', 'modules'), row)) for row in rows]
+
+    def _row_dict(self, row):
+        result = dict(zip(self.KEY_COLUMNS + ('versions', 'size_bytes', 'value'), row[:-1]))
+        result['data'] = json.loads(row[-1])
+        return {key: value for key, value in result.items() if value not in ('', None)}
+
+    def diff(self, run_a, run_b, dataset=None, limit=100):
+        """Changes from run_a to run_b, limited to datasets both runs stored
+        Rows are matched by their natural key. Keys that occur more than once in
+        a run are ambiguous and only counted, never matched by position.
+        Returns:
+            dict: Per dataset/section counts, new large tablets, version count
+            growth, config drift, up to limit added/removed/changed rows per dataset
+            and the number of ambiguous keys per dataset and run
+        """
+        columns = ', '.join(f"x.{column}" for column in self.KEY_COLUMNS + ('versions', 'size_bytes', 'value', 'data'))
+        natural_key = [column for column in self.KEY_COLUMNS if column != 'seq']
+        join = ' AND '.join(f"x.{column} = y.{column}" for column in natural_key)
+
+        def unique(alias):
+            # Only the first row of a key has seq ''; any other row makes the key ambiguous
+            match = ' AND '.join(f"d.{column} = {alias}.{column}" for column in natural_key)
+            return f"""{alias}.seq = '' AND NOT EXISTS (
+                SELECT 1 FROM rows d WHERE d.run_id = {alias}.run_id AND {match} AND d.seq != '')"""
+
+        common = 'x.dataset IN (SELECT dataset FROM rows WHERE run_id = ? INTERSECT SELECT dataset FROM rows WHERE run_id = ?)'
+        dataset_filter = ' AND x.dataset = ?' if dataset else ''
+        extra = (dataset,) if dataset else ()
+
+        def only_in(run, other):
+            return self._db.execute(f"""
+                SELECT {columns} FROM rows x
+                WHERE x.run_id = ? AND {common}{dataset_filter} AND {unique('x')}
+                AND NOT EXISTS (SELECT 1 FROM rows y WHERE y.run_id = ? AND {join})
+                ORDER BY x.dataset, x.section
+            """, (run, run_a, run_b) + extra + (other,)).fetchall()
+
+        added = [self._row_dict(row) for row in only_in(run_b, run_a)]
+        removed = [self._row_dict(row) for row in only_in(run_a, run_b)]
+        changed = []
+        for row in self._db.execute(f"""
+                SELECT {columns}, y.data FROM rows x JOIN rows y ON {join}
+                WHERE x.run_id = ? AND y.run_id = ? AND {common}{dataset_filter} AND x.data != y.data
+                AND {unique('x')} AND {unique('y')}
+                ORDER BY x.dataset, x.section
+            """, (run_a, run_b, run_a, run_b) + extra):
+            new = self._row_dict(row[:-1])
+            old, new_data = new.pop('data'), json.loads(row[-1])
+            new['fields'] = {field: [old.get(field), new_data.get(field)]
+                             for field in sorted(set(old) | set(new_data)) if old.get(field) != new_data.get(field)}
+            new.pop('versions', None)
+            new.pop('size_bytes', None)
+            new.pop('value', None)
+            changed.append(new)
+
+        summary = {}
+        for kind, rows in (('added', added), ('removed', removed), ('changed', changed)):
+            for row in rows:
+                counts = summary.setdefault(f"{row['dataset']}/{row.get('section', '')}".rstrip('/'),
+                                            {'added': 0, 'removed': 0, 'changed': 0})
+                counts[kind] += 1
+
+        version_growth = [dict(zip(('dataset', 'section', 'db', 'tbl', 'tablet', 'be', 'versions_before', 'versions_after'), row))
+                          for row in self._db.execute("""
+                SELECT x.dataset, x.section, x.db, x.tbl, x.tablet, x.be, x.versions, y.versions
+                FROM rows x JOIN rows y ON """ + join + """
+                WHERE x.run_id = ? AND y.run_id = ? AND x.tablet != '' AND y.versions > x.versions
+                AND """ + unique('x') + " AND " + unique('y') + """
+                ORDER BY y.versions - x.versions DESC LIMIT ?
+            """, (run_a, run_b, limit))]
+        ambiguous = {}
+        for run, name in ((run_a, 'run_a'), (run_b, 'run_b')):
+            for row_dataset, count in self._db.execute(f"""
+                    SELECT dataset, COUNT(*) FROM rows x WHERE x.run_id = ? AND x.seq = '1'{dataset_filter}
+                    GROUP BY dataset""", (run,) + extra):
+                ambiguous.setdefault(row_dataset, {})[name] = count
+        is_config = lambda row: row['dataset'] in self.CONFIG_DATASETS
+        changes = {}
+        for kind, rows in (('added', added), ('removed', removed), ('changed', changed)):
+            for row in rows:
+                entries = changes.setdefault(row['dataset'], {}).setdefault(kind, [])
+                if len(entries) < limit:
+                    entries.append(row)
+        return {
+            'run_a': self._run(run_a),
+            'run_b': self._run(run_b),
+            'summary': summary,
+            'new_large_tablets': [row for row in added if row['dataset'] == 'tablet_metadata'
+                                  and row.get('section') == 'large_tablets'][:limit],
+            'version_growth': version_growth,
+            'config_drift': {
+                'added': [row for row in added if is_config(row)][:limit],
+                'removed': [row for row in removed if is_config(row)][:limit],
+                'changed': [row for row in changed if is_config(row)][:limit]
+            },
+            'changes': changes,
+            'ambiguous_keys': ambiguous
+        }
+
+    def _run(self, run_id):
+        row = self._db.execute('SELECT run_id, cluster_id, host, started, modules FROM runs WHERE run_id = ?',
+                               (run_id,)).fetchone()
+        return dict(zip(('run_id', 'cluster_id', 'host', 'started', 'modules'), row)) if row else None
+
+    def tablets_crossing(self, threshold, since, cluster_id=None):
+        """Tablets that went above threshold versions within the window
+        A tablet counts if it is over the threshold in some run of the window
+        but was not in the window's first run that stored tablet data (the
+        tablet check only reports tablets over its own threshold, so being
+        absent there means it was below).
+        Returns:
+            list: Tablets with their highest version count and when they crossed
+        """
+        cluster_filter = ' AND cluster_id = ?' if cluster_id else ''
+        params = (since.isoformat(sep=' '),) + ((cluster_id,) if cluster_id else ())
+        window = [row[0] for row in self._db.execute(
+            f"SELECT run_id FROM runs WHERE started >= ?{cluster_filter} ORDER BY run_id", params)]
+        if not window:
+            return []
+        placeholders = ', '.join('?' * len(window))
+        first_run = self._db.execute(
+            f"SELECT MIN(run_id) FROM rows WHERE versions IS NOT NULL AND run_id IN ({placeholders})",
+            window).fetchone()[0]
+        if first_run is None:
+            return []
+        rows = self._db.execute(f"""
+            SELECT r.tablet, MAX(r.db), MAX(r.tbl), MIN(r.run_id), MAX(r.versions)
+            FROM rows r
+            WHERE r.versions > ? AND r.tablet != '' AND r.run_id IN ({placeholders})
+            GROUP BY r.tablet
+            HAVING MIN(r.run_id) > ?
+            ORDER BY MAX(r.versions) DESC
+        """, (threshold,) + tuple(window) + (first_run,)).fetchall()
+        started = dict(self._db.execute(f"SELECT run_id, started FROM runs WHERE run_id IN ({placeholders})", window))
+        return [{'tablet': tablet, 'db': db, 'tbl': tbl, 'max_versions': max_versions,
+                 'first_over_run': first_over, 'crossed_at': started[first_over]}
+                for tablet, db, tbl, first_over, max_versions in rows]
+
+    def tablet_history(self, tablet_id):
+        """Version count and size of a tablet in every run that reported it"""
+        return [dict(zip(('run_id', 'started', 'dataset', 'section', 'be', 'versions', 'size_bytes'), row))
+                for row in self._db.execute("""
+            SELECT DISTINCT r.run_id, runs.started, r.dataset, r.section, r.be, r.versions, r.size_bytes
+            FROM rows r JOIN runs USING (run_id) WHERE r.tablet = ? ORDER BY r.run_id
+        """, (str(tablet_id),))]
+
 class StarRocksDoctor:
-    def __init__(self, host, port, user, password, output_dir='./starrocks_diagnostic'):
+    def __init__(self, host, port, user, password, output_dir='./starrocks_diagnostic', topology_ttl=60,
+                 fe_timeout=30, parallelism=8):
         self.host = host
         self.port = port
         self.user = user
         self.password = password
         self.output_dir = output_dir
-        self.connection = None
+        self.parallelism = max(1, parallelism)
+        self.pool = FEConnectionPool(port, user, password, max_idle_per_host=max(4, self.parallelism))
+        self.governor = self.pool.governor = FELoadGovernor(ceiling=self.parallelism)
+        self.follower_reads = True
+        self.topology = ClusterTopology(self, ttl=topology_ttl)
+        self.fe_timeout = fe_timeout
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._tablet_snapshot = None
+        self._tablet_snapshot_loaded = False
+        self._show_tablets = None
+        self._columnar_formats = {}
+        self.profiler = None
+        self.tracer = None
+        self.history = None
 
     def connect(self):
         """Establish connection to the StarRocks cluster"""
         try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password
-            )
+            self.pool.release(self.host, self.pool.acquire(self.host))
             return True
         except Error as e:
             print(f"Error connecting to StarRocks: {e}")
             return False
 
-    def execute_query(self, query, params=None):
-        """Execute a query and return results"""
-        cursor = self.connection.cursor(dictionary=True)
+    def close(self):
+        """Close all pooled connections"""
+        self.pool.close_all()
+
+    @contextmanager
+    def profile_query(self, query, connection):
+        """Record a statement with the profiler (--profile) and tracer (--trace), if on
+        Yields:
+            dict: Add 'rows' and 'bytes' for the result to it
+        """
+        if self.profiler is None and self.tracer is None:
+            yield {}
+            return
+        host = getattr(connection, 'server_host', None)
+        with trace_span(self.tracer, 'query', 'sql', host=host, statement=' '.join(query.split())[:500]) as span:
+            if self.profiler is None:
+                call = {}
+                yield call
+            else:
+                with self.profiler.measure(query, host) as call:
+                    yield call
+            if span is not None:
+                span['attrs']['rows'] = call.get('rows')
+
+    def in_current_module(self, func):
+        """Wrap func for a worker thread so its statements count for the calling module and span"""
+        if self.profiler is not None:
+            func = self.profiler.bind(func)
+        if self.tracer is not None:
+            func = self.tracer.bind(func)
+        return func
+
+    def _fetch(self, connection, query, params=None):
+        """Run a query on the given connection and return its rows as dicts"""
+        with self.governor.slot(getattr(connection, 'server_host', None), query), \
+                self.profile_query(query, connection) as call:
+            cursor = connection.cursor(dictionary=True)
+            try:
+                cursor.execute(query, params or ())
+                rows = cursor.fetchall() if cursor.with_rows else []
+            finally:
+                cursor.close()
+            call['rows'] = len(rows)
+            if self.profiler is not None:
+                call['bytes'] = QueryProfiler.approx_bytes(rows)
+            return rows
+
+    def read_host(self, query):
+        """FE for a statement sent without an explicit host
+        Read-only information_schema SELECTs go to the least loaded alive follower,
+        sparing the leader that also runs the cluster. Everything else, and every
+        statement on a cluster without followers, goes to the FE given on the
+        command line.
+        """
+        if not self.follower_reads or not re.match(r'\s*SELECT\b.*\binformation_schema\.', query, re.I | re.S):
+            return self.host
+        leader_fe = self.get_leader_fe()
+        followers = [fe for fe in self.get_read_hosts(leader_fe) if fe != leader_fe]
+        return self.governor.least_loaded(followers) if followers else self.host
+
+    def execute_query(self, query, params=None, host=None):
+        """Execute a query and return results
+        Args:
+            query: SQL statement
+            params: Optional query parameters
+            host: Optional FE host to run on. By default information_schema reads go
+                  to a follower and everything else to the FE given on the command line
+        """
+        target = host or self.read_host(query)
         try:
-            cursor.execute(query, params or ())
-            return cursor.fetchall()
+            with self.pool.connection(target) as conn:
+                return self._fetch(conn, query, params)
+        except (errors.InterfaceError, errors.OperationalError) as e:
+            # The FE may be gone or no longer the leader; re-resolve the topology
+            self.topology.invalidate()
+            if target != (host or self.host):
+                print(f"Warning: Query on follower {target} failed, retrying on {self.host}: {e}")
+                return self.execute_query(query, params, self.host)
+            print(f"Error executing query: {query}\nError: {e}")
+            return None
         except Error as e:
             print(f"Error executing query: {query}\nError: {e}")
             return None
-        finally:
-            cursor.close()
     
+    @contextmanager
+    def stream_query(self, query, params=None, host=None, batch_size=10000):
+        """Execute a query whose result is too large to hold as dicts
+        Args:
+            query: SQL statement
+            params: Optional query parameters
+            host: Optional FE host to run on, defaults to the FE given on the command line
+            batch_size: Rows fetched per round trip
+        Yields:
+            QueryStream: The open result, only readable inside the with block
+        Raises:
+            Error: If the statement fails. Unlike execute_query, errors are left to the caller.
+        """
+        target = host or self.read_host(query)
+        try:
+            conn = self.pool.acquire(target)
+        except Error as e:
+            if host or target == self.host:
+                raise
+            self.topology.invalidate()
+            print(f"Warning: Could not connect to follower {target}, reading from {self.host}: {e}")
+            target = self.host
+            conn = self.pool.acquire(target)
+        host = target
+        discard = True
+        try:
+            with self.profile_query(query, conn) as call:
+                cursor = conn.cursor()
+                # The slot is only held until the FE starts answering, so a caller that
+                # sends more statements while reading cannot starve on its own stream
+                with self.governor.slot(host, query):
+                    cursor.execute(query, params or ())
+                stream = QueryStream(cursor, batch_size, call, measure_bytes=self.profiler is not None)
+                yield stream
+                # A connection with unread rows cannot run the next statement, so it is
+                # only reused if the caller read the whole result
+                if stream.exhausted:
+                    cursor.close()
+                    discard = False
+        except (errors.InterfaceError, errors.OperationalError):
+            self.topology.invalidate()
+            raise
+        finally:
+            self.pool.release(host, conn, discard)
+
+    def fan_out(self, hosts, func, timeout=None):
+        """Run func on every host concurrently, each over its own pooled connection
+        Args:
+            hosts: FE hosts to query
+            func: Callable taking (connection, host)
+            timeout: Seconds to wait for the hosts, defaults to self.fe_timeout
+        Returns:
+            list: (host, result, error) tuples in the order of hosts. A host that
+            has not answered within the timeout gets a TimeoutError and does not
+            hold up the others.
+        """
+        timeout = self.fe_timeout if timeout is None else timeout
+        slots = [{'host': host} for host in hosts]
+
+        with trace_span(self.tracer, 'fan_out', 'fan_out', hosts=len(slots)):
+            @self.in_current_module
+            def worker(slot):
+                try:
+                    with trace_span(self.tracer, f"fe {slot['host']}", 'fan_out', host=slot['host']), \
+                            self.pool.connection(slot['host']) as conn:
+                        slot['result'] = func(conn, slot['host'])
+                except Exception as e:
+                    slot['error'] = e
+
+            # Daemon threads so a hung FE cannot keep the process alive
+            threads = []
+            for slot in slots:
+                thread = threading.Thread(target=worker, args=(slot,), name=f"fan-out-{slot['host']}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+            deadline = time.monotonic() + timeout
+            results = []
+            for slot, thread in zip(slots, threads):
+                thread.join(max(0, deadline - time.monotonic()))
+                if thread.is_alive():
+                    results.append((slot['host'], None, TimeoutError(f"no answer within {timeout}s")))
+                else:
+                    results.append((slot['host'], slot.get('result'), slot.get('error')))
+            return results
+
+    def map_concurrently(self, func, items, parallelism=None, hosts=None):
+        """Apply func to items concurrently with a bounded number in flight
+        Args:
+            func: Callable taking (connection, item)
+            items: Iterable of work items, consumed lazily
+            parallelism: Maximum concurrent calls, defaults to self.parallelism
+            hosts: FE hosts to spread the calls over round-robin, defaults to self.host
+        Yields:
+            tuple: (item, result, error) in completion order
+        """
+        parallelism = max(1, parallelism or self.parallelism)
+        host_cycle = itertools.cycle(hosts or [self.host])
+        items = iter(items)
+
+        @self.in_current_module
+        def run(item, host):
+            with trace_span(self.tracer, getattr(func, '__name__', 'task'), 'task', host=host, item=str(item)[:200]), \
+                    self.pool.connection(host) as conn:
+                return func(conn, item)
+
+        with ThreadPoolExecutor(max_workers=parallelism) as executor:
+            pending = {}
+
+            def submit_next():
+                for item in items:
+                    pending[executor.submit(run, item, next(host_cycle))] = item
+                    return True
+                return False
+
+            # Keep the queue short so huge item streams are never materialized
+            for _ in range(parallelism * 2):
+                if not submit_next():
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    error = future.exception()
+                    yield item, None if error else future.result(), error
+                    submit_next()
+
     def get_leader_fe(self):
         """Get the leader FE"""
-        fe_instances = self.execute_query("show frontends")
-        for fe in fe_instances:
-            if fe['Role'] == 'LEADER':
-                return fe['IP']
-        return None
+        return self.topology.leader()
     
+    def get_read_hosts(self, leader_fe=None):
+        """FE hosts that metadata reads can be spread over: the leader first, then alive followers"""
+        leader_fe = leader_fe or self.get_leader_fe()
+        hosts = [leader_fe] if leader_fe else []
+        return hosts + [fe['IP'] for fe in self.topology.frontends()
+                        if fe['IP'] != leader_fe and str(fe.get('Alive')).lower() == 'true']
+
     def get_fes(self):
         """Get all FE"""
-        fes = []
-        fe_instances = self.execute_query("show frontends")
-        for fe in fe_instances:
-            fes.append(fe['IP'])
-        return fes
+        return self.topology.frontend_hosts()
 
 
     def collect_cluster_state(self):
         """Collect cluster state and configuration"""
         return {
-            'backends': self.execute_query("SHOW PROC '/backends'"),
-            'frontends': self.execute_query("SHOW PROC '/frontends'"),
+            'backends': self.topology.backends(),
+            'frontends': self.topology.frontends(),
             'resource_groups': self.execute_query("SHOW RESOURCE GROUPS"),
             'version': self.execute_query("SELECT current_version()")[0]['current_version()']
         }
@@ -82,81 +2250,69 @@ class StarRocksDoctor:
         """Collect query performance diagnostics from all FE nodes"""
         try:
             # Get all FE nodes
-            fe_nodes = self.execute_query("SHOW PROC '/frontends'")
+            fe_nodes = self.topology.frontends()
             if not fe_nodes:
                 print("Error: Could not get FE nodes information")
                 return {}
 
-            all_queries = []
-            all_current_queries = []
-            original_host = self.host
-
-            # Collect queries from each FE node
-            for fe in fe_nodes:
-                fe_host = fe['IP']
+            def collect_from_fe(conn, fe_host):
+                queries = []
+                current_queries = []
+                # Get queries from this FE
                 try:
-                    # Switch connection to this FE
-                    if self.connection:
-                        self.connection.close()
-                    self.host = fe_host
-                    if not self.connect():
-                        print(f"Warning: Could not connect to FE {fe_host}")
-                        continue
-
-                    # Get queries from this FE
-                    try:
-                        queries = self.execute_query("""
-                            SELECT 
-                                queryId,
-                                timestamp,
-                                user,
-                                state,
-                                queryTime,
-                                scanBytes,
-                                scanRows,
-                                returnRows,
-                                cpuCostNs,
-                                memCostBytes,
-                                %s as fe_host
-                            FROM starrocks_audit_db__.starrocks_audit_tbl__
-                            ORDER BY timestamp DESC
-                            LIMIT %s
-                        """, (fe_host, limit))
-                        
-                        if queries:
-                            all_queries.extend(queries)
-                    except Exception:
-                        # Silently skip if query history is not available
-                        pass
+                    queries = self._fetch(conn, """
+                        SELECT 
+                            queryId,
+                            timestamp,
+                            user,
+                            state,
+                            queryTime,
+                            scanBytes,
+                            scanRows,
+                            returnRows,
+                            cpuCostNs,
+                            memCostBytes,
+                            %s as fe_host
+                        FROM starrocks_audit_db__.starrocks_audit_tbl__
+                        ORDER BY timestamp DESC
+                        LIMIT %s
+                    """, (fe_host, limit))
+                except Error:
+                    # Silently skip if query history is not available; a lost
+                    # connection is reported for the whole FE
+                    if not conn.is_connected():
+                        raise
+
+                # Get current queries from this FE
+                try:
+                    current_queries = self._fetch(conn, "SHOW PROC '/current_queries'")
+                    for query in current_queries:
+                        query['fe_host'] = fe_host
+                except Error:
+                    # Silently skip if current_queries is not available
+                    if not conn.is_connected():
+                        raise
+                return queries, current_queries
 
-                    # Get current queries from this FE
-                    try:
-                        current_queries = self.execute_query("SHOW PROC '/current_queries'")
-                        if current_queries:
-                            for query in current_queries:
-                                query['fe_host'] = fe_host
-                            all_current_queries.extend(current_queries)
-                    except Exception:
-                        # Silently skip if current_queries is not available
-                        pass
+            all_queries = []
+            all_current_queries = []
 
-                except Exception as e:
-                    print(f"Error collecting queries from FE {fe_host}: {e}")
-                finally:
-                    # Close connection to this FE
-                    if self.connection:
-                        self.connection.close()
+            # Collect queries from all FE nodes at once, merged in FE order
+            for fe_host, result, error in self.fan_out([fe['IP'] for fe in fe_nodes], collect_from_fe):
+                if isinstance(error, TimeoutError):
+                    print(f"Warning: Timed out collecting queries from FE {fe_host}")
+                elif isinstance(error, (errors.InterfaceError, errors.OperationalError)):
+                    print(f"Warning: Could not connect to FE {fe_host}")
+                elif error:
+                    print(f"Error collecting queries from FE {fe_host}: {error}")
+                else:
+                    all_queries.extend(result[0])
+                    all_current_queries.extend(result[1])
 
             # Sort all queries by timestamp and take the most recent ones
             all_queries.sort(key=lambda x: x['timestamp'], reverse=True)
             recent_queries = all_queries[:limit]
 
-            # Restore original connection
-            self.host = original_host
-            if not self.connect():
-                print("Error: Could not restore connection to original FE")
-                return {}
-
             return {
                 'recent_queries': recent_queries,
                 'current_queries': all_current_queries,
@@ -166,15 +2322,114 @@ class StarRocksDoctor:
             print(f"Error collecting performance diagnostics: {e}")
             return {}
 
+    def iter_audit_aggregates(self, since, until, page_size=1000):
+        """Aggregate the audit table server-side and stream the groups back
+        A consumer that stops early leaves the connection with unread rows,
+        so it is then discarded instead of returned to the pool.
+        Args:
+            since: Window start (datetime)
+            until: Window end (datetime, exclusive)
+            page_size: Number of groups fetched per round trip
+        Yields:
+            dict: Per digest/user/resource group aggregates, most CPU first
+        """
+        query = """
+            SELECT 
+                digest,
+                `user`,
+                resourceGroup,
+                COUNT(*) AS query_count,
+                SUM(CASE WHEN state = 'ERR' THEN 1 ELSE 0 END) AS error_count,
+                percentile_approx(queryTime, 0.5) AS p50_query_time_ms,
+                percentile_approx(queryTime, 0.95) AS p95_query_time_ms,
+                percentile_approx(queryTime, 0.99) AS p99_query_time_ms,
+                MAX(queryTime) AS max_query_time_ms,
+                SUM(scanBytes) AS total_scan_bytes,
+                SUM(cpuCostNs) AS total_cpu_cost_ns,
+                SUM(memCostBytes) AS total_mem_cost_bytes,
+                ANY_VALUE(stmt) AS sample_stmt
+            FROM starrocks_audit_db__.starrocks_audit_tbl__
+            WHERE `timestamp` >= %s AND `timestamp` < %s
+            AND isQuery = 1
+            GROUP BY digest, `user`, resourceGroup
+            ORDER BY total_cpu_cost_ns DESC, digest, `user`, resourceGroup
+        """
+        with self.stream_query(query, (since, until), host=self.host, batch_size=page_size) as stream:
+            yield from stream.dicts()
+
+    def get_audit_top_offenders(self, since, until, top_n=20):
+        """Get the most expensive individual queries in a time window
+        Returns:
+            dict: Top queries by query time, CPU cost and memory cost
+        """
+        offenders = {}
+        for key, column in (('query_time', 'queryTime'), ('cpu_cost', 'cpuCostNs'), ('mem_cost', 'memCostBytes')):
+            offenders[key] = self.execute_query(f"""
+                SELECT 
+                    queryId,
+                    `timestamp`,
+                    `user`,
+                    resourceGroup,
+                    digest,
+                    state,
+                    queryTime,
+                    scanBytes,
+                    scanRows,
+                    cpuCostNs,
+                    memCostBytes,
+                    stmt
+                FROM starrocks_audit_db__.starrocks_audit_tbl__
+                WHERE `timestamp` >= %s AND `timestamp` < %s
+                AND isQuery = 1
+                ORDER BY {column} DESC
+                LIMIT %s
+            """, (since, until, top_n)) or []
+        return offenders
+
+    def collect_audit_aggregation(self, since, until=None, top_n=20, page_size=1000):
+        """Collect audit statistics for a time window, aggregated by the cluster
+        Args:
+            since: Window start (datetime)
+            until: Optional window end (datetime), defaults to now
+            top_n: Number of top offenders per metric
+            page_size: Number of aggregate groups fetched per round trip
+        Returns:
+            dict: Per digest/user/resource group aggregates and top offenders
+        """
+        until = until or datetime.now()
+        try:
+            aggregates = list(self.iter_audit_aggregates(since, until, page_size))
+            print(f"Fetched {len(aggregates)} audit aggregate groups")
+            return {
+                'window': {'since': since, 'until': until},
+                'aggregates': aggregates,
+                'top_offenders': self.get_audit_top_offenders(since, until, top_n)
+            }
+        except Error as e:
+            print(f"Error aggregating audit log: {e}")
+            return {}
+
     def save_to_file(self, data, filename, format='json'):
         """Save collected data to file
         Args:
             data: Data to save
             filename: Base filename without extension
-            format: Output format ('json', 'csv', 'yaml', 'txt')
+            format: Output format ('json', 'jsonl', 'csv', 'yaml', 'txt', 'parquet', 'arrow')
         Returns:
-            str: Path to the saved file
+            str: Path to the saved file (a list of paths for parquet and arrow)
         """
+        if self.history is not None:
+            self.history.ingest(filename, data)
+        return self._write_file(data, filename, format)
+
+    def _write_file(self, data, filename, format):
+        if format == 'jsonl':
+            # Lists become one line per row, dictionaries one line per key
+            rows = data if isinstance(data, list) else ({'key': k, 'value': v} for k, v in data.items())
+            return self._write_rows(rows, filename, format)
+        if format in ('parquet', 'arrow'):
+            return self._save_columnar(data, filename, format)
+
         os.makedirs(self.output_dir, exist_ok=True)
         filepath = os.path.join(self.output_dir, f"{filename}_{self.timestamp}.{format}")
 
@@ -214,6 +2469,164 @@ class StarRocksDoctor:
 
         return filepath
 
+    def open_sink(self, filename, format='jsonl'):
+        """Open a streaming writer in the output directory
+        Args:
+            filename: Base filename without extension
+            format: 'jsonl', 'csv' or 'json' (a JSON array)
+        Returns:
+            JsonLinesSink, CsvSink or JsonArraySink: Writer with write(row) and close()
+        """
+        sinks = {'jsonl': JsonLinesSink, 'csv': CsvSink, 'json': JsonArraySink}
+        format = self._columnar_format(format)
+        if format not in sinks and format not in ('parquet', 'arrow'):
+            raise ValueError(f"Unsupported streaming format: {format}")
+        os.makedirs(self.output_dir, exist_ok=True)
+        filepath = os.path.join(self.output_dir, f"{filename}_{self.timestamp}.{format}")
+        if format in ('parquet', 'arrow'):
+            return ColumnarSink(filepath, format)
+        return sinks[format](filepath)
+
+    def _columnar_format(self, format):
+        """Fall back from parquet to Arrow IPC, or to JSON Lines, when pyarrow cannot write it"""
+        if format not in ('parquet', 'arrow'):
+            return format
+        if format not in self._columnar_formats:
+            resolved = format
+            try:
+                import pyarrow
+                if format == 'parquet':
+                    try:
+                        import pyarrow.parquet
+                    except ImportError:
+                        print("Warning: pyarrow has no Parquet support, writing Arrow IPC files instead")
+                        resolved = 'arrow'
+            except ImportError:
+                print("Warning: pyarrow is not installed, writing JSON Lines instead")
+                resolved = 'jsonl'
+            self._columnar_formats[format] = resolved
+        return self._columnar_formats[format]
+
+    def save_grouped_rows(self, pairs, filename, format):
+        """Save (group, row) pairs with one file per group
+        Used for columnar output, where every table needs its own file.
+        Args:
+            pairs: Iterable of (group name, dict row)
+            filename: Base filename; each file is named {filename}_{group}
+            format: Output format
+        Returns:
+            list: Paths of the saved files
+        """
+        if self.history is not None:
+            pairs = self.history.record_pairs(filename, pairs)
+        return self._write_grouped(pairs, filename, format)
+
+    def _write_grouped(self, pairs, filename, format):
+        sinks = {}
+        try:
+            for group, row in pairs:
+                sink = sinks.get(group)
+                if sink is None:
+                    sink = sinks[group] = self.open_sink(f"{filename}_{group}" if group else filename, format)
+                sink.write(row)
+        finally:
+            for sink in sinks.values():
+                sink.close()
+        return [sink.filepath for sink in sinks.values() if sink.count]
+
+    def save_rows_to_file(self, rows, filename, format='jsonl'):
+        """Save rows from an iterable without holding them all in memory
+        Formats without a streaming writer (yaml, txt) collect the rows first.
+        Args:
+            rows: Iterable of dict rows, typically a generator
+            filename: Base filename without extension
+            format: Output format
+        Returns:
+            str: Path to the saved file
+        """
+        if self.history is not None:
+            rows = (row for _, row in self.history.record_rows(filename, rows))
+        return self._write_rows(rows, filename, format)
+
+    def _write_rows(self, rows, filename, format):
+        if format in ('yaml', 'txt'):
+            return self._write_file(list(rows), filename, format)
+        with self.open_sink(filename, format) as sink:
+            for row in rows:
+                sink.write(row)
+        return sink.filepath
+
+    def _save_columnar(self, data, filename, format):
+        """Save every list of rows in a result to its own columnar file
+        Lists nested one level deep (e.g. top_offenders) are included; anything
+        that is not a list of rows is saved next to them as JSON.
+        """
+        def is_rows(value):
+            return isinstance(value, list) and all(isinstance(row, dict) for row in value)
+
+        tables = {}
+        rest = {}
+        if is_rows(data):
+            tables[''] = data
+        else:
+            for key, value in data.items():
+                if is_rows(value):
+                    tables[key] = value
+                elif isinstance(value, dict) and value and all(is_rows(v) for v in value.values()):
+                    tables.update((f"{key}_{subkey}", rows) for subkey, rows in value.items())
+                else:
+                    rest[key] = value
+        paths = self._write_grouped(((name, row) for name, rows in tables.items() for row in rows),
+                                    filename, format)
+        if rest:
+            print(f"Note: non-tabular parts of {filename} are saved as JSON")
+            paths.append(self._write_file(rest, filename, 'json'))
+        return paths
+
+    def iter_schema_rows(self, items):
+        """Flatten table information into rows for columnar output
+        Args:
+            items: Iterable of (database, table, table info)
+        Yields:
+            tuple: ('tables', row) per table and ('partitions', row) per partition
+        """
+        for db_name, tbl_name, table_info in items:
+            row = {'DB_NAME': db_name, 'TABLE_NAME': tbl_name}
+            for key, value in table_info.items():
+                if key == 'config':
+                    row.update(value)
+                elif key not in ('partitions', 'tablets'):
+                    row[key] = value
+            yield 'tables', row
+            for partition in table_info.get('partitions') or []:
+                yield 'partitions', dict({'DB_NAME': db_name, 'TABLE_NAME': tbl_name}, **partition)
+
+    def save_items_to_file(self, items, filename):
+        """Write (key, value) pairs to a JSON object file as they are produced
+        The file has the same layout as save_to_file(dict(items), filename),
+        but no more than one item is held in memory.
+        Args:
+            items: Iterable of (key, value) pairs
+            filename: Base filename without extension
+        Returns:
+            str: Path to the saved file
+        """
+        if self.history is not None:
+            items = self.history.record_pairs(filename, items)
+        os.makedirs(self.output_dir, exist_ok=True)
+        filepath = os.path.join(self.output_dir, f"{filename}_{self.timestamp}.json")
+
+        with open(filepath, 'w') as f:
+            f.write('{')
+            count = 0
+            for key, value in items:
+                body = json.dumps(value, indent=2, cls=DateTimeEncoder).replace('\n', '\n  ')
+                f.write(f"{',' if count else ''}\n  {json.dumps(str(key))}: {body}")
+                count += 1
+            f.write('\n}' if count else '}')
+
+        return filepath
+
     def run_diagnostics(self):
         """Main method to run all diagnostics"""
         if not self.connect():
@@ -235,8 +2648,7 @@ class StarRocksDoctor:
             print(f"Diagnostic data collection complete. Files saved to {self.output_dir}")
             return True
         finally:
-            if self.connection:
-                self.connection.close()
+            self.close()
 
     def _convert_to_mb(self, size_str):
         """Convert size string to MB
@@ -355,12 +2767,153 @@ class StarRocksDoctor:
             print(f"Error collecting table information: {e}")
             return {}
 
-    def _get_all_dependencies(self, db_name, mv_name, visited=None):
+    def _partition_summary(self, partitions):
+        """Add DATA_SIZE_MB to partitions_meta rows and compute table totals
+        Returns:
+            tuple: (total_data_size_mb, total_row_count)
+        """
+        for partition in partitions:
+            if partition['DATA_SIZE']:
+                partition['DATA_SIZE_MB'] = self._convert_to_mb(partition['DATA_SIZE'])
+        total_data_size = sum(p['DATA_SIZE_MB'] for p in partitions if 'DATA_SIZE_MB' in p)
+        total_row_count = sum(int(p['ROW_COUNT']) for p in partitions if p['ROW_COUNT'])
+        return total_data_size, total_row_count
+
+    def iter_table_info_bulk(self, table_name=None, fetch_ddl=True, count_rows=False, parallelism=None):
+        """Collect table information with a fixed number of metadata scans
+        Loads tables/tables_config and partitions_meta once each and groups
+        them by (db, table) client-side. CREATE TABLE statements are fetched
+        concurrently with at most parallelism statements in flight, and each
+        table is handed over as soon as it is complete.
+        Args:
+            table_name: Optional. If specified, only collect info for this table
+            fetch_ddl: Whether to fetch CREATE TABLE statements
+            count_rows: Whether to run SELECT COUNT(*) for tables missing from
+                        partitions_meta (never done unless requested)
+            parallelism: Maximum concurrent per-table statements
+        Yields:
+            tuple: (database, table, table info)
+        """
+        try:
+            query = """
+                SELECT t.TABLE_SCHEMA, t.TABLE_NAME, t.TABLE_TYPE, c.TABLE_ID,
+                    c.TABLE_ENGINE, c.TABLE_MODEL, c.PRIMARY_KEY, c.PARTITION_KEY,
+                    c.DISTRIBUTE_KEY, c.DISTRIBUTE_TYPE, c.DISTRIBUTE_BUCKET, c.SORT_KEY, c.PROPERTIES
+                FROM information_schema.tables t
+                LEFT JOIN information_schema.tables_config c 
+                ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+                WHERE t.TABLE_TYPE = 'BASE TABLE'
+            """
+            meta_query = """
+                SELECT DB_NAME, TABLE_NAME, PARTITION_NAME, DATA_SIZE, ROW_COUNT 
+                FROM information_schema.partitions_meta
+            """
+            params = ()
+            if table_name:
+                query += " AND t.TABLE_NAME = %s"
+                meta_query += " WHERE TABLE_NAME = %s"
+                params = (table_name,)
+            tables = self.execute_query(query, params)
+            if not tables:
+                return
+
+            # partitions_meta is streamed into tuples; a table's partitions only
+            # become dicts when the table is handed over
+            partition_columns = ('PARTITION_NAME', 'DATA_SIZE', 'ROW_COUNT')
+            partitions_by_table = {}
+            try:
+                with self.stream_query(meta_query, params) as stream:
+                    table_key = stream.getter('DB_NAME', 'TABLE_NAME')
+                    partition = stream.getter(*partition_columns)
+                    for row in stream:
+                        partitions_by_table.setdefault(table_key(row), []).append(partition(row))
+            except Error as e:
+                print(f"Warning: Could not get partition info from information_schema.partitions_meta: {e}")
+                partitions_by_table = {}
+
+            pending = {}
+            missing_partitions = []
+            for row in tables:
+                db_name = row['TABLE_SCHEMA']
+                tbl_name = row['TABLE_NAME']
+                pending[(db_name, tbl_name)] = {
+                    'table_id': row['TABLE_ID'],
+                    'config': {k: v for k, v in row.items() if k not in ('TABLE_SCHEMA', 'TABLE_NAME', 'TABLE_TYPE', 'TABLE_ID')}
+                }
+                if not partitions_by_table.get((db_name, tbl_name)):
+                    missing_partitions.append((db_name, tbl_name))
+            del tables
+
+            def complete(key):
+                table_info = pending.pop(key)
+                table_partitions = partitions_by_table.pop(key, None)
+                if table_partitions:
+                    table_info['partitions'] = [dict(zip(partition_columns, values)) for values in table_partitions]
+                    table_info['total_data_size_mb'], table_info['total_row_count'] = \
+                        self._partition_summary(table_info['partitions'])
+                return table_info
+
+            def fetch_details(conn, key):
+                db_name, tbl_name = key
+                details = {}
+                if fetch_ddl:
+                    create_table = self._fetch(conn, f"SHOW CREATE TABLE `{db_name}`.`{tbl_name}`")
+                    if create_table:
+                        details['create_table'] = create_table[0]['Create Table']
+                if count_rows and key in missing:
+                    row_count = self._fetch(conn, f"SELECT COUNT(*) AS count FROM `{db_name}`.`{tbl_name}`")
+                    if row_count:
+                        details['total_row_count'] = row_count[0]['count']
+                return details
+
+            missing = set(missing_partitions)
+            if fetch_ddl:
+                keys = list(pending)
+            elif count_rows:
+                keys = missing_partitions
+            else:
+                keys = []
+            # Tables that need no per-table statement are complete already
+            waiting = set(keys)
+            for key in [key for key in pending if key not in waiting]:
+                yield key[0], key[1], complete(key)
+
+            done = 0
+            for (db_name, tbl_name), details, error in self.map_concurrently(fetch_details, keys, parallelism):
+                done += 1
+                table_info = complete((db_name, tbl_name))
+                if error:
+                    print(f"Warning: Could not get details for {db_name}.{tbl_name}: {error}")
+                else:
+                    table_info.update(details)
+                yield db_name, tbl_name, table_info
+                if done % 1000 == 0:
+                    print(f"Fetched details for {done}/{len(keys)} tables...")
+        except Exception as e:
+            print(f"Error collecting table information: {e}")
+
+    def collect_table_info_bulk(self, table_name=None, fetch_ddl=True, count_rows=False, parallelism=None):
+        """Collect table information with a fixed number of metadata scans
+        Args:
+            table_name: Optional. If specified, only collect info for this table
+            fetch_ddl: Whether to fetch CREATE TABLE statements
+            count_rows: Whether to run SELECT COUNT(*) for tables missing from partitions_meta
+            parallelism: Maximum concurrent per-table statements
+        Returns:
+            dict: Dictionary containing table information, same shape as collect_table_info
+        """
+        schema_info = {}
+        for db_name, tbl_name, table_info in self.iter_table_info_bulk(table_name, fetch_ddl, count_rows, parallelism):
+            schema_info.setdefault(db_name, {})[tbl_name] = table_info
+        return schema_info
+
+    def _get_all_dependencies(self, db_name, mv_name, visited=None, host=None):
         """Get all dependencies for a materialized view, including nested dependencies
         Args:
             db_name: Database name
             mv_name: Materialized view name
             visited: Set of already visited objects to prevent cycles
+            host: Optional FE host to query
         Returns:
             dict: Dictionary containing all dependencies
         """
@@ -390,7 +2943,7 @@ class StarRocksDoctor:
                 AND object_name = %s 
                 AND object_type = 'MATERIALIZED_VIEW'
             """
-            results = self.execute_query(query, (db_name, mv_name))
+            results = self.execute_query(query, (db_name, mv_name), host=host)
             
             if results:
                 for row in results:
@@ -409,7 +2962,7 @@ class StarRocksDoctor:
                             })
                     elif ref_type == 'MATERIALIZED_VIEW':
                         # Get the nested MV's dependencies
-                        mv_deps = self._get_all_dependencies(ref_db, ref_name, visited)
+                        mv_deps = self._get_all_dependencies(ref_db, ref_name, visited, host)
                         
                         # Add this MV to the list with its own dependencies
                         dependencies['materialized_views'].append({
@@ -434,24 +2987,128 @@ class StarRocksDoctor:
             print(f"Error getting dependencies for {db_name}.{mv_name}: {e}")
             return dependencies
 
-    def collect_mv_info(self, mv_name=None):
+    def _task_filter(self, task_names):
+        """Build an optional TASK_NAME IN (...) condition and its parameters"""
+        if not task_names:
+            return "", ()
+        return f"TASK_NAME IN ({', '.join(['%s'] * len(task_names))})", tuple(task_names)
+
+    def get_mv_task_runs(self, task_names=None, last_n=1, host=None):
+        """Get the most recent task runs of many tasks with a single query
+        Args:
+            task_names: Optional list of task names, defaults to all tasks
+            last_n: Number of most recent runs to keep per task
+            host: Optional FE host to query
+        Returns:
+            dict: TASK_NAME -> list of runs, newest first, or None if task_runs is unavailable
+        """
+        condition, params = self._task_filter(task_names)
+        where = f"WHERE {condition}" if condition else ""
+        runs = self.execute_query(f"""
+            SELECT TASK_NAME, QUERY_ID, CREATE_TIME, FINISH_TIME, State, ERROR_MESSAGE
+            FROM (
+                SELECT 
+                    TASK_NAME,
+                    QUERY_ID,
+                    CREATE_TIME,
+                    FINISH_TIME,
+                    STATE AS State,
+                    ERROR_MESSAGE,
+                    ROW_NUMBER() OVER (PARTITION BY TASK_NAME ORDER BY FINISH_TIME DESC) AS rn
+                FROM information_schema.task_runs
+                {where}
+            ) t
+            WHERE rn <= %s
+        """, params + (last_n,), host=host)
+        if runs is None:
+            # Window functions unavailable: scan once and keep the newest runs client-side
+            runs = self.execute_query(f"""
+                SELECT TASK_NAME, QUERY_ID, CREATE_TIME, FINISH_TIME, STATE AS State, ERROR_MESSAGE
+                FROM information_schema.task_runs
+                {where}
+            """, params, host=host)
+            if runs is None:
+                return None
+
+        runs_by_task = {}
+        for run in runs:
+            runs_by_task.setdefault(run['TASK_NAME'], []).append(run)
+        for task_runs in runs_by_task.values():
+            task_runs.sort(key=lambda r: r['FINISH_TIME'] or datetime.min, reverse=True)
+            del task_runs[last_n:]
+        return runs_by_task
+
+    def get_mv_refresh_stats(self, since, task_names=None, host=None):
+        """Get refresh duration statistics per task since a point in time
+        Args:
+            since: Window start (datetime)
+            task_names: Optional list of task names, defaults to all tasks
+            host: Optional FE host to query
+        Returns:
+            dict: TASK_NAME -> statistics. duration_trend_pct compares the mean
+            duration of the newer half of the runs with the older half.
+        """
+        condition, params = self._task_filter(task_names)
+        runs = self.execute_query(f"""
+            SELECT TASK_NAME, CREATE_TIME, FINISH_TIME, STATE
+            FROM information_schema.task_runs
+            WHERE CREATE_TIME >= %s {'AND ' + condition if condition else ''}
+        """, (since,) + params, host=host)
+        if runs is None:
+            print("Warning: Could not get refresh statistics from information_schema.task_runs")
+            return {}
+
+        runs_by_task = {}
+        for run in runs:
+            runs_by_task.setdefault(run['TASK_NAME'], []).append(run)
+
+        stats = {}
+        for task_name, task_runs in runs_by_task.items():
+            task_runs.sort(key=lambda r: r['CREATE_TIME'] or datetime.min)
+            durations = [(r['FINISH_TIME'] - r['CREATE_TIME']).total_seconds() for r in task_runs
+                         if isinstance(r['CREATE_TIME'], datetime) and isinstance(r['FINISH_TIME'], datetime)]
+            task_stats = {
+                'runs': len(task_runs),
+                'failed_runs': sum(1 for r in task_runs if r['STATE'] == 'FAILED'),
+                'avg_duration_s': None,
+                'min_duration_s': None,
+                'max_duration_s': None,
+                'last_duration_s': None,
+                'duration_trend_pct': None
+            }
+            if durations:
+                task_stats['avg_duration_s'] = sum(durations) / len(durations)
+                task_stats['min_duration_s'] = min(durations)
+                task_stats['max_duration_s'] = max(durations)
+                task_stats['last_duration_s'] = durations[-1]
+                half = len(durations) // 2
+                if half:
+                    older = sum(durations[:half]) / half
+                    newer = sum(durations[-half:]) / half
+                    if older:
+                        task_stats['duration_trend_pct'] = round((newer - older) / older * 100, 1)
+            stats[task_name] = task_stats
+        return stats
+
+    def collect_mv_info(self, mv_name=None, refresh_history=1, refresh_since=None):
         """Collect materialized view information including schema, task name and refresh history
         Args:
             mv_name: Optional. If specified, only collect info for this materialized view
+            refresh_history: Number of most recent refreshes to report per MV
+            refresh_since: Optional datetime. If specified, add refresh duration statistics since then
         """
         try:
-            # Connect to leader FE
+            # Find leader FE
             leader_fe = self.get_leader_fe()
             if not leader_fe:
                 print("Error: Could not find leader FE")
                 return {}
 
-            # Switch connection to leader FE
-            if self.connection:
-                self.connection.close()
-            self.host = leader_fe
-            if not self.connect():
-                return {}
+            # Load the whole dependency graph once
+            graph = MVDependencyGraph.load(self, host=leader_fe)
+            refresh_order = {}
+            if graph:
+                refresh_order = {mv: i for i, mv in enumerate(graph.refresh_order())}
 
             mv_info = {}
             query = """
@@ -464,11 +3121,23 @@ class StarRocksDoctor:
             """
             if mv_name:
                 query += " WHERE TABLE_NAME = %s"
-                results = self.execute_query(query, (mv_name,))
+                results = self.execute_query(query, (mv_name,), host=leader_fe)
             else:
-                results = self.execute_query(query)
+                results = self.execute_query(query, host=leader_fe)
 
             if results:
+                # Get the refresh history of all MVs at once
+                task_names = None
+                if mv_name:
+                    task_names = [row['TASK_NAME'] for row in results if row['TASK_NAME'] and row['TASK_NAME'].strip()]
+                task_runs = self.get_mv_task_runs(task_names, refresh_history, host=leader_fe)
+                if task_runs is None:
+                    print("Warning: Could not get refresh history from information_schema.task_runs")
+                    task_runs = {}
+                refresh_stats = None
+                if refresh_since:
+                    refresh_stats = self.get_mv_refresh_stats(refresh_since, task_names, host=leader_fe)
+
                 for row in results:
                     db_name = row['TABLE_SCHEMA']
                     if db_name not in mv_info:
@@ -482,29 +3151,24 @@ class StarRocksDoctor:
 
                     # Get latest refresh history
                     task_name = row['TASK_NAME']
-                    if task_name and task_name.strip():  # Check if task_name exists and is not empty
-                        try:
-                            refresh_history = self.execute_query("""
-                                SELECT 
-                                    QUERY_ID,
-                                    DATE_FORMAT(FINISH_TIME, '%%Y-%%m-%%d %%H:%%i:%%s') as FINISH_TIME,
-                                    State,
-                                    ERROR_MESSAGE
-                                FROM information_schema.task_runs
-                                WHERE TASK_NAME = %s
-                                ORDER BY FINISH_TIME DESC
-                                LIMIT 1
-                            """, (task_name,))
-                            mv_info[db_name][mv_name]['latest_refresh'] = refresh_history[0] if refresh_history else None
-                        except Exception as e:
-                            print(f"Warning: Could not get refresh history for {db_name}.{mv_name}: {e}")
-                            mv_info[db_name][mv_name]['latest_refresh'] = None
-                    else:
-                        mv_info[db_name][mv_name]['latest_refresh'] = None
+                    runs = task_runs.get(task_name) if task_name and task_name.strip() else None
+                    mv_info[db_name][mv_name]['latest_refresh'] = {
+                        key: runs[0][key] for key in ('QUERY_ID', 'FINISH_TIME', 'State', 'ERROR_MESSAGE')
+                    } if runs else None
+                    if refresh_history > 1:
+                        mv_info[db_name][mv_name]['recent_refreshes'] = runs or []
+                    if refresh_stats is not None:
+                        mv_info[db_name][mv_name]['refresh_stats'] = refresh_stats.get(task_name)
 
                     # Get all dependencies including nested ones
-                    dependencies = self._get_all_dependencies(db_name, mv_name)
-                    mv_info[db_name][mv_name]['dependencies'] = dependencies
+                    if graph:
+                        mv_info[db_name][mv_name]['dependencies'] = graph.dependencies(db_name, mv_name)
+                        mv_info[db_name][mv_name]['fan_in'] = graph.fan_in(db_name, mv_name)
+                        mv_info[db_name][mv_name]['fan_out'] = graph.fan_out(db_name, mv_name)
+                        mv_info[db_name][mv_name]['refresh_order'] = refresh_order.get((db_name, mv_name))
+                    else:
+                        dependencies = self._get_all_dependencies(db_name, mv_name, host=leader_fe)
+                        mv_info[db_name][mv_name]['dependencies'] = dependencies
 
                     # Try to get partition info and data size from information_schema.partitions_meta first
                     try:
@@ -513,7 +3177,7 @@ class StarRocksDoctor:
                             FROM information_schema.partitions_meta 
                             WHERE DB_NAME = %s AND TABLE_NAME = %s
                         """
-                        meta_results = self.execute_query(meta_query, (db_name, mv_name))
+                        meta_results = self.execute_query(meta_query, (db_name, mv_name), host=leader_fe)
                         if meta_results:
                             # Convert data sizes to MB
                             for partition in meta_results:
@@ -528,7 +3192,7 @@ class StarRocksDoctor:
                     except Exception as e:
                         print(f"Warning: Could not get partition info from information_schema.partitions_meta: {e}")
                         # Fallback to SHOW PARTITIONS
-                        mv_partitions = self.execute_query(f"SHOW PARTITIONS FROM `{db_name}`.`{mv_name}`")
+                        mv_partitions = self.execute_query(f"SHOW PARTITIONS FROM `{db_name}`.`{mv_name}`", host=leader_fe)
                         mv_info[db_name][mv_name]['partitions'] = mv_partitions if mv_partitions else []
 
             return mv_info
@@ -536,48 +3200,69 @@ class StarRocksDoctor:
             print(f"Error collecting materialized view information: {e}")
             return {}
 
-    def collect_tablet_metadata(self, tablet_id=None):
-        """Collect tablet metadata information including three replicas
+    def iter_tablet_metadata(self, tablet_id=None, parallelism=None, progress_interval=5):
+        """Collect tablet metadata, expanding replica details concurrently
+        SHOW PROC '/tablets/{id}' statements are spread over the leader and the
+        alive followers with at most parallelism statements in flight.
         Args:
             tablet_id: Optional. If specified, only collect info for this tablet
+            parallelism: Maximum concurrent replica lookups, defaults to self.parallelism
+            progress_interval: Seconds between progress reports
+        Yields:
+            tuple: (tablet_id, tablet info) in completion order
         """
+        # Find leader FE
+        leader_fe = self.get_leader_fe()
+        if not leader_fe:
+            print("Error: Could not find leader FE")
+            return
+
+        query = "SHOW PROC '/tablets'"
+        if tablet_id:
+            query += f" WHERE TabletId = {tablet_id}"
+        hosts = self.get_read_hosts(leader_fe)
+
+        done = 0
+        start = last_report = time.monotonic()
         try:
-            # Connect to leader FE
-            leader_fe = self.get_leader_fe()
-            if not leader_fe:
-                print("Error: Could not find leader FE")
-                return {}
+            # The tablet list is streamed from the leader while the replica lookups
+            # run, so only the rows in flight are held in memory
+            with self.stream_query(query, host=leader_fe) as stream:
+                tablet_id_of = stream.getter('TabletId')
 
-            # Switch connection to leader FE
-            self.connection.close()
-            self.host = leader_fe
-            if not self.connect():
-                return {}
-
-            tablet_info = {}
-            query = "SHOW PROC '/tablets'"
-            if tablet_id:
-                query += f" WHERE TabletId = {tablet_id}"
-            
-            results = self.execute_query(query)
-            if results:
-                for row in results:
-                    tablet_id = row['TabletId']
-                    tablet_info[tablet_id] = {
-                        'replicas': [],
-                        'schema_hash': row.get('SchemaHash'),
-                        'state': row.get('State'),
-                        'data_size': row.get('DataSize'),
-                        'row_count': row.get('RowCount')
-                    }
-                    
+                def expand(conn, row):
                     # Get replica information
-                    replica_query = f"SHOW PROC '/tablets/{tablet_id}'"
-                    replicas = self.execute_query(replica_query)
-                    if replicas:
-                        tablet_info[tablet_id]['replicas'] = replicas
+                    return self._fetch(conn, f"SHOW PROC '/tablets/{tablet_id_of(row)}'")
+
+                for row, replicas, error in self.map_concurrently(expand, stream, parallelism, hosts):
+                    tablet = tablet_id_of(row)
+                    if error:
+                        print(f"Warning: Could not get replicas for tablet {tablet}: {error}")
+                    done += 1
+                    yield tablet, {
+                        'replicas': replicas or [],
+                        'schema_hash': stream.get(row, 'SchemaHash'),
+                        'state': stream.get(row, 'State'),
+                        'data_size': stream.get(row, 'DataSize'),
+                        'row_count': stream.get(row, 'RowCount')
+                    }
+                    now = time.monotonic()
+                    if now - last_report >= progress_interval:
+                        last_report = now
+                        print(f"Expanded {done} tablets ({done / (now - start):.1f} tablets/sec)")
+        except Error as e:
+            print(f"Error executing query: {query}\nError: {e}")
+            return
+        elapsed = time.monotonic() - start
+        print(f"Expanded {done} tablets in {elapsed:.1f}s ({done / elapsed if elapsed else done:.1f} tablets/sec)")
 
-            return tablet_info
+    def collect_tablet_metadata(self, tablet_id=None):
+        """Collect tablet metadata information including three replicas
+        Args:
+            tablet_id: Optional. If specified, only collect info for this tablet
+        """
+        try:
+            return dict(self.iter_tablet_metadata(tablet_id))
         except Exception as e:
             print(f"Error collecting tablet metadata: {e}")
             return {}
@@ -589,14 +3274,80 @@ class StarRocksDoctor:
         Returns:
             str: The backend IP address, or None if not found
         """
-        try:
-            host_id_mapping = self.get_backend_host_id_mapping()
-            # Reverse the mapping to find host by id
-            id_host_mapping = {v: k for k, v in host_id_mapping.items()}
-            return id_host_mapping.get(backend_id)
-        except Exception as e:
-            print(f"Error getting backend IP: {e}")
-            return None
+        return self.topology.backend_host(backend_id)
+
+    def plan_replica_repair(self, conn, tablet_id):
+        """Work out which replica of a tablet, if any, should be set bad
+        Args:
+            conn: Connection to run SHOW TABLET and its DetailCmd on
+            tablet_id: The tablet ID to check
+        Returns:
+            dict: tablet_id, action ('set_bad', 'none' or 'error'), backend_id, backend_ip and reason
+        """
+        plan = {'tablet_id': str(tablet_id), 'action': 'error', 'backend_id': None, 'backend_ip': None, 'reason': None}
+        if not str(tablet_id).isdigit():
+            plan['reason'] = f"Invalid tablet ID {tablet_id!r}"
+            return plan
+
+        # Get tablet information
+        tablet_info = self._fetch(conn, f"SHOW TABLET {tablet_id}")
+        if not tablet_info:
+            plan['reason'] = f"No information found for tablet {tablet_id}"
+            return plan
+
+        # Get DetailCmd and execute it to get replica information
+        detail_cmd = tablet_info[0].get('DetailCmd')
+        if not detail_cmd:
+            plan['reason'] = f"No DetailCmd found for tablet {tablet_id}"
+            return plan
+
+        replicas = self._fetch(conn, detail_cmd)
+        if not replicas:
+            plan['reason'] = f"No replicas found for tablet {tablet_id}"
+            return plan
+
+        # Check if we have at least three replicas
+        if len(replicas) < 3:
+            plan['reason'] = f"Tablet {tablet_id} does not have at least three replicas. Found {len(replicas)} replicas."
+            return plan
+
+        # Never set a second replica bad, e.g. when a run is repeated after it was interrupted
+        for replica in replicas:
+            if replica.get('IsBad') == 'true':
+                plan['action'] = 'none'
+                plan['reason'] = f"Replica on backend {replica.get('BackendId')} is already bad for tablet {tablet_id}"
+                return plan
+
+        # Only the first replica with issues is set bad
+        for replica in replicas:
+            if replica.get('LstFailedVersion') != '-1' or replica.get('IsErrorState') == 'true':
+                backend_id = replica.get('BackendId')
+                if not backend_id:
+                    plan['reason'] = f"Could not find BackendId for replica in tablet {tablet_id}"
+                    return plan
+
+                # Resolved from the cached topology
+                backend_ip = self.get_backend_ip_by_id(backend_id)
+                if not backend_ip:
+                    plan['reason'] = f"Could not find IP for backend {backend_id}"
+                    return plan
+
+                plan.update(action='set_bad', backend_id=str(backend_id), backend_ip=backend_ip,
+                            reason=f"LstFailedVersion {replica.get('LstFailedVersion')}, "
+                                   f"IsErrorState {replica.get('IsErrorState')}")
+                return plan
+
+        plan['action'] = 'none'
+        plan['reason'] = f"No replicas found with issues for tablet {tablet_id}"
+        return plan
+
+    def apply_replica_repair(self, conn, plan):
+        """Set the replica chosen by plan_replica_repair bad
+        Args:
+            conn: Connection to the leader FE
+            plan: A plan with action 'set_bad'
+        """
+        self._fetch(conn, f"""ADMIN SET REPLICA STATUS PROPERTIES("tablet_id" = "{plan['tablet_id']}", "backend_id" = "{plan['backend_id']}", "status" = "bad")""")
 
     def check_and_set_bad_replica(self, tablet_id):
         """Check if tablet has three replicas and set bad replica if needed
@@ -606,105 +3357,178 @@ class StarRocksDoctor:
             bool: True if operation was successful, False otherwise
         """
         try:
-            # Connect to leader FE
+            # Find leader FE
             leader_fe = self.get_leader_fe()
             if not leader_fe:
                 print("Error: Could not find leader FE")
                 return False
 
-            # Switch connection to leader FE
-            if self.connection:
-                self.connection.close()
-            self.host = leader_fe
-            if not self.connect():
-                return False
-
-            # Get tablet information
-            tablet_query = f"SHOW TABLET {tablet_id}"
-            tablet_info = self.execute_query(tablet_query)
-            
-            if not tablet_info:
-                print(f"Error: No information found for tablet {tablet_id}")
-                return False
-
-            # Get DetailCmd and execute it to get replica information
-            detail_cmd = tablet_info[0].get('DetailCmd')
-            if not detail_cmd:
-                print(f"Error: No DetailCmd found for tablet {tablet_id}")
-                return False
-
-            replicas = self.execute_query(detail_cmd)
-            if not replicas:
-                print(f"Error: No replicas found for tablet {tablet_id}")
-                return False
-
-            # Check if we have at least three replicas
-            if len(replicas) < 3:
-                print(f"Error: Tablet {tablet_id} does not have at least three replicas. Found {len(replicas)} replicas.")
-                return False
-
-            # Counter to ensure only one set bad operation is executed
-            set_bad_count = 0
-
-            # Check each replica for issues
-            for replica in replicas:
-                if set_bad_count > 0:
-                    break  # Skip remaining replicas if we've already set one as bad
-
-                if replica.get('LstFailedVersion') != '-1' or replica.get('IsErrorState') == 'true':
-                    backend_id = replica.get('BackendId')
-                    if not backend_id:
-                        print(f"Error: Could not find BackendId for replica in tablet {tablet_id}")
-                        return False
-
-                    # Get backend IP
-                    backend_ip = self.get_backend_ip_by_id(backend_id)
-                    if not backend_ip:
-                        print(f"Error: Could not find IP for backend {backend_id}")
-                        return False
-
-                    # Set the replica as bad
-                    set_bad_cmd = f"""ADMIN SET REPLICA STATUS PROPERTIES("tablet_id" = "{tablet_id}", "backend_id" = "{backend_id}", "status" = "bad")"""
-                    try:
-                        self.execute_query(set_bad_cmd)
-                        print(f"Successfully set replica on {backend_ip} (backend_id: {backend_id}) as bad for tablet {tablet_id}")
-                        set_bad_count += 1
-                        return True
-                    except Exception as e:
-                        print(f"Error setting bad replica: {e}")
-                        return False
-
-            if set_bad_count == 0:
-                print(f"No replicas found with issues for tablet {tablet_id}")
+            with self.pool.connection(leader_fe) as conn:
+                plan = self.plan_replica_repair(conn, tablet_id)
+                if plan['action'] == 'error':
+                    print(f"Error: {plan['reason']}")
+                    return False
+                if plan['action'] == 'none':
+                    print(plan['reason'])
+                    return True
+                self.apply_replica_repair(conn, plan)
+            print(f"Successfully set replica on {plan['backend_ip']} (backend_id: {plan['backend_id']}) "
+                  f"as bad for tablet {tablet_id}")
             return True
 
         except Exception as e:
             print(f"Error checking and setting bad replica: {e}")
             return False
 
+    @staticmethod
+    def read_repair_journal(journal_path):
+        """Tablet IDs that an earlier batch repair finished: applied, or nothing to do
+        Args:
+            journal_path: JSONL journal written by repair_replicas
+        Returns:
+            set: Tablet IDs as strings
+        """
+        finished = set()
+        if not os.path.exists(journal_path):
+            return finished
+        with open(journal_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Last line cut short by an interrupted run
+                    continue
+                if entry.get('status') in ('applied', 'no_action'):
+                    finished.add(str(entry.get('tablet_id')))
+        return finished
+
+    def repair_replicas(self, tablet_ids, journal_path, dry_run=False, rate_limit=5.0, parallelism=None,
+                        plan_format='jsonl', progress_interval=5):
+        """Check and set bad replicas for many tablets
+        Replicas are resolved concurrently over the leader and alive followers
+        against the cached topology. ADMIN SET REPLICA STATUS is sent to the
+        leader one tablet at a time, at most rate_limit per second. Every
+        tablet is appended to the journal once handled; tablets journaled as
+        applied or needing no action are skipped, so an interrupted run picks
+        up where it stopped when started again with the same journal.
+        Args:
+            tablet_ids: Iterable of tablet IDs, consumed lazily
+            journal_path: JSONL progress journal
+            dry_run: Only write the plan to replica_repair_plan_<ts>, change nothing
+            rate_limit: Maximum ADMIN SET REPLICA STATUS statements per second, 0 for no limit
+            parallelism: Maximum concurrent lookups, defaults to self.parallelism
+            plan_format: Output format of the dry-run plan
+            progress_interval: Seconds between progress reports
+        Returns:
+            dict: Number of tablets per status and the file written
+        """
+        leader_fe = self.get_leader_fe()
+        if not leader_fe:
+            print("Error: Could not find leader FE")
+            return {}
+
+        finished = set() if dry_run else self.read_repair_journal(journal_path)
+        counts = {'skipped': 0}
+        if finished:
+            print(f"Resuming from {journal_path}: {len(finished)} tablets already done")
+
+        def pending():
+            for tablet_id in tablet_ids:
+                if str(tablet_id) in finished:
+                    counts['skipped'] += 1
+                    continue
+                yield tablet_id
+
+        def plan_tablet(conn, tablet_id):
+            return self.plan_replica_repair(conn, tablet_id)
+
+        def outcomes():
+            plans = self.map_concurrently(plan_tablet, pending(), parallelism, self.get_read_hosts(leader_fe))
+            for tablet_id, plan, error in plans:
+                if error:
+                    plan = {'tablet_id': str(tablet_id), 'action': 'error', 'backend_id': None,
+                            'backend_ip': None, 'reason': str(error)}
+                yield plan
+
+        def report(done, start, final=False):
+            summary = ', '.join(f"{count} {status}" for status, count in sorted(counts.items()) if count)
+            print(f"Replica repair{' plan' if dry_run else ''}: {done} tablets "
+                  f"{'in' if final else 'after'} {time.monotonic() - start:.1f}s ({summary or 'nothing to do'})")
+
+        start = last_report = time.monotonic()
+        done = 0
+        if dry_run:
+            def plan_rows():
+                nonlocal done, last_report
+                for plan in outcomes():
+                    counts[plan['action']] = counts.get(plan['action'], 0) + 1
+                    done += 1
+                    yield plan
+                    if time.monotonic() - last_report >= progress_interval:
+                        last_report = time.monotonic()
+                        report(done, start)
+            path = self.save_rows_to_file(plan_rows(), 'replica_repair_plan', plan_format)
+            report(done, start, final=True)
+            return {'counts': counts, 'file': path}
+
+        journal_dir = os.path.dirname(journal_path)
+        if journal_dir:
+            os.makedirs(journal_dir, exist_ok=True)
+        interval = 1.0 / rate_limit if rate_limit and rate_limit > 0 else 0
+        next_at = time.monotonic()
+        # End a last line cut short by an interrupted run, so the next entry is not glued to it
+        cut_short = False
+        if os.path.exists(journal_path) and os.path.getsize(journal_path) > 0:
+            with open(journal_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                cut_short = f.read(1) != b'\n'
+        with open(journal_path, 'a') as journal:
+            if cut_short:
+                journal.write('\n')
+            for plan in outcomes():
+                entry = dict(plan)
+                if plan['action'] == 'set_bad':
+                    delay = next_at - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_at = max(next_at, time.monotonic()) + interval
+                    try:
+                        with self.pool.connection(leader_fe) as conn:
+                            self.apply_replica_repair(conn, plan)
+                        entry['status'] = 'applied'
+                        print(f"Successfully set replica on {plan['backend_ip']} (backend_id: {plan['backend_id']}) "
+                              f"as bad for tablet {plan['tablet_id']}")
+                    except Error as e:
+                        entry['status'] = 'failed'
+                        entry['reason'] = str(e)
+                else:
+                    entry['status'] = 'no_action' if plan['action'] == 'none' else 'failed'
+                entry['time'] = datetime.now()
+                journal.write(json.dumps(entry, cls=DateTimeEncoder) + '\n')
+                journal.flush()
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+                done += 1
+                if time.monotonic() - last_report >= progress_interval:
+                    last_report = time.monotonic()
+                    report(done, start)
+        report(done, start, final=True)
+        return {'counts': counts, 'file': journal_path}
+
     def get_modified_session_variables(self):
         """Get modified session variables and their current values
         Returns:
             dict: Dictionary containing modified session variables and their values
         """
         try:
-            # Connect to leader FE
+            # Find leader FE
             leader_fe = self.get_leader_fe()
             if not leader_fe:
                 print("Error: Could not find leader FE")
                 return {}
 
-            # Switch connection to leader FE
-            if self.connection:
-                self.connection.close()
-            self.host = leader_fe
-            if not self.connect():
-                print("Error: Could not connect leader FE")
-                return {}
-
             # Get session variables
             query = "SELECT VARIABLE_NAME, VARIABLE_VALUE, IS_CHANGED FROM information_schema.verbose_session_variables"
-            variables = self.execute_query(query)
+            variables = self.execute_query(query, host=leader_fe)
             
             if not variables:
                 print("Error: Could not get session variables")
@@ -731,22 +3555,15 @@ class StarRocksDoctor:
             dict: Dictionary containing modified BE configurations
         """
         try:
-            # Connect to leader FE
+            # Find leader FE
             leader_fe = self.get_leader_fe()
             if not leader_fe:
                 print("Error: Could not find leader FE")
                 return {}
 
-            # Switch connection to leader FE
-            if self.connection:
-                self.connection.close()
-            self.host = leader_fe
-            if not self.connect():
-                return {}
-
             # Get BE configurations
             query = "SELECT BE_ID, NAME, VALUE, `DEFAULT` FROM information_schema.be_configs"
-            configs = self.execute_query(query)
+            configs = self.execute_query(query, host=leader_fe)
             
             if not configs:
                 print("Error: Could not get BE configurations")
@@ -779,22 +3596,15 @@ class StarRocksDoctor:
             dict: Dictionary containing modified FE configurations
         """
         try:
-            # Connect to leader FE
+            # Find leader FE
             leader_fe = self.get_leader_fe()
             if not leader_fe:
                 print("Error: Could not find leader FE")
                 return {}
 
-            # Switch connection to leader FE
-            if self.connection:
-                self.connection.close()
-            self.host = leader_fe
-            if not self.connect():
-                return {}
-
             # Get FE configurations
             query = "ADMIN SHOW FRONTEND CONFIG"
-            configs = self.execute_query(query)
+            configs = self.execute_query(query, host=leader_fe)
             
             if not configs:
                 print("Error: Could not get FE configurations")
@@ -834,42 +3644,9 @@ class StarRocksDoctor:
         Returns:
             dict: Dictionary containing backend host to id mapping
         """
-        try:
-            # Connect to leader FE
-            leader_fe = self.get_leader_fe()
-            if not leader_fe:
-                print("Error: Could not find leader FE")
-                return {}
-
-            # Switch connection to leader FE
-            if self.connection:
-                self.connection.close()
-            self.host = leader_fe
-            if not self.connect():
-                return {}
-
-            # Get backend information
-            query = "SHOW PROC '/backends'"
-            backends = self.execute_query(query)
-            
-            if not backends:
-                print("Error: Could not get backend information")
-                return {}
-
-            # Create mapping
-            host_id_mapping = {}
-            for backend in backends:
-                host = backend.get('IP')
-                backend_id = backend.get('BackendId')
-                if host and backend_id:
-                    host_id_mapping[host] = backend_id
-            print(f"Backend host-id mapping: {host_id_mapping}")
-
-            return host_id_mapping
-
-        except Exception as e:
-            print(f"Error getting backend host-id mapping: {e}")
-            return {}
+        host_id_mapping = self.topology.backend_host_id_mapping()
+        print(f"Backend host-id mapping: {host_id_mapping}")
+        return host_id_mapping
 
     def get_query_dump(self, sql_file):
         """Get query dump for SQL statements in a file
@@ -901,37 +3678,149 @@ class StarRocksDoctor:
             print(f"Error getting query dump: {e}")
             return {}
 
-    def get_be_stack_trace(self, be_ip):
-        """Get stack trace for all threads on a BE node
+    def capture_be_stacks(self, be_ips=None, samples=1, interval=1.0, parallelism=None, raw_dir=None):
+        """Capture the thread stacks of many BEs concurrently and collapse identical stacks
+        Each sample runs ADMIN EXECUTE on every BE at the same time; dumps are
+        parsed as they arrive, so only the distinct stacks are kept.
         Args:
-            be_ip: BE node IP address
+            be_ips: BE IPs to capture, None for every alive BE
+            samples: Number of dumps per BE
+            interval: Seconds between the starts of two samples
+            parallelism: Maximum concurrent dumps, defaults to self.parallelism
+            raw_dir: Optional directory to also write every raw dump to
         Returns:
-            dict: Dictionary containing stack trace information
+            tuple: (dict with per-BE status and the collapsed stacks, ThreadStackProfile),
+            or (None, None) if there is no BE to capture
         """
-        try:
-            # Get BE ID from IP
-            host_id_mapping = self.get_backend_host_id_mapping()
-            be_id = host_id_mapping.get(be_ip)
-            
-            if not be_id:
-                print(f"Error: Could not find BE ID for IP {be_ip}")
-                return {}
-
-            # Execute stack trace command
-            query = f"ADMIN EXECUTE ON {be_id} 'System.print(ExecEnv.get_stack_trace_for_all_threads())'"
-            result = self.execute_query(query)
-            
-            if result:
-                return {
-                    'be_ip': be_ip,
-                    'be_id': be_id,
-                    'stack_trace': result[0]['result']
-                }
-            return {}
-        except Exception as e:
-            print(f"Error getting BE stack trace: {e}")
+        if be_ips is None:
+            targets = [(backend['IP'], str(backend['BackendId'])) for backend in self.topology.backends()
+                       if backend.get('IP') and str(backend.get('Alive')).lower() == 'true']
+        else:
+            targets = []
+            for be_ip in be_ips:
+                be_id = self.topology.backend_id(be_ip)
+                if be_id:
+                    targets.append((be_ip, be_id))
+                else:
+                    print(f"Error: Could not find BE ID for IP {be_ip}")
+        leader_fe = self.get_leader_fe()
+        if not targets or not leader_fe:
+            print("Error: No BE to capture stacks from")
+            return None, None
+        if raw_dir:
+            os.makedirs(raw_dir, exist_ok=True)
+
+        profile = ThreadStackProfile()
+        backends = {be_ip: {'be_id': be_id, 'samples': 0, 'threads': 0, 'errors': []} for be_ip, be_id in targets}
+
+        def capture(conn, target):
+            be_ip, be_id, sample = target
+            rows = self._fetch(conn, f"ADMIN EXECUTE ON {be_id} 'System.print(ExecEnv.get_stack_trace_for_all_threads())'")
+            text = rows[0]['result'] if rows else ''
+            if raw_dir:
+                with open(os.path.join(raw_dir, f"{be_ip}_{sample + 1}.txt"), 'w') as f:
+                    f.write(text)
+            return ThreadStackProfile.parse(text)
+
+        start = time.monotonic()
+        for sample in range(samples):
+            # Samples start on a fixed schedule, however long the previous one took
+            delay = start + sample * interval - time.monotonic()
+            if sample and delay > 0:
+                time.sleep(delay)
+            work = [(be_ip, be_id, sample) for be_ip, be_id in targets]
+            for (be_ip, _, _), threads, error in self.map_concurrently(capture, work, parallelism, [leader_fe]):
+                if error:
+                    print(f"Warning: Could not get stack trace of BE {be_ip}: {error}")
+                    backends[be_ip]['errors'].append(f"sample {sample + 1}: {error}")
+                    continue
+                profile.add(be_ip, threads)
+                backends[be_ip]['samples'] += 1
+                backends[be_ip]['threads'] += len(threads)
+            print(f"Captured stack sample {sample + 1}/{samples} of {len(targets)} BEs")
+
+        result = {'samples': samples, 'interval_s': interval, 'backends': backends}
+        result.update(profile.report())
+        return result, profile
+
+    def get_tablet_snapshot(self, refresh=False):
+        """Load the be_tablets snapshot shared by the tablet checks
+        Args:
+            refresh: Scan again even if a snapshot was already taken in this run
+        Returns:
+            TabletSnapshot: The snapshot, or None if it could not be taken
+        """
+        if refresh or not self._tablet_snapshot_loaded:
+            start = time.monotonic()
+            self._tablet_snapshot = TabletSnapshot.load(self)
+            self._tablet_snapshot_loaded = True
+            if self._tablet_snapshot is not None:
+                print(f"Scanned {len(self._tablet_snapshot)} tablet replicas in {time.monotonic() - start:.1f}s")
+        return self._tablet_snapshot
+
+    def collect_show_tablets(self, parallelism=None, refresh=False):
+        """Run SHOW TABLETS for every table, used when be_tablets returns nothing
+        The statements run concurrently over the alive FEs and the result is kept
+        for the rest of the run, so every fallback check shares one pass.
+        Args:
+            parallelism: Maximum concurrent SHOW TABLETS, defaults to self.parallelism
+            refresh: Collect again even if a previous pass exists
+        Returns:
+            dict: (database, table) -> list of {'TabletId', 'BackendId', 'DataSize'}, one per replica
+        """
+        if self._show_tablets is not None and not refresh:
+            return self._show_tablets
+
+        tables = self.execute_query("""
+            SELECT DISTINCT TABLE_SCHEMA, TABLE_NAME 
+            FROM information_schema.tables_config
+        """)
+        if not tables:
             return {}
 
+        def show_tablets(conn, table):
+            start = time.monotonic()
+            rows = self._fetch(conn, f"SHOW TABLETS FROM `{table['TABLE_SCHEMA']}`.`{table['TABLE_NAME']}`")
+            # Keep only the columns the checks read
+            tablets = [{'TabletId': row['TabletId'], 'BackendId': row.get('BackendId'), 'DataSize': row['DataSize']}
+                       for row in rows if row.get('DataSize')]
+            return tablets, time.monotonic() - start
+
+        start = time.monotonic()
+        result = {}
+        latencies = []
+        for table, value, error in self.map_concurrently(show_tablets, tables, parallelism, self.get_read_hosts()):
+            key = (table['TABLE_SCHEMA'], table['TABLE_NAME'])
+            if error:
+                print(f"Warning: SHOW TABLETS failed for {key[0]}.{key[1]}: {error}")
+                continue
+            result[key], latency = value
+            latencies.append((latency, key))
+        print(f"Collected SHOW TABLETS for {len(result)}/{len(tables)} tables in {time.monotonic() - start:.1f}s")
+        self._report_latency_outliers(latencies)
+
+        self._show_tablets = result
+        return result
+
+    def _report_latency_outliers(self, latencies, factor=5, min_seconds=1.0, limit=10):
+        """Print tables whose SHOW TABLETS took much longer than the median
+        Args:
+            latencies: List of (seconds, (database, table))
+            factor: How many times the median a latency must exceed
+            min_seconds: Latencies below this are never reported
+            limit: Maximum number of tables to print
+        """
+        if not latencies:
+            return
+        ordered = sorted(latencies, reverse=True)
+        median = ordered[len(ordered) // 2][0]
+        outliers = [(latency, key) for latency, key in ordered
+                    if latency >= min_seconds and latency > median * factor]
+        if outliers:
+            print(f"Slow SHOW TABLETS (median {median:.3f}s):")
+            for latency, (db_name, table_name) in outliers[:limit]:
+                print(f"  {db_name}.{table_name}: {latency:.3f}s")
+
     def check_empty_partitions(self, limit=100):
         """检查数据为空的表或分区，按空分区个数倒序排序
         
@@ -1040,6 +3929,28 @@ class StarRocksDoctor:
             list: 符合条件的表信息列表
         """
         try:
+            snapshot = self.get_tablet_snapshot()
+            if snapshot:
+                # 数据大小取自 be_tablets 快照，不再单独扫描 be_tablets
+                sizes = snapshot.data_size_by_table()
+                tables = self.execute_query("""
+                    SELECT TABLE_SCHEMA, TABLE_NAME, PROPERTIES
+                    FROM information_schema.tables_config
+                    WHERE TABLE_MODEL = "PRIMARY_KEYS"
+                    AND PROPERTIES LIKE '%enable_persistent_index":"false"%'
+                """) or []
+                result = []
+                for table in tables:
+                    size_gb = sizes.get((table['TABLE_SCHEMA'], table['TABLE_NAME']), 0) / (1024 ** 3)
+                    result.append({
+                        'database_name': table['TABLE_SCHEMA'],
+                        'table_name': table['TABLE_NAME'],
+                        'properties': table['PROPERTIES'],
+                        'data_size_gb': size_gb,
+                        'estimated_memory_usage_gb': size_gb * 0.15
+                    })
+                return sorted(result, key=lambda x: x['data_size_gb'], reverse=True)
+
             query = """
                 WITH TableDataSize AS (
                     -- 计算每个表的数据大小
@@ -1086,12 +3997,17 @@ class StarRocksDoctor:
             list: 符合条件的tablet信息列表
         """
         try:
+            snapshot = self.get_tablet_snapshot()
+            if snapshot:
+                return snapshot.large_tablets(size_gb)
+
             # 首先尝试从 be_tablets 获取数据
             query = """
                 SELECT 
                     t.DB_NAME,
                     t.TABLE_NAME,
                     bt.TABLET_ID,
+                    bt.BE_ID,
                     bt.DATA_SIZE
                 FROM information_schema.be_tablets bt
                 JOIN information_schema.tables_config t 
@@ -1102,24 +4018,18 @@ class StarRocksDoctor:
             
             if not result:
                 # 如果从 be_tablets 获取失败，尝试从 show tablet 获取
-                tables = self.execute_query("""
-                    SELECT DISTINCT TABLE_SCHEMA, TABLE_NAME 
-                    FROM information_schema.tables_config
-                """)
-                
                 large_tablets = []
-                for table in tables:
-                    tablets = self.execute_query(f"SHOW TABLETS FROM `{table['TABLE_SCHEMA']}`.`{table['TABLE_NAME']}`")
+                for (db_name, table_name), tablets in self.collect_show_tablets().items():
                     for tablet in tablets:
-                        if tablet.get('DataSize'):
-                            size = self._convert_to_mb(tablet['DataSize'])
-                            if size > size_gb * 1024:  # 转换为MB
-                                large_tablets.append({
-                                    'DB_NAME': table['TABLE_SCHEMA'],
-                                    'TABLE_NAME': table['TABLE_NAME'],
-                                    'TABLET_ID': tablet['TabletId'],
-                                    'DATA_SIZE': tablet['DataSize']
-                                })
+                        size = self._convert_to_mb(tablet['DataSize'])
+                        if size > size_gb * 1024:  # 转换为MB
+                            large_tablets.append({
+                                'DB_NAME': db_name,
+                                'TABLE_NAME': table_name,
+                                'TABLET_ID': tablet['TabletId'],
+                                'BE_ID': tablet['BackendId'],
+                                'DATA_SIZE': tablet['DataSize']
+                            })
                 return large_tablets
                 
             return result
@@ -1137,11 +4047,16 @@ class StarRocksDoctor:
             list: 符合条件的tablet信息列表
         """
         try:
+            snapshot = self.get_tablet_snapshot()
+            if snapshot:
+                return snapshot.tablets_with_many_versions(version_threshold)
+
             query = """
                 SELECT 
                     t.DB_NAME,
                     t.TABLE_NAME,
                     bt.TABLET_ID,
+                    bt.BE_ID,
                     bt.NUM_ROWSET
                 FROM information_schema.be_tablets bt
                 JOIN information_schema.tables_config t 
@@ -1164,6 +4079,10 @@ class StarRocksDoctor:
             list: 符合条件的表信息列表
         """
         try:
+            snapshot = self.get_tablet_snapshot()
+            if snapshot:
+                return snapshot.small_tablets(size_mb, limit)
+
             # 首先尝试从 be_tablets 获取数据
             query = """
                 SELECT 
@@ -1183,28 +4102,21 @@ class StarRocksDoctor:
             
             if not result:
                 # 如果从 be_tablets 获取失败，尝试从 show tablet 获取
-                tables = self.execute_query("""
-                    SELECT DISTINCT TABLE_SCHEMA, TABLE_NAME 
-                    FROM information_schema.tables_config
-                """)
-                
                 small_tablets = {}
-                for table in tables:
-                    tablets = self.execute_query(f"SHOW TABLETS FROM `{table['TABLE_SCHEMA']}`.`{table['TABLE_NAME']}`")
+                for (db_name, table_name), tablets in self.collect_show_tablets().items():
                     small_count = 0
                     tablet_ids = []
                     
                     for tablet in tablets:
-                        if tablet.get('DataSize'):
-                            size = self._convert_to_mb(tablet['DataSize'])
-                            if size < size_mb:
-                                small_count += 1
-                                tablet_ids.append(tablet['TabletId'])
+                        size = self._convert_to_mb(tablet['DataSize'])
+                        if size < size_mb:
+                            small_count += 1
+                            tablet_ids.append(tablet['TabletId'])
                     
                     if small_count > 0:
-                        small_tablets[f"{table['TABLE_SCHEMA']}.{table['TABLE_NAME']}"] = {
-                            'DB_NAME': table['TABLE_SCHEMA'],
-                            'TABLE_NAME': table['TABLE_NAME'],
+                        small_tablets[f"{db_name}.{table_name}"] = {
+                            'DB_NAME': db_name,
+                            'TABLE_NAME': table_name,
                             'small_tablet_count': small_count,
                             'tablet_ids': ','.join(map(str, tablet_ids))
                         }
@@ -1217,6 +4129,30 @@ class StarRocksDoctor:
             print(f"Error checking small tablets: {e}")
             return []
 
+    def iter_tablet_checks(self, size_gb=5, size_mb=500, version_threshold=900):
+        """Run all tablet module checks, yielding result rows one at a time
+        Per-replica checks are streamed from the be_tablets snapshot when it is
+        available; the other checks return small, table-level lists.
+        Yields:
+            dict: Result row with a 'check' column naming the check
+        """
+        snapshot = self.get_tablet_snapshot()
+        checks = [
+            ('empty_partitions', self.check_empty_partitions),
+            ('single_replica_tables', self.check_single_replica_tables),
+            ('single_bucket_large_tables', self.check_single_bucket_large_tables),
+            ('unpartitioned_large_tables', self.check_unpartitioned_large_tables),
+            ('tables_without_index_disk', self.check_tables_without_index_disk),
+            ('large_tablets', lambda: snapshot.iter_large_tablets(size_gb) if snapshot
+                else self.check_large_tablets(size_gb)),
+            ('tablets_with_many_versions', lambda: snapshot.iter_tablets_with_many_versions(version_threshold)
+                if snapshot else self.check_tablets_with_many_versions(version_threshold)),
+            ('small_tablets', lambda: self.check_small_tablets(size_mb))
+        ]
+        for name, check in checks:
+            for row in check() or []:
+                yield dict({'check': name}, **row)
+
     def get_yesterdays_tables(self):
         """获取昨天新建的表信息"""
         try:
@@ -1237,43 +4173,30 @@ class StarRocksDoctor:
     def get_fe_log_paths(self):
         """Get log paths for all FE nodes"""
         try:
-            fe_nodes = self.execute_query("SHOW PROC '/frontends'")
+            fe_nodes = self.topology.frontends()
             if not fe_nodes:
                 print("Error: Could not get FE nodes information")
                 return {}
 
-            log_paths = {}
-            original_host = self.host
+            def fetch_log_dir(conn, fe_host):
+                return self._fetch(conn, "ADMIN SHOW FRONTEND CONFIG LIKE 'sys_log_dir'")
 
-            for fe in fe_nodes:
-                fe_host = fe['IP']
-                try:
-                    if self.connection and self.connection.is_connected():
-                        self.connection.close()
-                    self.host = fe_host
-                    if not self.connect():
-                        print(f"Warning: Could not connect to FE {fe_host}:{self.port}")
-                        log_paths[fe_host] = "Connection Failed"
-                        continue
-
-                    query = "ADMIN SHOW FRONTEND CONFIG LIKE 'sys_log_dir'"
-                    log_config = self.execute_query(query)
-                    if log_config:
-                        log_paths[fe_host] = log_config[0]['Value']
-                    else:
-                        log_paths[fe_host] = "Not Found"
-
-                except Error as e:
-                    print(f"Error collecting log path from FE {fe_host}: {e}")
-                    log_paths[fe_host] = f"Error: {e}"
-                finally:
-                    if self.connection and self.connection.is_connected():
-                        self.connection.close()
+            log_paths = {}
 
-            # Restore original connection
-            self.host = original_host
-            if not self.connect():
-                print("Error: Could not restore connection to original FE")
+            for fe_host, log_config, error in self.fan_out([fe['IP'] for fe in fe_nodes], fetch_log_dir):
+                if isinstance(error, TimeoutError):
+                    print(f"Warning: Timed out getting log path from FE {fe_host}:{self.port}")
+                    log_paths[fe_host] = "Timed Out"
+                elif isinstance(error, (errors.InterfaceError, errors.OperationalError)):
+                    print(f"Warning: Could not connect to FE {fe_host}:{self.port}")
+                    log_paths[fe_host] = "Connection Failed"
+                elif error:
+                    print(f"Error collecting log path from FE {fe_host}: {error}")
+                    log_paths[fe_host] = f"Error: {error}"
+                elif log_config:
+                    log_paths[fe_host] = log_config[0]['Value']
+                else:
+                    log_paths[fe_host] = "Not Found"
 
             return log_paths
         except Error as e:
@@ -1289,14 +4212,11 @@ class StarRocksDoctor:
                 print("Could not retrieve BE log paths.")
                 return {}
 
-            host_id_mapping = self.get_backend_host_id_mapping()
-            id_host_mapping = {v: k for k, v in host_id_mapping.items()}
-
             log_paths = {}
             for row in results:
                 be_id = str(row['BE_ID'])
                 log_path = row['VALUE']
-                be_ip = id_host_mapping.get(be_id, f"Unknown BE ID: {be_id}")
+                be_ip = self.topology.backend_host(be_id) or f"Unknown BE ID: {be_id}"
                 log_paths[be_ip] = log_path
             print(f"BE log paths: {log_paths}")
 
@@ -1362,6 +4282,23 @@ class StarRocksDoctor:
         except Exception as e:
             return f"Error checking manager logs: {e}"
 
+    def get_current_queries(self):
+        """SHOW PROC '/current_queries' from every FE, tagged with fe_host
+        Returns:
+            list: Running queries, or None if no FE answered
+        """
+        current_queries = None
+        for fe_host, result, error in self.fan_out(self.topology.frontend_hosts(),
+                                                   lambda conn, host: self._fetch(conn, "SHOW PROC '/current_queries'")):
+            if error:
+                print(f"Warning: Could not get current queries from FE {fe_host}: {error}")
+                continue
+            current_queries = current_queries or []
+            for query in result:
+                query['fe_host'] = fe_host
+                current_queries.append(query)
+        return current_queries
+
     def get_proc_statistic(self):
         """Get SHOW PROC '/statistic' result"""
         results = self.execute_query("SHOW PROC '/statistic'")
@@ -1401,59 +4338,159 @@ class StarRocksDoctor:
 
         return processed_stats
 
-    def _fetch_remote_file(self, ip, ssh_port, remote_path, local_path):
-        """Helper to fetch a single file using scp."""
+    def _fetch_remote_file(self, session, remote_path, local_path):
+        """Helper to fetch a single file over the node's SSH session."""
         try:
-            print(f"  Fetching {remote_path} from {ip} to {local_path}")
-            command = [
-                'scp', '-P', str(ssh_port),
-                '-o', 'StrictHostKeyChecking=no',
-                '-o', 'UserKnownHostsFile=/dev/null',
-                f'{ip}:{remote_path}',
-                local_path
-            ]
-            subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+            print(f"  [{session.host}] Fetching {remote_path} to {local_path}")
+            result = session.run_to_file(f"cat '{remote_path}'", local_path)
+            if result.returncode != 0:
+                print(f"  [{session.host}] Could not fetch {remote_path}: {result.stderr.strip()}")
+                os.remove(local_path)
+                return False
             return True
-        except subprocess.CalledProcessError as e:
-            print(f"  Could not fetch {remote_path} with scp: {e.stderr}")
-            return False
         except Exception as e:
-            print(f"  An error occurred while fetching {remote_path}: {e}")
+            print(f"  [{session.host}] An error occurred while fetching {remote_path}: {e}")
             return False
 
 
-    def _execute_remote_cmd_and_save_output(self, ip, ssh_port, cmd, local_path):
+    def _execute_remote_cmd_and_save_output(self, session, cmd, local_path):
         """Executes a command on the remote host and saves stdout to a local file."""
         try:
-            print(f"  Executing remote command on {ip}: {cmd}")
-            ssh_command = [
-                'ssh', '-p', str(ssh_port),
-                '-o', 'StrictHostKeyChecking=no',
-                '-o', 'UserKnownHostsFile=/dev/null',
-                ip,
-                cmd
-            ]
-            result = subprocess.run(ssh_command, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=30)
-            output = result.stdout
+            print(f"  [{session.host}] Executing remote command: {cmd}")
+            result = session.run_to_file(cmd, local_path)
             error = result.stderr
 
             # Log stderr unless it's a "file not found" error, which is common
             if error and "No such file or directory" not in error:
-                print(f"  Stderr from remote command: {error.strip()}")
+                print(f"  [{session.host}] Stderr from remote command: {error.strip()}")
 
-            with open(local_path, 'w', encoding='utf-8') as f:
-                f.write(output)
+            print(f"  [{session.host}] Saved output to {local_path}")
+            return True
+        except Exception as e:
+            print(f"  [{session.host}] Failed to execute remote command '{cmd}': {e}")
+            return False
 
-            print(f"  Saved output to {local_path}")
+    def _extract_remote_log(self, session, log_file, style, pattern, local_path, since=None, until=None,
+                            ignore_case=False, checkpoints=None, timeout=600):
+        """Filter a log on the node by time window and pattern, fetching the result compressed
+        With since, rotated and gzipped files next to log_file are included and
+        plain files are binary-searched to the window start instead of scanned.
+        Args:
+            session: RemoteSession of the node
+            log_file: Current log path, e.g. .../fe.warn.log or .../be.INFO
+            style: 'fe' for 'YYYY-MM-DD HH:MM:SS' lines, 'be' for glog 'IMMDD HH:MM:SS' lines
+            pattern: Extended regex lines must match
+            ignore_case: Match pattern case-insensitively
+            checkpoints: Optional LogCheckpointStore; only lines appended since the
+                         previous run are read, and the new position is recorded
+            local_path: Where to save the matching lines
+            since: Optional window start (datetime)
+            until: Optional window end (datetime)
+        """
+        try:
+            window = f" between {since} and {until or 'now'}" if since else ''
+            print(f"  [{session.host}] Extracting '{pattern}' from {log_file}{window}")
+            args = [
+                log_file, style, pattern, 'i' if ignore_case else '-',
+                since.strftime('%Y%m%d%H%M%S') if since else '0',
+                until.strftime('%Y%m%d%H%M%S') if until else '99999999999999',
+                int(time.mktime(since.timetuple())) if since else 0
+            ]
+            if checkpoints is not None:
+                previous = checkpoints.get(session.host, log_file)
+                if previous:
+                    args += [previous['inode'], previous['offset'], previous['time']]
+                else:
+                    args += [0, 0, 0]
+                # A position read up to --until is not where the next run should resume
+                args.append('-' if until else '1')
+                args.append((previous or {}).get('head') or '-')
+            result = session.run_script_to_gzip_file(REMOTE_LOG_WINDOW_SCRIPT, args, local_path, timeout)
+            stderr = []
+            position = None
+            for line in result.stderr.splitlines():
+                fields = line.split()
+                if len(fields) in (4, 5) and fields[0] == 'CHECKPOINT':
+                    position = fields[1:]
+                else:
+                    stderr.append(line)
+            stderr = '\n'.join(stderr).strip()
+            # Only move the position forward once the lines are safely on disk
+            if checkpoints is not None and position and 'Could not decompress output' not in stderr:
+                checkpoints.update(session.host, log_file, position[0], int(position[1]), int(position[2]),
+                                   position[3] if len(position) > 3 else None)
+            if stderr and "No such file or directory" not in stderr:
+                print(f"  [{session.host}] Stderr from log extraction: {stderr}")
+            print(f"  [{session.host}] Saved output to {local_path}")
             return True
         except Exception as e:
-            print(f"  Failed to execute remote command on {ip} '{cmd}': {e}")
+            print(f"  [{session.host}] Failed to extract {log_file}: {e}")
             return False
 
-    def collect_data_from_all_nodes(self, ssh_port=22, fe_http_port=8030, be_http_port=8040):
+    def _collect_node_data(self, session, role, log_dir, node_output_dir, since=None, until=None, checkpoints=None):
+        """Run every collection step for one node over its SSH session
+        Returns:
+            dict: Node result without status and timing
+        """
+        node_results = {}
+        # 1. Get log and conf directories
+        conf_dir = None
+        if log_dir:
+            conf_dir = os.path.join(os.path.dirname(log_dir), 'conf')
+            node_results['log_dir'] = log_dir
+            node_results['conf_dir'] = conf_dir
+        else:
+            print(f"  Could not determine log directory for {session.host}.")
+
+        # 2. Fetch files
+        os.makedirs(node_output_dir, exist_ok=True)
+
+        self._fetch_remote_file(session, '/etc/hosts', os.path.join(node_output_dir, 'hosts.txt'))
+        self._fetch_remote_file(session, '/etc/fstab', os.path.join(node_output_dir, 'fstab.txt'))
+
+        if conf_dir:
+            self._fetch_remote_file(session, os.path.join(conf_dir, f'{role}.conf'), os.path.join(node_output_dir, f'{role}.conf'))
+
+        # 3. Execute remote checks and save filtered logs
+        if log_dir:
+            if role == 'fe':
+                # check_fe_logs
+                log_file = os.path.join(log_dir, 'fe.warn.log')
+                output_file = os.path.join(node_output_dir, "fe_warn_filtered.log")
+                self._extract_remote_log(session, log_file, 'fe', 'error|exception', output_file,
+                                         since, until, ignore_case=True, checkpoints=checkpoints)
+            else: # be
+                # check_be_out
+                log_file = os.path.join(log_dir, 'be.out')
+                output_file = os.path.join(node_output_dir, "be_out_filtered.log")
+                cmd = f"sed -n '/3.3.14-ee RELEASE (build 5b29ea9)/,/start time/p' {log_file}"
+                self._execute_remote_cmd_and_save_output(session, cmd, output_file)
+
+                # check_be_warning_logs
+                log_file = os.path.join(log_dir, 'be.WARNING')
+                output_file = os.path.join(node_output_dir, "be_warning_filtered.log")
+                self._extract_remote_log(session, log_file, 'be', 'error|fail', output_file,
+                                         since, until, ignore_case=True, checkpoints=checkpoints)
+
+                # check_task_queue
+                log_file = os.path.join(log_dir, 'be.INFO')
+                output_file = os.path.join(node_output_dir, "task_queue_filtered.log")
+                self._extract_remote_log(session, log_file, 'be', 'task_count_in_queue=[2-9][0-9]{4,}',
+                                         output_file, since, until, checkpoints=checkpoints)
+
+        node_results['collected_files_path'] = node_output_dir
+        return node_results
+
+    def collect_data_from_all_nodes(self, ssh_port=22, fe_http_port=8030, be_http_port=8040, ssh_parallelism=16,
+                                    since=None, until=None, incremental=False):
         """
         Collects diagnostic data from all FE and BE nodes via SSH.
         This includes log files, configuration files, and system files.
+        Nodes are processed concurrently, at most ssh_parallelism at a time, and
+        all steps for a node share one multiplexed SSH connection. Log lines are
+        filtered on the node, limited to [since, until) when since is given.
+        With incremental, only log lines appended since the previous run are read;
+        read positions are kept in remote_checkpoints.json in the output directory.
         """
         all_nodes = {}
         try:
@@ -1483,184 +4520,569 @@ class StarRocksDoctor:
         fes_log_dir = self.get_fe_log_paths()
         bes_log_dir = self.get_be_log_paths()
 
-        for ip, role in all_nodes.items():
-            print(f"\nCollecting data from {role} node: {ip}...")
-            node_results = {}
-            try:
-                # 1. Get log and conf directories
-                log_dir = None
-                conf_dir = None
-                if role == "fe":
-                    log_dir = fes_log_dir[ip]
-                else:
-                    log_dir = bes_log_dir[ip]
+        checkpoints = None
+        if incremental:
+            checkpoints = LogCheckpointStore(os.path.join(self.output_dir, 'remote_checkpoints.json'))
+            if until:
+                print("Warning: --until is set, log positions will not be recorded for the next incremental run")
 
-                if log_dir:
-                    conf_dir = os.path.join(os.path.dirname(log_dir), 'conf')
-                    node_results['log_dir'] = log_dir
-                    node_results['conf_dir'] = conf_dir
-                else:
-                    print(f"  Could not determine log directory for {ip}.")
-
-                # 2. Fetch files
-                node_output_dir = os.path.join(run_output_dir, f"{ip}_{role}")
-                os.makedirs(node_output_dir, exist_ok=True)
-
-                self._fetch_remote_file(ip, ssh_port, '/etc/hosts', os.path.join(node_output_dir, 'hosts.txt'))
-                self._fetch_remote_file(ip, ssh_port, '/etc/fstab', os.path.join(node_output_dir, 'fstab.txt'))
-
-                if conf_dir:
-                    self._fetch_remote_file(ip, ssh_port, os.path.join(conf_dir, f'{role}.conf'), os.path.join(node_output_dir, f'{role}.conf'))
-
-
-
-                # 3. Execute remote checks and save filtered logs
-                if log_dir:
-                    if role == 'fe':
-                        # check_fe_logs
-                        log_file = os.path.join(log_dir, 'fe.warn.log')
-                        output_file = os.path.join(node_output_dir, "fe_warn_filtered.log")
-                        cmd = f"grep -i -E 'error|exception' {log_file}"
-                        self._execute_remote_cmd_and_save_output(ip, ssh_port, cmd, output_file)
-                    else: # be
-                        # check_be_out
-                        log_file = os.path.join(log_dir, 'be.out')
-                        output_file = os.path.join(node_output_dir, "be_out_filtered.log")
-                        cmd = f"sed -n '/3.3.14-ee RELEASE (build 5b29ea9)/,/start time/p' {log_file}"
-                        self._execute_remote_cmd_and_save_output(ip, ssh_port, cmd, output_file)
-
-                        # check_be_warning_logs
-                        log_file = os.path.join(log_dir, 'be.WARNING')
-                        output_file = os.path.join(node_output_dir, "be_warning_filtered.log")
-                        cmd = f"grep -i -E 'error|fail' {log_file}"
-                        self._execute_remote_cmd_and_save_output(ip, ssh_port, cmd, output_file)
-
-                        # check_task_queue
-                        log_file = os.path.join(log_dir, 'be.INFO')
-                        output_file = os.path.join(node_output_dir, "task_queue_filtered.log")
-                        cmd = f"grep -E 'task_count_in_queue=[2-9][0-9]{{4,}}' {log_file}"
-                        self._execute_remote_cmd_and_save_output(ip, ssh_port, cmd, output_file)
-                
-                node_results['status'] = 'Success'
-                node_results['collected_files_path'] = node_output_dir
-                all_results[ip] = node_results
+        # Short directory for the control sockets, unix socket paths are length-limited
+        control_dir = tempfile.mkdtemp(prefix='srdoc-ssh-')
 
+        def collect_node(ip, role):
+            print(f"\nCollecting data from {role} node: {ip}...")
+            log_dir = fes_log_dir.get(ip) if role == 'fe' else bes_log_dir.get(ip)
+            session = RemoteSession(ip, ssh_port, control_dir, tracer=self.tracer)
+            try:
+                return self._collect_node_data(session, role, log_dir, os.path.join(run_output_dir, f"{ip}_{role}"),
+                                               since, until, checkpoints)
+            finally:
+                session.close()
+
+        @self.in_current_module
+        def timed(ip, role):
+            start = time.monotonic()
+            try:
+                with trace_span(self.tracer, f"{role} {ip}", 'node', host=ip, role=role):
+                    node_results = dict(collect_node(ip, role), status='Success')
             except Exception as e:
                 print(f"Failed to collect data from {ip}: {e}")
-                all_results[ip] = {'status': 'Failed', 'error': str(e)}
+                node_results = {'status': 'Failed', 'error': str(e)}
+            node_results['elapsed_s'] = round(time.monotonic() - start, 2)
+            print(f"Finished {role} node {ip} in {node_results['elapsed_s']}s ({node_results['status']})")
+            return node_results
+
+        start = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, ssh_parallelism)) as executor:
+                futures = {ip: executor.submit(timed, ip, role) for ip, role in all_nodes.items()}
+                for ip, future in futures.items():
+                    all_results[ip] = future.result()
+        finally:
+            shutil.rmtree(control_dir, ignore_errors=True)
+            if checkpoints is not None:
+                checkpoints.save()
+
+        print(f"\nCollected {len(all_results)} nodes in {time.monotonic() - start:.1f}s; slowest:")
+        for ip, node_results in sorted(all_results.items(), key=lambda item: item[1]['elapsed_s'], reverse=True)[:5]:
+            print(f"  {ip}: {node_results['elapsed_s']}s")
         
         return all_results
 
+def run_schema_module(doctor, args):
+    if args.format in ('parquet', 'arrow'):
+        if args.bulk:
+            items = doctor.iter_table_info_bulk(args.name, fetch_ddl=not args.skip_ddl, count_rows=args.count_rows)
+        else:
+            items = ((db_name, tbl_name, table_info)
+                     for db_name, tables in doctor.collect_table_info(args.name).items()
+                     for tbl_name, table_info in tables.items())
+        return doctor.save_grouped_rows(doctor.iter_schema_rows(items), 'table_info', args.format)
+    elif args.bulk and args.format in ('jsonl', 'csv'):
+        rows = (dict({'DB_NAME': db_name, 'TABLE_NAME': tbl_name}, **table_info)
+                for db_name, tbl_name, table_info in doctor.iter_table_info_bulk(
+                    args.name, fetch_ddl=not args.skip_ddl, count_rows=args.count_rows))
+        return doctor.save_rows_to_file(rows, 'table_info', args.format)
+    else:
+        if args.bulk:
+            result = doctor.collect_table_info_bulk(args.name, fetch_ddl=not args.skip_ddl, count_rows=args.count_rows)
+        else:
+            result = doctor.collect_table_info(args.name)
+        return doctor.save_to_file(result, 'table_info', args.format)
+
+def run_mv_module(doctor, args):
+    result = doctor.collect_mv_info(args.name, args.refresh_history, args.since)
+    return doctor.save_to_file(result, 'materialized_view_info', args.format)
+
+def run_tablet_module(doctor, args):
+    if args.name and args.format == 'json':
+        # Write each tablet as soon as its replicas are expanded
+        return doctor.save_items_to_file(doctor.iter_tablet_metadata(args.name), 'tablet_metadata')
+    elif args.name and args.format in ('jsonl', 'csv'):
+        rows = (dict({'TabletId': tablet_id}, **info) for tablet_id, info in doctor.iter_tablet_metadata(args.name))
+        return doctor.save_rows_to_file(rows, 'tablet_metadata', args.format)
+    elif args.name:
+        result = doctor.collect_tablet_metadata(args.name)
+        return doctor.save_to_file(result, 'tablet_metadata', args.format)
+    elif args.format in ('jsonl', 'csv'):
+        rows = doctor.iter_tablet_checks(args.size_gb or 5, args.size_mb or 500, args.version_threshold)
+        return doctor.save_rows_to_file(rows, 'tablet_metadata', args.format)
+    elif args.format in ('parquet', 'arrow'):
+        # One file per check
+        rows = doctor.iter_tablet_checks(args.size_gb or 5, args.size_mb or 500, args.version_threshold)
+        return doctor.save_grouped_rows(((row.pop('check'), row) for row in rows), 'tablet_metadata', args.format)
+    else:
+        result = {
+            'empty_partitions': doctor.check_empty_partitions(),
+            'single_replica_tables': doctor.check_single_replica_tables(),
+            'single_bucket_large_tables': doctor.check_single_bucket_large_tables(),
+            'unpartitioned_large_tables': doctor.check_unpartitioned_large_tables(),
+            'tables_without_index_disk': doctor.check_tables_without_index_disk(),
+            'large_tablets': doctor.check_large_tablets(args.size_gb or 5),
+            'tablets_with_many_versions': doctor.check_tablets_with_many_versions(args.version_threshold),
+            'small_tablets': doctor.check_small_tablets(args.size_mb or 500)
+        }
+        return doctor.save_to_file(result, 'tablet_metadata', args.format)
+
+def iter_tablet_ids(lines):
+    """Tablet IDs from lines of text
+    IDs are separated by whitespace or commas, '#' starts a comment and
+    repeated IDs are dropped.
+    Yields:
+        str: Tablet IDs in input order
+    """
+    seen = set()
+    for number, line in enumerate(lines, 1):
+        for token in re.split(r'[\s,]+', line.split('#', 1)[0]):
+            if not token or token in seen:
+                continue
+            if not token.isdigit():
+                print(f"Warning: Skipping invalid tablet ID {token!r} on line {number}")
+                continue
+            seen.add(token)
+            yield token
+
+def run_check_replica_module(doctor, args):
+    if not args.tablet_file:
+        doctor.check_and_set_bad_replica(args.name)
+        return None
+    journal = args.journal or os.path.join(args.output, 'replica_repair_journal.jsonl')
+    source = sys.stdin if args.tablet_file == '-' else open(args.tablet_file)
+    try:
+        result = doctor.repair_replicas(iter_tablet_ids(source), journal, dry_run=args.dry_run,
+                                        rate_limit=args.rate_limit, plan_format=args.format)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    return result.get('file')
+
+def run_performance_module(doctor, args):
+    if args.perf_mode == 'aggregate':
+        since = args.since or parse_time_arg('1h')
+        if args.format in ('jsonl', 'csv'):
+            # Write the groups as they arrive; the top offenders are small
+            until = args.until or datetime.now()
+            try:
+                files = [doctor.save_rows_to_file(doctor.iter_audit_aggregates(since, until, args.page_size),
+                                                  'performance_aggregates', args.format)]
+            except Error as e:
+                print(f"Error aggregating audit log: {e}")
+                return None
+            offenders = doctor.get_audit_top_offenders(since, until, args.top_n)
+            rows = (dict({'metric': metric}, **row) for metric, rows in offenders.items() for row in rows)
+            return files + [doctor.save_rows_to_file(rows, 'performance_top_offenders', args.format)]
+        result = doctor.collect_audit_aggregation(since, args.until, args.top_n, args.page_size)
+        return doctor.save_to_file(result, 'performance_aggregates', args.format)
+    else:
+        result = doctor.collect_performance_diagnostics()
+        return doctor.save_to_file(result, 'performance_diagnostics', args.format)
+
+def run_log_paths_module(doctor, args):
+    result = {
+        'fe': doctor.get_fe_log_paths(),
+        'be': doctor.get_be_log_paths()
+    }
+    return doctor.save_to_file(result, 'log_paths', args.format)
+
+def run_remote_diagnostics_module(doctor, args):
+    # Run local manager check first
+    manager_log_result = doctor.check_manager_logs()
+    print(manager_log_result)
+
+    # Then collect data from all nodes
+    result = doctor.collect_data_from_all_nodes(
+        ssh_port=args.ssh_port,
+        ssh_parallelism=args.ssh_parallelism,
+        since=args.since,
+        until=args.until,
+        incremental=args.incremental
+    )
+    return doctor.save_to_file(result, 'remote_diagnostics_summary', args.format)
+
+def run_be_stack_module(doctor, args):
+    be_ips = None if args.be_ip == 'all' else [ip.strip() for ip in args.be_ip.split(',') if ip.strip()]
+    raw_dir = os.path.join(args.output, f"be_stack_raw_{doctor.timestamp}") if args.stack_raw else None
+    result, profile = doctor.capture_be_stacks(be_ips, max(1, args.stack_samples), args.stack_interval,
+                                               raw_dir=raw_dir)
+    if result is None:
+        return None
+    print(f"{result['threads']} threads in {result['distinct_stacks']} distinct stacks "
+          f"({result['idle_threads']} idle threads)")
+    for stack in [stack for stack in result['stacks'] if not stack['idle']][:5]:
+        print(f"  {stack['count']:>6}  {', '.join(sorted(stack['thread_names']))}: {' <- '.join(stack['frames'][:3])}")
+    files = [doctor.save_to_file(result, 'be_stack_trace', args.format)]
+    folded = os.path.join(args.output, f"be_stack_{doctor.timestamp}.folded")
+    with open(folded, 'w') as f:
+        for line in profile.folded():
+            f.write(line + '\n')
+    print(f"Folded stacks for flame graphs written to {folded}")
+    return files + [folded] + ([raw_dir] if raw_dir else [])
+
+def simple_module(collect, filename):
+    """Runner for modules that save one collector result as-is"""
+    def run(doctor, args):
+        return doctor.save_to_file(collect(doctor, args), filename, args.format)
+    return run
+
+# Module registry: runner, modules that must finish first, the argument the
+# module cannot run without, and whether `--module all` includes it
+MODULES = {
+    'schema': {'run': run_schema_module},
+    'mv': {'run': run_mv_module},
+    'tablet': {'run': run_tablet_module},
+    'check_replica': {'run': run_check_replica_module, 'after': ['backend_mapping'],
+                      'requires': (('name', 'tablet_file'), 'Tablet ID (--name) or --tablet_file is required for check_replica module'),
+                      'in_all': False},
+    'session_vars': {'run': simple_module(lambda doctor, args: doctor.get_modified_session_variables(),
+                                          'modified_session_variables')},
+    'be_config': {'run': simple_module(lambda doctor, args: doctor.get_modified_be_configs(), 'modified_be_configs'),
+                  'after': ['backend_mapping']},
+    'fe_config': {'run': simple_module(lambda doctor, args: doctor.get_modified_fe_configs(), 'fe_configs')},
+    # session_vars, be_config and fe_config already cover it in `all`
+    'all_configs': {'run': simple_module(lambda doctor, args: doctor.collect_all_configs(), 'all_configurations'),
+                    'after': ['backend_mapping'], 'in_all': False},
+    'backend_mapping': {'run': simple_module(lambda doctor, args: doctor.get_backend_host_id_mapping(),
+                                             'backend_host_id_mapping')},
+    'cluster_state': {'run': simple_module(lambda doctor, args: doctor.collect_cluster_state(), 'cluster_state')},
+    'performance_diagnostics': {'run': run_performance_module},
+    'query_dump': {'run': simple_module(lambda doctor, args: doctor.get_query_dump(args.sql_file), 'query_dump'),
+                   'requires': ('sql_file', 'SQL file is required for query_dump module'), 'in_all': False},
+    'be_stack': {'run': run_be_stack_module,
+                 'after': ['backend_mapping'], 'requires': ('be_ip', 'BE IP (or all) is required for be_stack module'),
+                 'in_all': False},
+    'yesterdays_tables': {'run': simple_module(lambda doctor, args: doctor.get_yesterdays_tables(), 'yesterdays_tables')},
+    'log_paths': {'run': run_log_paths_module, 'after': ['backend_mapping']},
+    # Needs SSH access to every node, only run when asked for by name
+    'remote_diagnostics': {'run': run_remote_diagnostics_module, 'after': ['log_paths'], 'in_all': False},
+}
+
+def parse_module_arg(value):
+    """Parse --module: one module, a comma-separated list, or 'all'
+    Returns:
+        list: Module names in the order given
+    """
+    if value.strip() == 'all':
+        return [name for name, spec in MODULES.items() if spec.get('in_all', True)]
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in MODULES]
+    if unknown or not names:
+        raise argparse.ArgumentTypeError(f"unknown module(s): {', '.join(unknown) or repr(value)}; "
+                                         f"choose from {', '.join(MODULES)} or all")
+    return list(dict.fromkeys(names))
+
+def parse_watch_checks(value):
+    """Parse --watch_modules into a list of WatchSampler checks"""
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in WatchSampler.CHECKS]
+    if unknown or not names:
+        raise argparse.ArgumentTypeError(f"unknown check(s): {', '.join(unknown) or repr(value)}; "
+                                         f"choose from {', '.join(WatchSampler.CHECKS)}")
+    return list(dict.fromkeys(names))
+
+def write_profile_report(doctor, top_n=20):
+    """Save the --profile report and print where the time went"""
+    report = doctor.profiler.report(top_n)
+    report['fe_load_governor'] = doctor.governor.report()
+    path = doctor.save_to_file(report, 'query_profile', 'json')
+    print(f"\nSQL profile: {report['round_trips']} statements, {report['total_s']}s in total")
+    for module, group in report['by_module'].items():
+        print(f"  {module:<28} {group['round_trips']:>6} round trips {group['total_s']:>9.3f}s {group['rows']:>10} rows")
+    for call in report['slowest_calls'][:5]:
+        print(f"  slowest: {call['elapsed_s']:.3f}s {call['host']} [{call['module']}] {call['statement'][:100]}")
+    print(f"Profile written to {path}")
+
+def print_governor_report(doctor):
+    """Show the FEs on which the load governor held statements back"""
+    for host, state in sorted(doctor.governor.report().items()):
+        if state['errors'] or state['waited_s'] >= 1:
+            print(f"FE load governor: {host} ran {state['statements']} statements at up to {state['peak_limit']:g} "
+                  f"concurrent (now {state['limit']:g}), {state['cuts']} slowdowns, {state['errors']} errors, "
+                  f"{state['waited_s']:.1f}s spent waiting for a slot")
+
+def run_module(doctor, args, name, announce=False):
+    """Run one module
+    Args:
+        announce: Print when the module starts and finishes
+    Returns:
+        dict: Manifest entry with status, elapsed_s, files and error
+    """
+    spec = MODULES[name]
+    if announce:
+        print(f"Starting module {name}")
+    start = time.monotonic()
+    entry = {'status': 'ok', 'files': []}
+    required = spec.get('requires')
+    # The first item names the argument, or a tuple of arguments of which one is enough
+    if required and not any(getattr(args, arg) for arg in
+                            (required[0] if isinstance(required[0], tuple) else (required[0],))):
+        print(f"Error: {required[1]}")
+        entry['status'] = 'skipped'
+        entry['error'] = required[1]
+    else:
+        try:
+            with trace_span(doctor.tracer, f"module {name}", 'module'):
+                if doctor.profiler is None:
+                    files = spec['run'](doctor, args)
+                else:
+                    with doctor.profiler.module(name):
+                        files = spec['run'](doctor, args)
+            entry['files'] = [files] if isinstance(files, str) else list(files or [])
+        except Exception as e:
+            print(f"Error running module {name}: {e}")
+            entry['status'] = 'failed'
+            entry['error'] = str(e)
+    entry['elapsed_s'] = round(time.monotonic() - start, 2)
+    if announce:
+        print(f"Finished module {name} in {entry['elapsed_s']}s ({entry['status']})")
+    return entry
+
+def run_modules(doctor, args, names, parallelism=4):
+    """Run several modules on one doctor, independent ones concurrently
+    Modules share the doctor's connection pool, topology and metadata
+    snapshots. A module starts once every module listed in its 'after' that
+    is part of this run has finished.
+    Returns:
+        dict: Module name -> manifest entry
+    """
+    selected = set(names)
+    waiting_on = {name: {dep for dep in MODULES[name].get('after', []) if dep in selected} for name in names}
+    results = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+        while len(results) < len(names):
+            for name in names:
+                if name not in results and name not in running.values() and not waiting_on[name] - set(results):
+                    running[executor.submit(doctor.in_current_module(run_module), doctor, args, name, True)] = name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name] = future.result()
+    return {name: results[name] for name in names}
+
+def history_main(command, argv):
+    """diff / trend / runs subcommands over a --history store"""
+    parser = argparse.ArgumentParser(prog=f"starrocks-doctor.py {command}",
+                                     description={'diff': 'Changes between two recorded runs',
+                                                  'trend': 'Tablet version count trends across recorded runs',
+                                                  'runs': 'List recorded runs'}[command])
+    parser.add_argument('--history', required=True, help='SQLite file written by --history')
+    parser.add_argument('--cluster_id', help='Only consider runs of this cluster')
+    parser.add_argument('--save', help='Also write the JSON result to this file')
+    if command == 'diff':
+        parser.add_argument('--run_a', type=int, help='Older run id (default: the run before --run_b)')
+        parser.add_argument('--run_b', type=int, help='Newer run id (default: the latest run)')
+        parser.add_argument('--dataset', help='Only compare this dataset, e.g. tablet_metadata or modified_be_configs')
+        parser.add_argument('--limit', type=int, default=100, help='Rows listed per change type (default: 100)')
+    elif command == 'trend':
+        parser.add_argument('--versions_over', type=int, default=900,
+                            help='List tablets that went above this many versions in the window (default: 900)')
+        parser.add_argument('--since', type=parse_time_arg, default=parse_time_arg('7d'),
+                            help='Window start, same formats as the main --since (default: 7d)')
+        parser.add_argument('--tablet', help='Show the version count and size of one tablet in every run instead')
+    else:
+        parser.add_argument('--limit', type=int, default=20, help='Number of runs listed (default: 20)')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.history):
+        parser.error(f"history store {args.history} does not exist")
+    store = RunHistoryStore(args.history)
+    try:
+        if command == 'runs':
+            result = store.runs(args.cluster_id, args.limit)
+        elif command == 'trend':
+            if args.tablet:
+                result = store.tablet_history(args.tablet)
+            else:
+                result = store.tablets_crossing(args.versions_over, args.since, args.cluster_id)
+        else:
+            run_b = args.run_b
+            if run_b is None:
+                latest = store.runs(args.cluster_id, 1)
+                if not latest:
+                    print("Error: No recorded runs")
+                    return
+                run_b = latest[0]['run_id']
+            run_a = args.run_a
+            if run_a is None:
+                cluster_id = args.cluster_id or store._run(run_b)['cluster_id']
+                previous = [run for run in store.runs(cluster_id, 1000) if run['run_id'] < run_b]
+                if not previous:
+                    print(f"Error: No run of cluster {cluster_id} before run {run_b}")
+                    return
+                run_a = previous[0]['run_id']
+            result = store.diff(run_a, run_b, args.dataset, args.limit)
+    finally:
+        store.close()
+
+    output = json.dumps(result, indent=2, cls=DateTimeEncoder)
+    print(output)
+    if args.save:
+        with open(args.save, 'w') as f:
+            f.write(output)
+
 def main():
-    parser = argparse.ArgumentParser(description='StarRocks Diagnostic Tool')
+    if len(sys.argv) > 1 and sys.argv[1] in ('diff', 'trend', 'runs'):
+        return history_main(sys.argv[1], sys.argv[2:])
+
+    parser = argparse.ArgumentParser(description='StarRocks Diagnostic Tool',
+                                     epilog='Subcommands over a --history store: diff, trend, runs '
+                                            '(see starrocks-doctor.py diff --help)')
     parser.add_argument('--host', required=True, help='FE hostname or endpoint')
     parser.add_argument('--port', type=int, default=9030, help='FE port (default: 9030)')
     parser.add_argument('--user', required=True, help='Username')
     parser.add_argument('--password', required=True, help='Password')
     parser.add_argument('--output', default='./starrocks_diagnostic', help='Output directory')
-    parser.add_argument('--format', choices=['json', 'csv', 'yaml', 'txt'], default='json',
-                      help='Output format (default: json)')
-    parser.add_argument('--module', choices=['schema', 'mv', 'tablet', 'check_replica', 'session_vars', 'be_config', 'fe_config', 'all_configs', 'backend_mapping', 'cluster_state', 'performance_diagnostics', 'query_dump', 'be_stack', 'yesterdays_tables', 'log_paths', 'remote_diagnostics'], required=True, 
-                      help='Module to run: schema, mv, tablet, check_replica, session_vars, be_config, fe_config, all_configs, backend_mapping, cluster_state, performance_diagnostics, query_dump, be_stack, yesterdays_tables, log_paths, remote_diagnostics (collect logs/confs from all nodes via SSH)')
+    parser.add_argument('--format', choices=['json', 'jsonl', 'csv', 'yaml', 'txt', 'parquet', 'arrow'], default='json',
+                      help='Output format (default: json); jsonl and csv are written row by row for schema --bulk and tablet, '
+                           'parquet and arrow (requires pyarrow) write one columnar file per result table')
+    parser.add_argument('--module', type=parse_module_arg, 
+                      help='Module(s) to run, comma-separated, or all: schema, mv, tablet, check_replica, session_vars, be_config, fe_config, all_configs, backend_mapping, cluster_state, performance_diagnostics, query_dump, be_stack, yesterdays_tables, log_paths, remote_diagnostics (collect logs/confs from all nodes via SSH). '
+                           'all runs every module that needs no extra input, except all_configs and remote_diagnostics')
+    parser.add_argument('--module_parallelism', type=int, default=4,
+                      help='Number of modules run at the same time when several are given (default: 4)')
+    parser.add_argument('--history', metavar='DB',
+                      help='Also record every result in this SQLite file, for the diff / trend / runs subcommands')
+    parser.add_argument('--profile', action='store_true',
+                      help='Record the time, rows, bytes, FE and module of every SQL statement and write query_profile_<ts>.json')
+    parser.add_argument('--trace', metavar='FILE',
+                      help='Write a timeline of the run (modules, fan-outs, SQL statements, SSH commands, connects) to FILE')
+    parser.add_argument('--trace_format', choices=['chrome', 'otlp'], default='chrome',
+                      help='--trace format: chrome (chrome://tracing, Perfetto) or otlp (OTLP/JSON for OpenTelemetry tools) (default: chrome)')
+    parser.add_argument('--watch', type=float, metavar='INTERVAL',
+                      help='Instead of --module, sample the cluster every INTERVAL seconds and append changes to watch_timeline.jsonl in --output')
+    parser.add_argument('--watch_modules', type=parse_watch_checks, default=list(WatchSampler.CHECKS),
+                      help=f"Comma-separated checks sampled by --watch (default: {','.join(WatchSampler.CHECKS)})")
+    parser.add_argument('--watch_count', type=int, default=0,
+                      help='Stop --watch after this many samples (default: 0, run until interrupted)')
     parser.add_argument('--name', help='Optional. Table name, MV name, tablet ID or replica ID to collect info for')
+    parser.add_argument('--tablet_file', metavar='FILE',
+                      help="check_replica module: repair every tablet ID in FILE ('-' for stdin) instead of --name")
+    parser.add_argument('--dry_run', action='store_true',
+                      help='check_replica with --tablet_file: write the repair plan to replica_repair_plan_<ts> and change nothing')
+    parser.add_argument('--rate_limit', type=float, default=5,
+                      help='check_replica with --tablet_file: maximum ADMIN SET REPLICA STATUS statements per second (default: 5)')
+    parser.add_argument('--journal', metavar='FILE',
+                      help='check_replica with --tablet_file: progress journal; tablets already done in it are skipped '
+                           '(default: replica_repair_journal.jsonl in --output)')
     parser.add_argument('--sql_file', help='Path to SQL file for query_dump module')
-    parser.add_argument('--be_ip', help='BE IP address for be_stack module')
+    parser.add_argument('--be_ip', help='BE IP address(es) for be_stack module, comma-separated, or all for every alive BE')
+    parser.add_argument('--stack_samples', type=int, default=1,
+                      help='be_stack module: number of stack dumps taken of each BE (default: 1)')
+    parser.add_argument('--stack_interval', type=float, default=1.0,
+                      help='be_stack module: seconds between two stack samples (default: 1)')
+    parser.add_argument('--stack_raw', action='store_true',
+                      help='be_stack module: also keep every raw dump in be_stack_raw_<ts> in --output')
     parser.add_argument('--size_gb', type=float, help='Size threshold in GB for large tablets check')
     parser.add_argument('--size_mb', type=float, help='Size threshold in MB for small tablets check')
     parser.add_argument('--version_threshold', type=int, default=900, help='Version threshold for tablets with many versions check')
     parser.add_argument('--ssh_port', type=int, default=22, help='SSH port (default: 22)')
+    parser.add_argument('--incremental', action='store_true',
+                      help='remote_diagnostics: only read log lines appended since the previous run with the same --output')
+    parser.add_argument('--ssh_parallelism', type=int, default=16,
+                      help='remote_diagnostics: number of nodes collected at the same time (default: 16)')
+    parser.add_argument('--topology_ttl', type=float, default=60,
+                      help='Seconds to cache leader/FE/BE topology before refreshing (default: 60)')
+    parser.add_argument('--perf_mode', choices=['recent', 'aggregate'], default='recent',
+                      help='performance_diagnostics mode: recent raw queries per FE, or audit aggregates over --since/--until (default: recent)')
+    parser.add_argument('--since', type=parse_time_arg,
+                      help="Window start: 'YYYY-MM-DD HH:MM:SS' or a duration before now such as 30m, 2h, 1d (performance_diagnostics aggregate mode, mv refresh statistics, remote_diagnostics log window)")
+    parser.add_argument('--until', type=parse_time_arg, help='Window end, same formats as --since (default: now)')
+    parser.add_argument('--top_n', type=int, default=20, help='Number of top offenders to report (default: 20)')
+    parser.add_argument('--page_size', type=int, default=1000, help='Rows fetched per page for streamed results (default: 1000)')
+    parser.add_argument('--refresh_history', type=int, default=1,
+                      help='mv module: number of most recent refreshes to report per MV (default: 1)')
+    parser.add_argument('--bulk', action='store_true',
+                      help='schema module: load tables_config and partitions_meta once instead of querying every table')
+    parser.add_argument('--skip_ddl', action='store_true', help='schema module with --bulk: do not fetch CREATE TABLE statements')
+    parser.add_argument('--count_rows', action='store_true',
+                      help='schema module with --bulk: run SELECT COUNT(*) for tables missing from partitions_meta')
+    parser.add_argument('--parallelism', type=int, default=8,
+                      help='Maximum concurrent statements for modules that fan out per table/tablet (default: 8)')
+    parser.add_argument('--max_fe_concurrency', type=int,
+                      help='Hard ceiling on concurrent statements per FE; below it the concurrency follows FE latency '
+                           'and errors (default: --parallelism)')
+    parser.add_argument('--max_fe_qps', type=float, default=0,
+                      help='Maximum statements per second sent to each FE (default: 0, no limit)')
+    parser.add_argument('--leader_reads', action='store_true',
+                      help='Send information_schema reads to --host instead of the least loaded follower')
+    parser.add_argument('--fe_timeout', type=float, default=30,
+                      help='Per-FE timeout in seconds for modules that query every FE (default: 30)')
 
     args = parser.parse_args()
+    if not args.module and not args.watch:
+        parser.error('one of --module or --watch is required')
+    if args.history and args.watch:
+        parser.error('--history records --module runs and cannot be combined with --watch')
 
     doctor = StarRocksDoctor(
         host=args.host,
         port=args.port,
         user=args.user,
         password=args.password,
-        output_dir=args.output
+        output_dir=args.output,
+        topology_ttl=args.topology_ttl,
+        fe_timeout=args.fe_timeout,
+        parallelism=args.parallelism
     )
 
+    doctor.governor = doctor.pool.governor = FELoadGovernor(ceiling=args.max_fe_concurrency or args.parallelism, max_qps=args.max_fe_qps)
+    doctor.follower_reads = not args.leader_reads
+    if args.profile:
+        doctor.profiler = QueryProfiler()
+    if args.trace:
+        doctor.tracer = doctor.pool.tracer = Tracer()
+
+    try:
+        with trace_span(doctor.tracer, 'run', 'run', host=args.host,
+                        modules=','.join(args.module or []) or f"watch {','.join(args.watch_modules)}"):
+            run_doctor(doctor, args)
+    finally:
+        if doctor.tracer is not None:
+            doctor.tracer.write(args.trace, args.trace_format)
+            print(f"Trace ({len(doctor.tracer.spans)} spans) written to {args.trace}")
+
+def run_doctor(doctor, args):
+    """Connect and run --watch or the selected modules"""
     if not doctor.connect():
         return
 
+    if args.history:
+        doctor.history = RunHistoryStore(args.history)
+        frontends = doctor.topology.frontends()
+        cluster_id = (frontends[0].get('ClusterId') if frontends else None) or f"{args.host}:{args.port}"
+        run_id = doctor.history.start_run(cluster_id, args.host, args.module)
+        print(f"Recording run {run_id} of cluster {cluster_id} in {args.history}")
+
     try:
-        if args.module == 'schema':
-            result = doctor.collect_table_info(args.name)
-            doctor.save_to_file(result, 'table_info', args.format)
-        elif args.module == 'mv':
-            result = doctor.collect_mv_info(args.name)
-            doctor.save_to_file(result, 'materialized_view_info', args.format)
-        elif args.module == 'tablet':
-            if args.name:
-                result = doctor.collect_tablet_metadata(args.name)
-            else:
-                result = {
-                    'empty_partitions': doctor.check_empty_partitions(),
-                    'single_replica_tables': doctor.check_single_replica_tables(),
-                    'single_bucket_large_tables': doctor.check_single_bucket_large_tables(),
-                    'unpartitioned_large_tables': doctor.check_unpartitioned_large_tables(),
-                    'tables_without_index_disk': doctor.check_tables_without_index_disk(),
-                    'large_tablets': doctor.check_large_tablets(args.size_gb or 5),
-                    'tablets_with_many_versions': doctor.check_tablets_with_many_versions(args.version_threshold),
-                    'small_tablets': doctor.check_small_tablets(args.size_mb or 500)
-                }
-            doctor.save_to_file(result, 'tablet_metadata', args.format)
-        elif args.module == 'check_replica':
-            if not args.name:
-                print("Error: Tablet ID is required for check_replica module")
-                return
-            doctor.check_and_set_bad_replica(args.name)
-        elif args.module == 'session_vars':
-            result = doctor.get_modified_session_variables()
-            doctor.save_to_file(result, 'modified_session_variables', args.format)
-        elif args.module == 'be_config':
-            result = doctor.get_modified_be_configs()
-            doctor.save_to_file(result, 'modified_be_configs', args.format)
-        elif args.module == 'fe_config':
-            result = doctor.get_modified_fe_configs()
-            doctor.save_to_file(result, 'fe_configs', args.format)
-        elif args.module == 'all_configs':
-            result = doctor.collect_all_configs()
-            doctor.save_to_file(result, 'all_configurations', args.format)
-        elif args.module == 'backend_mapping':
-            result = doctor.get_backend_host_id_mapping()
-            doctor.save_to_file(result, 'backend_host_id_mapping', args.format)
-        elif args.module == 'cluster_state':
-            result = doctor.collect_cluster_state()
-            doctor.save_to_file(result, 'cluster_state', args.format)
-        elif args.module == 'performance_diagnostics':
-            result = doctor.collect_performance_diagnostics()
-            doctor.save_to_file(result, 'performance_diagnostics', args.format)
-        elif args.module == 'query_dump':
-            if not args.sql_file:
-                print("Error: SQL file is required for query_dump module")
-                return
-            result = doctor.get_query_dump(args.sql_file)
-            doctor.save_to_file(result, 'query_dump', args.format)
-        elif args.module == 'be_stack':
-            if not args.be_ip:
-                print("Error: BE IP is required for be_stack module")
-                return
-            result = doctor.get_be_stack_trace(args.be_ip)
-            doctor.save_to_file(result, 'be_stack_trace', args.format)
-        elif args.module == 'yesterdays_tables':
-            result = doctor.get_yesterdays_tables()
-            doctor.save_to_file(result, 'yesterdays_tables', args.format)
-        elif args.module == 'remote_diagnostics':
-            # Run local manager check first
-            manager_log_result = doctor.check_manager_logs()
-            print(manager_log_result)
-
-            # Then collect data from all nodes
-            result = doctor.collect_data_from_all_nodes(
-                ssh_port=args.ssh_port
-            )
-            doctor.save_to_file(result, 'remote_diagnostics_summary', args.format)
+        if args.watch:
+            os.makedirs(args.output, exist_ok=True)
+            sampler = WatchSampler(doctor, args.watch_modules, os.path.join(args.output, 'watch_timeline.jsonl'),
+                                   version_threshold=args.version_threshold)
+            sampler.run(args.watch, args.watch_count)
+            return
+        if len(args.module) == 1:
+            run_module(doctor, args, args.module[0])
+        else:
+            started = datetime.now()
+            modules = run_modules(doctor, args, args.module, args.module_parallelism)
+            manifest = {
+                'started': started,
+                'finished': datetime.now(),
+                'host': args.host,
+                'modules': modules
+            }
+            path = doctor.save_to_file(manifest, 'manifest', 'json')
+            print(f"Manifest written to {path}")
 
         print(f"Diagnostic data collection complete. Files saved to {args.output}")
     finally:
-        if doctor.connection:
-            doctor.connection.close()
+        print_governor_report(doctor)
+        if doctor.profiler is not None:
+            write_profile_report(doctor)
+        if doctor.history is not None:
+            doctor.history.finish_run()
+            doctor.history.close()
+        doctor.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
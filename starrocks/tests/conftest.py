@@ -0,0 +1,51 @@
+import importlib.util
+import os
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOCTOR = os.path.join(ROOT, 'starrocks-doctor.py')
+FAKE_FE = os.path.join(ROOT, 'bench', 'fake_fe.py')
+
+
+def load(name, path):
+    # Neither file name is importable as a module
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def doctor():
+    """starrocks-doctor.py loaded as a module"""
+    return load('starrocks_doctor', DOCTOR)
+
+
+@pytest.fixture(scope='session')
+def fake_fe():
+    """bench/fake_fe.py serving a small synthetic cluster on a free local port"""
+    fake = load('fake_fe', FAKE_FE)
+    server = fake.FakeFEServer(('127.0.0.1', 0), fake.SyntheticCluster(tables=8))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def connect(doctor, fake_fe, tmp_path):
+    """Factory for StarRocksDoctor instances connected to the fake FE"""
+    doctors = []
+
+    def connect():
+        instance = doctor.StarRocksDoctor('127.0.0.1', fake_fe.server_address[1], 'root', '',
+                                          output_dir=str(tmp_path))
+        assert instance.connect()
+        doctors.append(instance)
+        return instance
+
+    yield connect
+    for instance in doctors:
+        instance.close()
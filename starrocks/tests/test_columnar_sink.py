@@ -0,0 +1,24 @@
+import pytest
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def test_schema_covers_every_batch(doctor, tmp_path):
+    path = str(tmp_path / 'rows.parquet')
+    with doctor.ColumnarSink(path, batch_size=1) as sink:
+        sink.write({'TABLET_ID': 1, 'DATA_SIZE': '1KB'})
+        sink.write({'TABLET_ID': 2.5, 'DATA_SIZE': '2MB', 'error': 'timeout'})
+    table = pq.read_table(path)
+    assert [(field.name, str(field.type)) for field in table.schema] == \
+        [('TABLET_ID', 'double'), ('DATA_SIZE', 'int64'), ('error', 'string')]
+    assert table.column('DATA_SIZE').to_pylist() == [1024, 2 * 1024 ** 2]
+
+
+def test_values_that_do_not_fit_become_strings(doctor, tmp_path):
+    path = str(tmp_path / 'rows.parquet')
+    with doctor.ColumnarSink(path) as sink:
+        sink.write({'VERSION': 7, 'DATA_SIZE': '1KB'})
+        sink.write({'VERSION': 'n/a', 'DATA_SIZE': 'unknown'})
+    table = pq.read_table(path)
+    assert table.column('VERSION').to_pylist() == ['7', 'n/a']
+    assert table.column('DATA_SIZE').to_pylist() == ['1KB', 'unknown']
@@ -0,0 +1,25 @@
+import csv
+
+
+def read(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_header_is_union_of_row_keys(doctor, tmp_path):
+    path = str(tmp_path / 'rows.csv')
+    with doctor.CsvSink(path) as sink:
+        sink.write({'db': 'db0', 'tbl': 't1'})
+        sink.write({'db': 'db0', 'partitions': [{'name': 'p1'}], 'error': 'timeout'})
+    rows = read(path)
+    assert list(rows[0]) == ['db', 'tbl', 'partitions', 'error']
+    assert rows[0]['error'] == ''
+    assert rows[1]['partitions'] == '[{"name": "p1"}]'
+
+
+def test_fixed_fieldnames_report_dropped_columns(doctor, tmp_path):
+    path = str(tmp_path / 'rows.csv')
+    with doctor.CsvSink(path, ['db']) as sink:
+        sink.write({'db': 'db0', 'tbl': 't1'})
+    assert sink.dropped == ['tbl']
+    assert read(path) == [{'db': 'db0'}]
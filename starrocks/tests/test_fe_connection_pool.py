@@ -0,0 +1,42 @@
+import pytest
+
+
+class FakeConnection:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.closed = False
+
+    def is_connected(self):
+        return self.alive
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(doctor):
+    class FakePool(doctor.FEConnectionPool):
+        def __init__(self):
+            super().__init__(9030, 'root', '', ping_after_s=0)
+            self.opened = []
+
+        def _connect(self, host):
+            self.opened.append(FakeConnection())
+            return self.opened[-1]
+
+    return FakePool()
+
+
+def test_dead_idle_connection_is_replaced(pool):
+    dead = FakeConnection(alive=False)
+    pool.release('fe1', dead)
+    conn = pool.acquire('fe1')
+    assert dead.closed
+    assert conn is pool.opened[0]
+
+
+def test_live_idle_connection_is_reused(pool):
+    live = FakeConnection()
+    pool.release('fe1', live)
+    assert pool.acquire('fe1') is live
+    assert pool.opened == []
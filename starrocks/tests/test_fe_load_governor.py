@@ -0,0 +1,34 @@
+def run(governor, query, latency_s, host='fe1'):
+    with governor.slot(host, query) as slot:
+        slot['latency_s'] = latency_s
+
+
+def test_statement_kind_keeps_proc_path_and_table(doctor):
+    kind = doctor.FELoadGovernor.statement_kind
+    assert kind("SHOW PROC '/frontends'") != kind("SHOW PROC '/statistic'")
+    assert kind("SELECT COUNT(*) FROM `db0`.`tbl1`") != kind("SELECT COUNT(*) FROM `db0`.`tbl2`")
+    assert kind("SHOW PROC '/tablets/10001'") == kind("SHOW PROC '/tablets/10002'")
+
+
+def test_mixed_statements_do_not_cut(doctor):
+    governor = doctor.FELoadGovernor(ceiling=8, initial=8)
+    for _ in range(6):
+        run(governor, "SHOW PROC '/frontends'", 0.002)
+    run(governor, "SHOW PROC '/statistic'", 0.8)
+    for table, latency in (('small', 0.01), ('huge', 2.0), ('medium', 0.3)):
+        run(governor, f"SELECT COUNT(*) AS count FROM `db0`.`{table}`", latency)
+    for tablet in range(10000, 10010):
+        run(governor, f"SHOW PROC '/tablets/{tablet}'", 0.005)
+    report = governor.report()['fe1']
+    assert report['cuts'] == 0
+    assert report['limit'] == 8
+
+
+def test_slowdown_of_the_same_statement_cuts(doctor):
+    governor = doctor.FELoadGovernor(ceiling=8, initial=8)
+    for tablet in range(10000, 10005):
+        run(governor, f"SHOW PROC '/tablets/{tablet}'", 0.005)
+    run(governor, "SHOW PROC '/tablets/10005'", 0.5)
+    report = governor.report()['fe1']
+    assert report['cuts'] == 1
+    assert report['limit'] == 4
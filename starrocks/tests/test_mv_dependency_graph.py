@@ -0,0 +1,39 @@
+def edge(node, ref, ref_type='MATERIALIZED_VIEW'):
+    return {'object_database': 'db', 'object_name': node, 'object_type': 'MATERIALIZED_VIEW',
+            'ref_object_database': 'db', 'ref_object_name': ref, 'ref_object_type': ref_type}
+
+
+def test_base_tables_are_transitive(doctor):
+    # top -> (mid1, mid2) -> shared -> t1; mid2 also reads t2
+    graph = doctor.MVDependencyGraph([edge('top', 'mid1'), edge('top', 'mid2'), edge('mid1', 'shared'),
+                                      edge('mid2', 'shared'), edge('mid2', 't2', 'OLAP'),
+                                      edge('shared', 't1', 'OLAP')])
+    assert graph.base_tables('db', 'top') == {('db', 't1', 'OLAP'), ('db', 't2', 'OLAP')}
+    assert graph.base_tables('db', 'mid1') == {('db', 't1', 'OLAP')}
+    nested = graph.dependencies('db', 'top')['materialized_views']
+    assert [mv['name'] for mv in nested] == ['mid1', 'mid2']
+    assert nested[1]['dependencies']['base_tables'] == [{'database': 'db', 'name': 't1', 'type': 'OLAP'},
+                                                        {'database': 'db', 'name': 't2', 'type': 'OLAP'}]
+
+
+def test_refresh_order_puts_dependencies_first(doctor):
+    graph = doctor.MVDependencyGraph([edge('top', 'mid'), edge('mid', 'leaf'), edge('leaf', 't1', 'OLAP'),
+                                      edge('a', 'b'), edge('b', 'a')])
+    order = [name for _, name in graph.refresh_order()]
+    assert order[:3] == ['leaf', 'mid', 'top']
+    assert sorted(order[3:]) == ['a', 'b']
+
+
+def test_cycle_results_do_not_depend_on_call_order(doctor):
+    rows = [edge('a', 'b'), edge('b', 'a'), edge('a', 'ta', 'OLAP'), edge('b', 'tb', 'OLAP')]
+    fresh = doctor.MVDependencyGraph(rows)
+    expected_tables = fresh.base_tables('db', 'b')
+    expected_dependencies = doctor.MVDependencyGraph(rows).dependencies('db', 'b')
+
+    graph = doctor.MVDependencyGraph(rows)
+    graph.base_tables('db', 'a')
+    graph.dependencies('db', 'a')
+    assert graph.base_tables('db', 'b') == expected_tables == {('db', 'ta', 'OLAP'), ('db', 'tb', 'OLAP')}
+    assert graph.dependencies('db', 'b') == expected_dependencies
+    # Like the per-call walk: b -> a -> (b, cut)
+    assert expected_dependencies['materialized_views'][0]['dependencies']['materialized_views'][0]['dependencies'] == {}
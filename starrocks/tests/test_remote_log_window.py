@@ -0,0 +1,68 @@
+import gzip
+import shutil
+import subprocess
+import time
+from datetime import datetime
+
+import pytest
+
+pytestmark = pytest.mark.skipif(shutil.which('bash') is None, reason='needs bash and coreutils')
+
+TRACE = ['java.lang.NullPointerException: boom', '\tat com.starrocks.Foo.bar(Foo.java:42)']
+
+
+def run_window(doctor, log, since=None, checkpoint=None):
+    """Run the remote script locally; returns (output lines, checkpoint fields)"""
+    args = [log, 'fe', '.', '-', since.strftime('%Y%m%d%H%M%S') if since else '0', '99999999999999',
+            int(time.mktime(since.timetuple())) if since else 0]
+    inode, offset, node_time, head = checkpoint or (0, 0, 0, '-')
+    args += [inode, offset, node_time, '1', head]
+    result = subprocess.run(['bash', '-s', '--'] + [str(arg) for arg in args],
+                            input=doctor.REMOTE_LOG_WINDOW_SCRIPT.encode(),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    position = [line.split()[1:] for line in result.stderr.decode().splitlines() if line.startswith('CHECKPOINT')]
+    lines = [line for line in gzip.decompress(result.stdout).decode().splitlines() if not line.startswith('==>')]
+    return lines, position[0] if position else None
+
+
+def write(path, lines, mode='a'):
+    with open(path, mode) as f:
+        f.write(''.join(line + '\n' for line in lines))
+
+
+def test_continuation_lines_at_the_start_are_kept_without_a_window(doctor, tmp_path):
+    log = str(tmp_path / 'fe.warn.log')
+    write(log, TRACE + ['2024-03-15 12:00:05,000 WARN next'], 'w')
+    lines, _ = run_window(doctor, log)
+    assert lines == TRACE + ['2024-03-15 12:00:05,000 WARN next']
+
+
+def test_continuation_lines_after_a_checkpoint_are_kept(doctor, tmp_path):
+    log = str(tmp_path / 'fe.warn.log')
+    since = datetime(2024, 3, 15, 12, 0, 0)
+    write(log, ['2024-03-15 11:59:00,000 WARN before', '2024-03-15 12:00:01,000 WARN first'], 'w')
+    lines, checkpoint = run_window(doctor, log, since)
+    assert lines == ['2024-03-15 12:00:01,000 WARN first']
+
+    # The exception of the last line read is flushed after the checkpoint
+    write(log, TRACE + ['2024-03-15 12:00:02,000 WARN second'])
+    lines, _ = run_window(doctor, log, since, checkpoint)
+    assert lines == TRACE + ['2024-03-15 12:00:02,000 WARN second']
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_resume_after_rotation_reads_only_new_lines(doctor, tmp_path, compress):
+    log = str(tmp_path / 'fe.warn.log')
+    write(log, ['2024-03-15 12:00:01,000 WARN one', '2024-03-15 12:00:02,000 WARN two'], 'w')
+    lines, checkpoint = run_window(doctor, log)
+    assert len(lines) == 2
+
+    # Appended, rotated (and compressed) before the next run, then a new file started
+    write(log, ['2024-03-15 12:00:03,000 WARN three'])
+    shutil.move(log, log + '.1')
+    if compress:
+        subprocess.run(['gzip', log + '.1'], check=True)
+    time.sleep(0.01)
+    write(log, ['2024-03-15 12:00:04,000 WARN four'], 'w')
+    lines, _ = run_window(doctor, log, checkpoint=checkpoint)
+    assert lines == ['2024-03-15 12:00:03,000 WARN three', '2024-03-15 12:00:04,000 WARN four']
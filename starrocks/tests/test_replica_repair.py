@@ -0,0 +1,45 @@
+import json
+
+# fake_fe.py gives tablet indexes divisible by 97 a failed replica
+BAD_TABLETS = ['10000000', '10000097']
+TABLETS = [str(10000000 + i) for i in range(6)] + ['10000097']
+
+
+def read_journal_lines(path):
+    entries = []
+    with open(path) as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                pass
+    return entries
+
+
+def test_plan_picks_the_failed_replica(connect):
+    doctor = connect()
+    with doctor.pool.connection(doctor.host) as conn:
+        plans = {tablet_id: doctor.plan_replica_repair(conn, tablet_id) for tablet_id in TABLETS}
+    assert sorted(t for t, plan in plans.items() if plan['action'] == 'set_bad') == BAD_TABLETS
+    assert plans['10000001']['action'] == 'none'
+
+
+def test_interrupted_repair_resumes_from_journal(connect, tmp_path):
+    doctor = connect()
+    journal = str(tmp_path / 'journal.jsonl')
+    with open(journal, 'w') as f:
+        f.write(json.dumps({'tablet_id': '10000000', 'status': 'applied'}) + '\n')
+        f.write(json.dumps({'tablet_id': '10000001', 'status': 'no_action'}) + '\n')
+        f.write(json.dumps({'tablet_id': '10000002', 'status': 'failed'}) + '\n')
+        f.write('{"tablet_id": "10000003", "sta')  # cut short by the interruption
+
+    result = doctor.repair_replicas(iter(TABLETS), journal, rate_limit=0)
+    assert result['counts']['skipped'] == 2
+    assert result['counts']['applied'] == 1
+    assert result['counts']['no_action'] == 4
+
+    entries = read_journal_lines(journal)
+    assert [entry['tablet_id'] for entry in entries if entry.get('status') == 'applied'] == BAD_TABLETS
+
+    result = doctor.repair_replicas(iter(TABLETS), journal, rate_limit=0)
+    assert result['counts']['skipped'] == len(TABLETS)
@@ -0,0 +1,34 @@
+import pytest
+
+
+@pytest.fixture
+def store(doctor, tmp_path):
+    store = doctor.RunHistoryStore(str(tmp_path / 'history.db'))
+    yield store
+    store.close()
+
+
+def record(store, rows):
+    store.start_run('cluster', 'fe1', ['tablet'])
+    store.ingest('tablet_metadata', {'many_versions': rows})
+    store.finish_run()
+    return store.run_id
+
+
+def test_replicas_match_by_be_not_position(store):
+    run_a = record(store, [{'TABLET_ID': 1, 'BE_ID': 10, 'NUM_ROWSET': 5},
+                           {'TABLET_ID': 1, 'BE_ID': 11, 'NUM_ROWSET': 50}])
+    run_b = record(store, [{'TABLET_ID': 1, 'BE_ID': 11, 'NUM_ROWSET': 60},
+                           {'TABLET_ID': 1, 'BE_ID': 10, 'NUM_ROWSET': 6}])
+    growth = {row['be']: (row['versions_before'], row['versions_after'])
+              for row in store.diff(run_a, run_b)['version_growth']}
+    assert growth == {'10': (5, 6), '11': (50, 60)}
+
+
+def test_duplicate_keys_are_ambiguous(store):
+    run_a = record(store, [{'TABLET_ID': 2, 'NUM_ROWSET': 1}, {'TABLET_ID': 2, 'NUM_ROWSET': 2}])
+    run_b = record(store, [{'TABLET_ID': 2, 'NUM_ROWSET': 9}, {'TABLET_ID': 2, 'NUM_ROWSET': 1}])
+    result = store.diff(run_a, run_b)
+    assert result['version_growth'] == []
+    assert result['changes'] == {}
+    assert result['ambiguous_keys'] == {'tablet_metadata': {'run_a': 1, 'run_b': 1}}
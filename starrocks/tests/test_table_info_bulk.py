@@ -0,0 +1,18 @@
+def test_bulk_matches_per_table_queries(connect):
+    doctor = connect()
+    per_table = doctor.collect_table_info()
+    bulk = doctor.collect_table_info_bulk()
+    assert sorted(bulk) == sorted(per_table)
+    for db_name, tables in per_table.items():
+        assert sorted(bulk[db_name]) == sorted(tables)
+        for tbl_name, info in tables.items():
+            # The bulk scan also reports the tables_config properties
+            assert {key: value for key, value in bulk[db_name][tbl_name].items() if key != 'config'} == info
+            assert 'config' in bulk[db_name][tbl_name]
+
+
+def test_bulk_filters_by_table_name(connect):
+    doctor = connect()
+    rows = list(doctor.iter_table_info_bulk('tbl1'))
+    assert [(db_name, tbl_name) for db_name, tbl_name, _ in rows] == [('db1', 'tbl1')]
+    assert rows[0][2]['partitions']
@@ -0,0 +1,33 @@
+import pytest
+
+CHECKS = [
+    ('check_large_tablets', (1,), ('DB_NAME', 'TABLE_NAME', 'TABLET_ID', 'BE_ID', 'DATA_SIZE')),
+    ('check_tablets_with_many_versions', (10,), ('DB_NAME', 'TABLE_NAME', 'TABLET_ID', 'BE_ID', 'NUM_ROWSET')),
+    ('check_small_tablets', (500,), ('DB_NAME', 'TABLE_NAME', 'small_tablet_count', 'tablet_ids')),
+]
+
+
+def rows(result, keys):
+    return sorted(tuple(str(row[key]) for key in keys) for row in result)
+
+
+@pytest.mark.parametrize('check, args, keys', CHECKS)
+def test_snapshot_matches_sql_check(connect, check, args, keys):
+    snapshot_doctor = connect()
+    assert snapshot_doctor.get_tablet_snapshot() is not None
+    sql_doctor = connect()
+    # Behave as if the snapshot could not be taken, so the be_tablets joins run
+    sql_doctor._tablet_snapshot_loaded = True
+    sql_doctor._tablet_snapshot = None
+    snapshot_result = getattr(snapshot_doctor, check)(*args)
+    assert snapshot_result
+    assert rows(snapshot_result, keys) == rows(getattr(sql_doctor, check)(*args), keys)
+
+
+def test_streamed_checks_match_lists(connect):
+    doctor = connect()
+    streamed = {}
+    for row in doctor.iter_tablet_checks(size_gb=1, size_mb=500, version_threshold=10):
+        streamed.setdefault(row.pop('check'), []).append(row)
+    assert streamed['large_tablets'] == doctor.check_large_tablets(1)
+    assert streamed['tablets_with_many_versions'] == doctor.check_tablets_with_many_versions(10)